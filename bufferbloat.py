@@ -1,25 +1,51 @@
-from mininet.topo import Topo
-from mininet.net import Mininet
-from mininet.log import lg, info
-from mininet.util import dumpNodeConnections
-from mininet.cli import CLI
-from mininet.node import CPULimitedHost
-from mininet.link import TCLink
+try:
+    from mininet.net import Mininet
+    from mininet.log import lg, info
+    from mininet.util import dumpNodeConnections
+    from mininet.cli import CLI
+    from mininet.node import CPULimitedHost, OVSBridge
+    from mininet.link import TCLink
+except ImportError:
+    # Sem Mininet, só --backend netns
+    Mininet = None
+    from nsnet import dump_connections as dumpNodeConnections
 
 from subprocess import Popen
 from time import sleep, time
 from multiprocessing import Process
 from argparse import ArgumentParser
 
-from monitor import monitor_qlen
+from monitor import (monitor_qlen, monitor_qlens, monitor_devs_ng, monitor_tcp,
+                     port_names)
+from prober import start_ping
+from linktrace import play
+from trafficgen import PAIRS_PORT, generate, generate_pairs
+from telemetry import bus_path, open_reader
+from collector import collect
+from overhead import OverheadMeter, spawned, summarize
+from topology import (BBTopo, DumbbellTopo, ParkingLotTopo, StarTopo, Names,
+                      Aqm, AQMS, reconfigure, set_aqm, peer_intf,
+                      link_params)
+from nsnet import NsNet
+from readiness import (wait_tcp, wait_quic, wait_port_free, wait_drained,
+                       StartupLog)
+from fetchagent import FETCH_TIMEOUT, FetchAgent
+from pagetree import build_site
 
+import itertools
 import sys
 import os
-import math
+import signal
 
 # -----------------------------------------------------------------------------
 # Argumentos da linha de comando
 # -----------------------------------------------------------------------------
+def link_spec(spec):
+    "'10:20:50' -> (10.0, 20.0, 50); campos omitidos ficam None"
+    bw, delay, maxq = (spec.split(':') + [None, None])[:3]
+    return (float(bw), None if delay is None else float(delay),
+            None if maxq is None else int(maxq))
+
 parser = ArgumentParser(description="Bufferbloat tests with QUIC (aioquic) and complex workloads")
 parser.add_argument('--bw-host', '-B',
                     type=float,
@@ -45,274 +71,889 @@ parser.add_argument('--maxq',
                     type=int,
                     help="Max buffer size of network interface in packets",
                     default=100)
+parser.add_argument('--queues',
+                    nargs='+',
+                    type=int,
+                    help="Run once per --maxq value on one network, changing "
+                         "the bottleneck links in place between runs (the "
+                         "others keep their own); each run writes to "
+                         "{dir}-q<maxq>",
+                    default=None)
+parser.add_argument('--bw-nets',
+                    nargs='+',
+                    type=float,
+                    help="Like --queues, for the bottleneck bandwidth "
+                         "({dir}-bw<b>-...)",
+                    default=None)
+parser.add_argument('--delays',
+                    nargs='+',
+                    type=float,
+                    help="Like --queues, for the bottleneck link's delay "
+                         "({dir}-...d<d>-...); the other links keep "
+                         "--delay (or their --star-links values)",
+                    default=None)
+parser.add_argument('--aqm',
+                    choices=('none',) + AQMS,
+                    help="AQM on the bottleneck port instead of drop-tail "
+                         "(limit --maxq packets; cake has no packet limit)",
+                    default='none')
+parser.add_argument('--aqm-target',
+                    type=float,
+                    help="AQM target delay (ms); not for cake",
+                    default=None)
+parser.add_argument('--aqm-interval',
+                    type=float,
+                    help="AQM interval (ms): codel/fq_codel interval, PIE "
+                         "tupdate, cake rtt",
+                    default=None)
+parser.add_argument('--ecn',
+                    help="Mark instead of dropping (AQM ecn, tcp_ecn=1 on the hosts)",
+                    action="store_true",
+                    default=False)
+parser.add_argument('--bw-trace',
+                    help="Bandwidth trace for the bottleneck (CSV time_sec,"
+                         "rate_mbps[,delay_ms[,loss_pct]] or Mahimahi), "
+                         "replayed from the start of each run; the applied "
+                         "values go to {dir}/bw.txt",
+                    default=None)
+parser.add_argument('--trace-window',
+                    type=float,
+                    help="Seconds per rate step of a Mahimahi trace",
+                    default=0.1)
 parser.add_argument('--cong',
                     help="Congestion control algorithm to use (TCP fallback)",
                     default="reno")
+parser.add_argument('--ping-interval',
+                    type=float,
+                    help="Interval (sec) between RTT probes, down to 0.001",
+                    default=0.1)
+parser.add_argument('--collector',
+                    help="Measure queue, rate and RTT from one asyncio process "
+                         "into {dir}/telemetry.csv instead of q.txt/ping.txt",
+                    action="store_true",
+                    default=False)
+parser.add_argument('--topo',
+                    choices=['bb', 'dumbbell', 'parkinglot', 'star'],
+                    help="bb: h1 -- s0 -- h2; dumbbell: --pairs pairs across "
+                         "one bottleneck; parkinglot: --hops bottlenecks in a "
+                         "row, --cross pairs per hop; star: one link per host "
+                         "(--star-links), all sending to h2. The phases run "
+                         "h1 -> h2, the other pairs carry bulk TCP "
+                         "({dir}/pairs.csv)",
+                    default='bb')
+parser.add_argument('--pairs',
+                    type=int,
+                    help="Sender/receiver pairs of the dumbbell",
+                    default=2)
+parser.add_argument('--hops',
+                    type=int,
+                    help="Bottlenecks of the parking lot",
+                    default=2)
+parser.add_argument('--cross',
+                    type=int,
+                    help="Cross-traffic pairs per parking-lot hop",
+                    default=1)
+parser.add_argument('--star-links',
+                    nargs='+',
+                    type=link_spec,
+                    help="Star link of each host, h1 first, as "
+                         "bw[:delay[:maxq]] (defaults --bw-host, --delay, "
+                         "--maxq); h2's is the bottleneck, keep -b equal "
+                         "to its bw",
+                    default=None)
+parser.add_argument('--tcp-info',
+                    help="Sample the kernel's tcp_info (cwnd, srtt, pacing "
+                         "and delivery rate, in flight, retransmits) of every "
+                         "TCP flow on the sending hosts into {dir}/tcp_info.txt",
+                    action="store_true",
+                    default=False)
+parser.add_argument('--tcp-info-interval',
+                    type=float,
+                    help="Interval (sec) between tcp_info samples",
+                    default=0.01)
+parser.add_argument('--backend',
+                    choices=['mininet', 'netns'],
+                    help="Build the topology with Mininet/OVS, or directly "
+                         "from namespaces, veths and a bridge (nsnet.py)",
+                    default='mininet')
+parser.add_argument('--instance',
+                    type=int,
+                    help="Instance number for parallel runs: prefixes host, "
+                         "switch and interface names (see sweep.py)",
+                    default=None)
+parser.add_argument('--cpus',
+                    help="CPUs to pin this run and its hosts to, e.g. 2-3 or 2,5",
+                    default=None)
+parser.add_argument('--page',
+                    help="HTML page for the browsing phases; its objects are "
+                         "found by parsing it (missing ones are generated) "
+                         "and served from {dir}/site",
+                    default="index.html")
+parser.add_argument('--tcp-flows',
+                    type=int,
+                    help="Bulk TCP flows h1 -> h2 during the long-flow phase",
+                    default=0)
+parser.add_argument('--flow-congs',
+                    nargs='+',
+                    help="Congestion control per bulk TCP flow, cycled "
+                         "(default: --cong)",
+                    default=None)
+parser.add_argument('--quic-flows',
+                    type=int,
+                    help="Bulk QUIC flows h1 -> h2 during the long-flow phase",
+                    default=0)
+parser.add_argument('--fetch-interval',
+                    type=float,
+                    help="Interval (sec) between fetch samples during the long flow",
+                    default=0.5)
+parser.add_argument('--conns',
+                    type=int,
+                    help="Parallel HTTP/1.1 connections per TCP page load "
+                         "(QUIC multiplexes the page over one connection)",
+                    default=6)
 
 args = parser.parse_args()
+names = Names(args.instance)
+aqm = None
+if args.aqm != 'none':
+    aqm = Aqm(args.aqm, args.aqm_target, args.aqm_interval, args.ecn)
+
+# Overhead da própria medição: CPU do driver, tempo por fetch e processos
+# disparados (servidores, clientes, curl...). Ver overhead_report.txt.
+overhead_file = os.path.join(args.dir, 'overhead.txt')
+driver_meter = OverheadMeter('driver', overhead_file)
+
+# Tempo que cada servidor levou para ficar pronto. Ver startup.txt.
+startup = StartupLog(os.path.join(args.dir, 'startup.txt'))
+
+# Rodadas com amostras de fetch que falharam (o processo sai com erro)
+failed_runs = []
 
 # -----------------------------------------------------------------------------
-# Topologia
+# Topologia (topology.py) e isolamento entre rodadas paralelas
 # -----------------------------------------------------------------------------
-class BBTopo(Topo):
-    "Simple topology for bufferbloat experiment (2 hosts + 1 switch)."
-
-    def build(self, n=2):
-        # Hosts
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
-        # Switch
-        switch = self.addSwitch('s0')
-        # Links
-        self.addLink(
-            h1, switch,
-            bw=args.bw_host,
-            delay=f"{args.delay}ms",
-            max_queue_size=args.maxq
-        )
-        self.addLink(
-            h2, switch,
-            bw=args.bw_net,
-            delay=f"{args.delay}ms",
-            max_queue_size=args.maxq
-        )
+def parse_cpus(spec):
+    "'2-3,6' -> {2, 3, 6}"
+    cpus = set()
+    for part in spec.split(','):
+        lo, _, hi = part.partition('-')
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return cpus
+
+def check_isolation(net=None):
+    """
+    Verificações para rodadas em paralelo; devolve a lista de problemas.
+    Antes de subir a rede, nenhuma interface com os nomes desta instância
+    pode existir. Depois, cada host tem seu próprio namespace e o congestion
+    control pedido (que é por namespace: outras rodadas não interferem).
+    """
+    problems = []
+    if net is None:
+        nodes = set(names.switches) | set(h for p in names.pairs for h in p)
+        mine = tuple(n + '-' for n in nodes)
+        leftovers = [i for i in os.listdir('/sys/class/net') if i.startswith(mine)]
+        if leftovers:
+            problems.append(f"interfaces de outra rodada ainda existem: {leftovers}")
+        return problems
+    own = os.stat('/proc/self/ns/net').st_ino
+    seen = set()
+    for h in net.hosts:
+        ino = os.stat(f'/proc/{h.pid}/ns/net').st_ino
+        if ino == own or ino in seen:
+            problems.append(f"{h.name} não está num namespace de rede próprio")
+        seen.add(ino)
+        cong = h.cmd("sysctl -n net.ipv4.tcp_congestion_control").strip()
+        if cong != args.cong:
+            problems.append(f"{h.name} usa {cong}, esperado {args.cong}")
+    for port in names.bottlenecks:
+        if not os.path.exists(f'/sys/class/net/{port}'):
+            problems.append(f"gargalo {port} não encontrado")
+    return problems
+
+def make_topo():
+    "A topologia de --topo com os parâmetros atuais."
+    links = dict(bw_host=args.bw_host, bw_net=args.bw_net, delay=args.delay,
+                 maxq=args.maxq, instance=args.instance, cores=args.cpus)
+    if args.topo == 'dumbbell':
+        return DumbbellTopo(pairs=args.pairs, **links)
+    if args.topo == 'parkinglot':
+        return ParkingLotTopo(hops=args.hops, cross=args.cross, **links)
+    if args.topo == 'star':
+        star = args.star_links or [(args.bw_host, None, None),
+                                   (args.bw_net, None, None)]
+        star = [(bw, args.delay if d is None else d,
+                 args.maxq if q is None else q) for bw, d, q in star]
+        return StarTopo(links=star, instance=args.instance, cores=args.cpus)
+    return BBTopo(**links)
+
+def switch_ports(net):
+    "Todas as portas de todos os switches."
+    return [p for s in names.switches for p in port_names(net.get(s))]
 
 # -----------------------------------------------------------------------------
 # Monitor de fila
 # -----------------------------------------------------------------------------
-def start_qmon(iface, interval_sec=0.1, outfile="q.txt"):
+def start_qmon(iface, interval_sec=0.1, outfile="q.txt", stats_outfile=None,
+               bus=None):
     monitor = Process(target=monitor_qlen,
-                      args=(iface, interval_sec, outfile))
+                      args=(iface, interval_sec, outfile,
+                            stats_outfile, args.bw_net, bus))
     monitor.start()
     return monitor
 
+def start_qlens_mon(ifaces, interval_sec=0.1, outfile="qlens.txt", bus=None):
+    """Fila de várias portas (os gargalos) num processo só: time,qlen,iface."""
+    monitor = Process(target=monitor_qlens,
+                      args=(ifaces, interval_sec, outfile, None, args.bw_net,
+                            bus))
+    monitor.start()
+    return monitor
+
+def start_ratemon(ifaces, interval_sec=0.1, outfile="txrate.txt", bus=None):
+    """Mede a vazão tx/rx das interfaces lendo /sys (sem depender do bwm-ng)."""
+    monitor = Process(target=monitor_devs_ng,
+                      args=(outfile, interval_sec, ifaces, bus))
+    monitor.start()
+    return monitor
+
+def start_tcpmon(net, outfile="tcp_info.txt"):
+    """
+    Estado do TCP no kernel (tcp_info via sock_diag) de todos os fluxos dos
+    hosts que enviam: h1 (servidores das fases) e a origem de cada par.
+    """
+    senders = []
+    for src, _ in names.pairs:
+        if src not in senders:
+            senders.append(src)
+    hosts = [(h, net.get(h).pid) for h in senders]
+    monitor = Process(target=monitor_tcp,
+                      args=(outfile, hosts, args.tcp_info_interval))
+    monitor.start()
+    return monitor
+
+def start_bw_trace(net):
+    """
+    Reproduz --bw-trace no gargalo (tc change no htb de names.bottleneck e,
+    se o trace tiver atraso/perda, no netem que guarda o atraso do
+    gargalo), gravando cada ponto aplicado em {dir}/bw.txt.
+    """
+    if not args.bw_trace:
+        return None
+    # Valores do próprio link do gargalo (numa estrela, os de --star-links)
+    peer = peer_intf(net, names.bottleneck)
+    bw, delay, maxq = link_params(peer)
+    netem = {}
+    if aqm is not None:
+        # Com AQM o atraso do gargalo está no netem da outra ponta do
+        # seu link (ver topology.leaf_qdiscs)
+        netem = dict(netem_iface=peer.name, netem_netns=peer.node.pid,
+                     delay_offset=delay)
+    print(f"Reproduzindo {args.bw_trace} em {names.bottleneck}")
+    player = Process(target=play,
+                     args=(f'{args.dir}/bw.txt', args.bw_trace,
+                           names.bottleneck, bw, delay, maxq),
+                     kwargs=dict(window=args.trace_window, **netem))
+    player.start()
+    return player
+
+def watch_telemetry(buses, duration, every=1.0):
+    """
+    Espera `duration` segundos lendo ao vivo, pela memória compartilhada,
+    o último valor publicado pelos monitores (fila, vazão...).
+    """
+    readers = [r for r in (open_reader(b) for b in buses) if r is not None]
+    end = time() + duration
+    while time() < end:
+        sleep(min(every, max(end - time(), 0)))
+        latest = {}
+        for r in readers:
+            latest.update(r.latest())
+        if latest:
+            print("  ".join(f"{ch}={v:.0f}" for ch, (t, v) in sorted(latest.items())))
+    for r in readers:
+        r.close()
+
+def start_collector(net, outfile="telemetry.csv"):
+    """
+    Um único processo (asyncio) mede fila, vazão e RTT h1 -> h2 com o mesmo
+    relógio, numa série temporal só. Substitui qmon, ratemon e ping.
+    """
+    h1 = net.get(names.h1)
+    h2 = net.get(names.h2)
+    collector = Process(target=collect,
+                        args=(outfile,),
+                        kwargs=dict(qifaces=names.bottlenecks,
+                                    rate_mbps=args.bw_net,
+                                    rate_ifaces=names.bottlenecks,
+                                    rtt_dst=h2.IP(),
+                                    rtt_netns=h1.pid,
+                                    rtt_echo_netns=h2.pid))
+    collector.start()
+    return collector
+
 # -----------------------------------------------------------------------------
-# Ping para medir RTT
+# Prontidão dos servidores (no lugar de sleeps fixos)
 # -----------------------------------------------------------------------------
-def start_ping(net):
+def wait_server(net, name, port, proto='tcp', timeout=15.0):
     """
-    Dispara pings de h1 -> h2 a cada 0.1s, gravando no arquivo de saída.
+    Espera o servidor em h1 aceitar conexões vindas de h2 (connect TCP ou,
+    para QUIC, porta UDP aberta + handshake) e registra quanto tempo levou.
     """
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    ping_output = os.path.join(args.dir, 'ping.txt')
-    print(f"Iniciando ping: h1 -> h2, salvando em {ping_output}")
-    h1.popen(f"ping -i 0.1 -c 100 {h2.IP()} > {ping_output}", shell=True)
+    h1 = net.get(names.h1)
+    h2 = net.get(names.h2)
+    if proto == 'tcp':
+        t = wait_tcp(h1.IP(), port, netns=h2.pid, timeout=timeout)
+    else:
+        t = wait_quic(h1.IP(), port, h1.pid, netns=h2.pid, timeout=timeout)
+    print(f"{name} pronto em {t:.3f} s")
+    return startup.add(name, t)
+
+def stop_server(net, proc, port, proto='tcp', timeout=5.0):
+    """
+    Encerra o servidor e espera a porta ser liberada em h1, para a fase
+    seguinte poder usá-la. Se ele não soltar a porta, mata o grupo todo.
+    """
+    h1 = net.get(names.h1)
+    proc.terminate()
+    try:
+        wait_port_free(h1.pid, port, proto, timeout)
+    except TimeoutError:
+        os.killpg(proc.pid, signal.SIGKILL)
+        wait_port_free(h1.pid, port, proto, timeout)
+
+# -----------------------------------------------------------------------------
+# Agente de fetch em h2 (um processo só, sem iniciar Python por requisição)
+# -----------------------------------------------------------------------------
+fetch_agent = None
+
+def start_fetch_agent(net):
+    """
+    Sobe em h2 o agente de fetch (fetchagent.py), que atende todas as
+    requisições HTTP/1.1 e HTTP/3 do experimento e mede separadamente
+    connect, handshake, TTFB e transferência. Cada fetch vira uma linha
+    de {dir}/fetch.csv.
+    """
+    global fetch_agent
+    if fetch_agent is None:
+        h2 = net.get(names.h2)
+        spawned()
+        t0 = time()
+        fetch_agent = FetchAgent(h2, os.path.join(args.dir, 'fetch.csv'))
+        startup.add('fetch_agent', time() - t0)
+    return fetch_agent
+
+def start_fetch_sampler(net, duration):
+    """
+    Durante o fluxo longo, o agente busca index.html a cada
+    --fetch-interval segundos (sem esperar a busca anterior terminar), numa
+    conexão nova a cada vez. Cada amostra vira uma linha de
+    {dir}/fetch_samples.csv; devolve o id para esperar o fim.
+    """
+    h1 = net.get(names.h1)
+    fname = os.path.join(args.dir, 'fetch_samples.csv')
+    print(f"Amostrando fetch QUIC a cada {args.fetch_interval} s em {fname}")
+    return start_fetch_agent(net).sample('quic', h1.IP(), 4433, '/index.html',
+                                         fname, interval=args.fetch_interval,
+                                         duration=duration)
+
+def fetch_report():
+    "p50/p95/p99/max (com IC bootstrap) das amostras, em fetch_report.txt."
+    spawned()
+    Popen([sys.executable, 'fetch_stats.py',
+           '-f', os.path.join(args.dir, 'fetch_samples.csv'),
+           '-o', os.path.join(args.dir, 'fetch_report.txt')]).wait()
+
+def quic_report():
+    """
+    Séries do lado do servidor QUIC (cwnd, bytes em voo, RTT, perdas por
+    espaço de números de pacote) lidas em streaming dos qlogs de
+    {dir}/quic_server.log, em {dir}/quic_metrics.txt, quic_losses.txt e
+    quic_spaces.txt (qlog_stats.py), no mesmo relógio de q.txt.
+    """
+    qlog_dir = os.path.join(args.dir, 'quic_server.log')
+    if not os.path.isdir(qlog_dir):
+        return
+    spawned()
+    Popen([sys.executable, 'qlog_stats.py', '-f', qlog_dir,
+           '-d', args.dir]).wait()
+
+# -----------------------------------------------------------------------------
+# Página da navegação: árvore de dependências (pagetree.py)
+# -----------------------------------------------------------------------------
+site_dir = os.path.join(args.dir, 'site')
+page_tree = None
+
+def prepare_site():
+    """
+    Lê a página de --page (HTML e CSS), monta a árvore de objetos e grava
+    em {dir}/site tudo que os servidores vão servir, gerando com tamanhos
+    realistas os objetos que não existem localmente.
+    """
+    global page_tree
+    page_tree = build_site(args.page, site_dir)
+    depth = max(page_tree.depth(p) for p in page_tree.paths())
+    print(f"Página {args.page}: {len(page_tree.paths())} objetos, "
+          f"{page_tree.size() / 1e3:.0f} kB, profundidade {depth}")
+    return page_tree
+
+def load_page(net, proto, port, tree, label=''):
+    """
+    Carrega a página como um navegador: cada objeto sai assim que o
+    documento que o referencia chega, vários ao mesmo tempo; em TCP por
+    até --conns conexões HTTP/1.1 paralelas, em QUIC como streams de uma só
+    conexão. Imprime o tempo de carga da página e a cascata (waterfall),
+    gravados também em {dir}/pages.csv e {dir}/waterfall.csv.
+    """
+    h1 = net.get(names.h1)
+    driver_meter.begin()
+    page = start_fetch_agent(net).page(proto, h1.IP(), port, tree.paths(),
+                                       conns=args.conns, label=label,
+                                       parents=tree.parents())
+    driver_meter.end()
+    print(f"Página via {proto}: {page['plt_ms']:.1f} ms")
+    for obj in page['objects']:
+        if 'error' in obj:
+            print(f"  {obj['path']:<16s} falhou ({obj['error']})")
+        else:
+            print(f"  {obj['path']:<16s} {obj['start_ms']:8.1f} -> "
+                  f"{obj['end_ms']:8.1f} ms  {obj['bytes']} B")
+    return page
 
 # -----------------------------------------------------------------------------
 # Servidor TCP (HTTP) - Navegação Complexa (para TCP Reno/BBR)
 # -----------------------------------------------------------------------------
 def start_complex_tcp_server(net):
     """
-    Inicia um servidor HTTP simples (TCP) em h1 para servir múltiplos arquivos estáticos
-    no diretório './static'. Você pode alterar a porta se desejar.
+    Inicia o servidor HTTP/1.1 (TCP) em h1 para servir os objetos da
+    página (diretório {dir}/site, lido uma vez para a memória), além de
+    /bytes/<N> e /stream/<s> (webserve.py).
     """
-    h1 = net.get('h1')
-    server_cmd = "cd static && python3 -m http.server 8080"
+    h1 = net.get(names.h1)
+    server_cmd = f"python3 webserve.py --port 8080 --directory {site_dir}"
     print(f"Iniciando servidor TCP HTTP (porta 8080) em h1: {server_cmd}")
+    spawned()
     return h1.popen(server_cmd, shell=True)
 
 def start_complex_web_browsing_tcp(net):
     """
     Simula um cliente que 'navega' em h2, requisitando vários arquivos de h1 (TCP).
     """
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    server_ip = h1.IP()
-    
-    # Lista de arquivos que existem no diretório 'static'
-    resources = ["index.html", "image.jpg", "script.js", "video.mp4"]
-    
-    for res in resources:
-        cmd = f"curl -o /dev/null -s -w %{{time_total}} http://{server_ip}:8080/{res}"
-        print(f"Carregando {res} via TCP: {cmd}")
-        output = h2.cmd(cmd).strip()
-        print(f"Tempo para {res}: {output} s")
+    print(f"Carregando {args.page} via TCP ({args.conns} conexões)")
+    return load_page(net, 'tcp', 8080, page_tree, label='browse')
 
 # -----------------------------------------------------------------------------
 # Servidor QUIC (HTTP/3) - Navegação Complexa
 # -----------------------------------------------------------------------------
 def start_complex_quic_server(net):
     """
-    Inicia um servidor QUIC em h1, servindo a pasta 'static' via HTTP/3.
-    Requer aioquic instalado e arquivos cert.pem/key.pem.
+    Inicia um servidor QUIC em h1, servindo a página ({dir}/site) via HTTP/3
+    (webserve.py --quic). Requer aioquic instalado e arquivos cert.pem/key.pem.
     """
-    h1 = net.get('h1')
+    h1 = net.get(names.h1)
     server_ip = h1.IP()
     cert_path = "cert.pem"
     key_path = "key.pem"
     
     # Porta 4433 por default
     server_cmd = (
-        f"python -m aioquic.examples.http3_server "
+        f"python3 webserve.py --quic "
         f"--certificate {cert_path} "
         f"--private-key {key_path} "
         f"--host {server_ip} "
         f"--port 4433 "
-        f"--static-dir ./static "
+        f"--directory {site_dir} "
         f"--quic-log {args.dir}/quic_server.log"
     )
     print(f"Iniciando servidor QUIC (HTTP/3) em {server_ip}:4433 -> {server_cmd}")
+    spawned()
     return h1.popen(server_cmd, shell=True)
 
 def start_complex_web_browsing_quic(net):
     """
-    Simula um cliente 'navegador' em h2, requisitando vários arquivos (index, image, script, video)
-    do servidor QUIC (HTTP/3) em h1.
+    Simula um navegador em h2 carregando --page (por padrão index.html:
+    96 objetos com o próprio HTML, entre imagens, CSS, scripts, um iframe
+    e o ícone) do servidor QUIC (HTTP/3) em h1, pelo agente de fetch, como
+    streams de uma só conexão; veja load_page.
     """
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    server_ip = h1.IP()
-    
-    # Recursos disponíveis em 'static/'
-    resources = ["index.html", "image.jpg", "script.js", "video.mp4"]
-    
-    for res in resources:
-        cmd = (
-            f"python -m aioquic.examples.http3_client "
-            f"--connect {server_ip}:4433 "
-            f"https://{server_ip}:4433/{res} "
-            f"--output-file /dev/null "
-            f"--insecure "  # se for um cert autoassinado
-        )
-        print(f"Carregando {res} via QUIC: {cmd}")
-        start_t = time()
-        h2.cmd(cmd)  # executa a requisição
-        end_t = time()
-        elapsed = end_t - start_t
-        print(f"Tempo para {res}: {elapsed:.3f} s")
+    print(f"Carregando {args.page} via QUIC (streams multiplexados)")
+    return load_page(net, 'quic', 4433, page_tree, label='browse')
 
 # -----------------------------------------------------------------------------
 # Servidor QUIC (versão longa, substituindo iperf) - já existia no seu script
 # -----------------------------------------------------------------------------
 def start_quic_server(net):
     """
-    Servidor QUIC simples em h1 (para teste de fluxo longo).
+    Servidor QUIC em h1 para o fluxo longo (/stream, sintético) e para as
+    amostras de fetch da página ({dir}/site, servida da memória).
     """
-    h1 = net.get('h1')
+    h1 = net.get(names.h1)
     cert_path = "cert.pem"
     key_path = "key.pem"
     server_cmd = (
-        f"python -m aioquic.examples.http3_server "
+        f"python3 webserve.py --quic "
         f"--certificate {cert_path} "
         f"--private-key {key_path} "
         f"--host {h1.IP()} "
         f"--port 4433 "
+        f"--directory {site_dir} "
         f"--quic-log {args.dir}/quic_server.log "
-        f"--output-dir . "
     )
     print(f"Iniciando servidor QUIC em h1: {server_cmd}")
+    spawned()
     proc = h1.popen(server_cmd, shell=True)
-    sleep(2)
+    wait_server(net, 'quic_server', 4433, proto='udp')
     return proc
 
 def start_quic_long_flow(net):
     """
-    Cliente QUIC em h2 para fluxo longo (baixar algo grande).
+    Fluxo longo QUIC: o agente de fetch em h2 baixa /stream/{time}, que o
+    servidor gera enquanto durar o experimento, numa conexão só dele.
+    Devolve o id para finish_quic_long_flow.
     """
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    client_cmd = (
-        f"python -m aioquic.examples.http3_client "
-        f"--connect {h1.IP()}:4433 "
-        f"https://{h1.IP()}:4433/largefile --output-file /dev/null "
-    )
-    print(f"Iniciando fluxo QUIC (long) em h2: {client_cmd}")
-    proc = h2.popen(client_cmd, shell=True)
-    return proc
+    h1 = net.get(names.h1)
+    path = f'/stream/{args.time}'
+    print(f"Iniciando fluxo QUIC (long) em h2: https://{h1.IP()}:4433{path}")
+    return start_fetch_agent(net).start('quic', h1.IP(), 4433, path,
+                                        reuse=False,
+                                        timeout=args.time + FETCH_TIMEOUT)
+
+def finish_quic_long_flow(rid):
+    """
+    Espera o fim do fluxo longo (uma linha "long" em {dir}/fetch.csv) e
+    mostra sua vazão; se falhou, a rodada entra em failed_runs.
+    """
+    res = fetch_agent.finish(rid, label='long')
+    if 'error' in res or not 200 <= res['status'] < 300:
+        print(f"ERRO: fluxo longo QUIC falhou em {args.dir}: "
+              f"{res.get('error') or res['status']}")
+        if args.dir not in failed_runs:
+            failed_runs.append(args.dir)
+        return
+    secs = res['transfer_ms'] / 1000 or 1.0
+    print(f"Fluxo longo QUIC: {res['bytes']} bytes, "
+          f"{res['bytes'] * 8 / secs / 1e6:.3f} Mb/s")
+
+# -----------------------------------------------------------------------------
+# Fluxos longos (gerador interno, no lugar do iperf)
+# -----------------------------------------------------------------------------
+def start_bulk_flows(net, duration):
+    """
+    --tcp-flows fluxos TCP (cada um com seu congestion control, de
+    --flow-congs) e --quic-flows fluxos QUIC de h1 para h2, por `duration`
+    segundos. O goodput de cada fluxo vai para {dir}/flows.csv a cada
+    segundo e a média para {dir}/flows.csv.summary.
+    """
+    if not args.tcp_flows and not args.quic_flows:
+        return None
+    h1 = net.get(names.h1)
+    h2 = net.get(names.h2)
+    print(f"Iniciando {args.tcp_flows} fluxos TCP e {args.quic_flows} QUIC h1 -> h2")
+    flows = Process(target=generate,
+                    args=(f'{args.dir}/flows.csv', h1.pid, h2.pid, h2.IP()),
+                    kwargs=dict(duration=duration, tcp_flows=args.tcp_flows,
+                                congs=args.flow_congs or [args.cong],
+                                quic_flows=args.quic_flows))
+    flows.start()
+    return flows
+
+def start_pair_flows(net, duration):
+    """
+    Um fluxo TCP de volume em cada par da topologia além de h1 -> h2 (os
+    concorrentes do dumbbell, o tráfego cruzado do parking lot...), por
+    `duration` segundos, com o goodput em {dir}/pairs.csv.
+    """
+    pairs = [(net.get(src).pid, net.get(dst).pid, net.get(dst).IP())
+             for src, dst in names.pairs[1:]]
+    if not pairs:
+        return None
+    print(f"Iniciando {len(pairs)} fluxos TCP entre os outros pares")
+    flows = Process(target=generate_pairs,
+                    args=(f'{args.dir}/pairs.csv', pairs),
+                    kwargs=dict(duration=duration,
+                                congs=args.flow_congs or [args.cong],
+                                tcp_port=PAIRS_PORT))
+    flows.start()
+    return flows
+
+# -----------------------------------------------------------------------------
+# Rodadas numa rede só (--queues / --bw-nets / --delays)
+# -----------------------------------------------------------------------------
+def run_configs():
+    """
+    (bw_net, delay, maxq, diretório) de cada rodada. Sem --queues,
+    --bw-nets nem --delays é uma rodada só, em {dir}; com eles, uma por
+    combinação, em {dir}-[bw<b>-][d<d>-]q<maxq> (bb-q20, bb-q100... com
+    --dir bb, como antes).
+    """
+    if not (args.queues or args.bw_nets or args.delays):
+        return [(args.bw_net, args.delay, args.maxq, args.dir)]
+    runs = []
+    for bw, delay, q in itertools.product(args.bw_nets or [args.bw_net],
+                                          args.delays or [args.delay],
+                                          args.queues or [args.maxq]):
+        name = f'q{q}'
+        if args.delays:
+            name = f'd{delay:g}-' + name
+        if args.bw_nets:
+            name = f'bw{bw:g}-' + name
+        runs.append((bw, delay, q, f'{os.path.normpath(args.dir)}-{name}'))
+    return runs
+
+def begin_run(run_dir):
+    """
+    Aponta as saídas (e o estado por rodada: overhead, start-up, agente
+    de fetch) para run_dir.
+    """
+    global overhead_file, driver_meter, startup, fetch_agent
+    args.dir = run_dir
+    os.makedirs(run_dir, exist_ok=True)
+    overhead_file = os.path.join(run_dir, 'overhead.txt')
+    if os.path.exists(overhead_file):
+        os.unlink(overhead_file)
+    driver_meter = OverheadMeter('driver', overhead_file)
+    startup = StartupLog(os.path.join(run_dir, 'startup.txt'))
+    fetch_agent = None
+
+def configure_bottleneck(net, bw_net, delay, maxq):
+    """
+    Reconfigura a rede já de pé para a próxima rodada (tc change, sem
+    recriar os links) e espera as filas das portas do switch esvaziarem.
+    """
+    args.bw_net, args.delay, args.maxq = bw_net, delay, maxq
+    t0 = time()
+    reconfigure(net, names, bw_net, delay, maxq, aqm)
+    t = time() - t0
+    t += wait_drained(switch_ports(net))
+    print(f"Gargalo: {bw_net} Mb/s, {delay} ms, {maxq} pacotes "
+          f"(reconfigurado em {t:.3f} s)")
+    startup.add('reconfigure', t)
 
 # -----------------------------------------------------------------------------
 # Função principal do experimento
 # -----------------------------------------------------------------------------
-def bufferbloat_quic():
-    print(args)
-    if not os.path.exists(args.dir):
-        os.makedirs(args.dir)
+def build_net():
+    """
+    Sobe a topologia uma vez (sysctl, --topo, isolamento, pingAll), com
+    Mininet ou com --backend netns; as rodadas seguintes só a reconfiguram.
+    Com 50+ hosts prefira netns: o Mininet cria e configura um link por vez.
+    """
+    global names
+    topo = make_topo()
+    names = topo.names
+
+    # Fixa esta rodada nas CPUs pedidas (os hosts vão para o mesmo cpuset)
+    if args.cpus:
+        os.sched_setaffinity(0, parse_cpus(args.cpus))
 
     # Ajusta congestion control do TCP no SO (vale se estivermos testando TCP).
-    os.system(f"sysctl -w net.ipv4.tcp_congestion_control={args.cong}")
+    # Em paralelo não mexemos no namespace raiz: só nos hosts, logo abaixo.
+    if args.instance is None:
+        spawned()
+        os.system(f"sysctl -w net.ipv4.tcp_congestion_control={args.cong}")
+    else:
+        problems = check_isolation()
+        if problems:
+            sys.exit("Isolamento: " + "; ".join(problems))
 
     # Constrói e inicia a topologia
-    topo = BBTopo()
-    net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
+    t0 = time()
+    if args.backend == 'netns':
+        # Sem OVS nem controlador: namespaces, veths e uma bridge
+        net = NsNet(topo)
+    elif Mininet is None:
+        sys.exit("Mininet não está instalado: use --backend netns")
+    elif args.instance is None:
+        net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
+    else:
+        # Sem controlador: várias instâncias não podem disputar a porta 6653
+        net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink,
+                      switch=OVSBridge, controller=None)
     net.start()
+    print(f"Rede ({args.topo}, {args.backend}): {len(net.hosts)} hosts, "
+          f"{len(net.links)} links em {time() - t0:.3f} s")
+    for h in net.hosts:
+        h.cmd(f"sysctl -w net.ipv4.tcp_congestion_control={args.cong}")
+        if args.ecn:
+            h.cmd("sysctl -w net.ipv4.tcp_ecn=1")
+    # AQM no gargalo no lugar do drop-tail (netem) do TCLink
+    if aqm is not None:
+        set_aqm(net, names, aqm)
+        print(f"AQM em {', '.join(names.bottlenecks)}: {args.aqm}")
+    if args.instance is not None:
+        problems = check_isolation(net)
+        if problems:
+            net.stop()
+            sys.exit("Isolamento: " + "; ".join(problems))
 
     # Dump das conexões e teste de ping inicial
     dumpNodeConnections(net.hosts)
     net.pingAll()
+    return net
 
-    # Inicia monitor de fila na interface do gargalo (verifique se é s0-eth2 ou s0-eth1)
-    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt')
+def run_phases(net):
+    """As três fases de uma rodada, com as saídas em {dir}."""
+    # Inicia monitor de fila na interface do gargalo (names.bottleneck; na
+    # BBTopo, s0-eth2)
+    if args.collector:
+        monitors = [start_collector(net, outfile=f'{args.dir}/telemetry.csv')]
+        buses = []
+    elif len(names.bottlenecks) > 1:
+        # Vários gargalos: todos num monitor só, em {dir}/qlens.txt
+        qbus = bus_path(f'bb-{os.getpid()}-q')
+        rbus = bus_path(f'bb-{os.getpid()}-rate')
+        monitors = [
+            start_qmon(iface=names.bottleneck, outfile=f'{args.dir}/q.txt',
+                       stats_outfile=f'{args.dir}/qdisc.txt'),
+            start_qlens_mon(names.bottlenecks, outfile=f'{args.dir}/qlens.txt',
+                            bus=qbus),
+            start_ratemon(ifaces=names.bottlenecks,
+                          outfile=f'{args.dir}/txrate.txt', bus=rbus),
+        ]
+        buses = [qbus, rbus]
+    else:
+        qbus = bus_path(f'bb-{os.getpid()}-q')
+        rbus = bus_path(f'bb-{os.getpid()}-rate')
+        monitors = [
+            start_qmon(iface=names.bottleneck, outfile=f'{args.dir}/q.txt',
+                       stats_outfile=f'{args.dir}/qdisc.txt', bus=qbus),
+            start_ratemon(ifaces=[names.bottleneck], outfile=f'{args.dir}/txrate.txt',
+                          bus=rbus),
+        ]
+        buses = [qbus, rbus]
+    if args.tcp_info:
+        monitors.append(start_tcpmon(net, outfile=f'{args.dir}/tcp_info.txt'))
+    # Banda variável no gargalo, no mesmo relógio que q.txt
+    trace_proc = start_bw_trace(net)
 
     # ---------------------------
     # Exemplo de experimento:
     # 1) Workload: Navegação Complexa em TCP
     # ---------------------------
+    # O agente de fetch sobe antes das fases: sua partida fica fora das medidas
+    start_fetch_agent(net)
+
     print("\n=== [Fase 1] Navegação Complexa em TCP ===")
     tcp_server_proc = start_complex_tcp_server(net)
-    sleep(2)  # dá tempo de iniciar
-    start_ping(net)  # para medir RTT durante a navegação
+    wait_server(net, 'tcp_server', 8080)
+    # RTT h1 -> h2 até o fim da rodada (com --collector, o coletor já mede)
+    ping_proc = None
+    if not args.collector:
+        print(f"Iniciando ping: h1 -> h2, salvando em {args.dir}/ping.txt")
+        ping_proc = start_ping(net, args.dir, args.ping_interval,
+                               src=names.h1, dst=names.h2)
     start_complex_web_browsing_tcp(net)
-    tcp_server_proc.terminate()
-    sleep(2)
+    stop_server(net, tcp_server_proc, 8080)
 
     # ---------------------------
     # 2) Workload: Navegação Complexa em QUIC
     # ---------------------------
     print("\n=== [Fase 2] Navegação Complexa em QUIC ===")
     quic_server_proc_complex = start_complex_quic_server(net)
-    sleep(2)  # tempo para iniciar
-    start_ping(net)  # outro ping, ou pode manter o anterior
+    wait_server(net, 'quic_server_complex', 4433, proto='udp')
     start_complex_web_browsing_quic(net)
-    quic_server_proc_complex.terminate()
-    sleep(2)
+    # Tempo para o servidor gravar os qlogs das conexões ainda abertas
+    stop_server(net, quic_server_proc_complex, 4433, proto='udp',
+                timeout=30.0)
 
     # ---------------------------
     # 3) Workload: Fluxo Longo QUIC (opcional)
     # ---------------------------
     print("\n=== [Fase 3] Fluxo Longo QUIC (substituindo iperf) ===")
     quic_server_proc = start_quic_server(net)
-    quic_long_flow_proc = start_quic_long_flow(net)
-    start_ping(net)
+    quic_long_flow = start_quic_long_flow(net)
+    bulk_proc = start_bulk_flows(net, args.time)
+    pairs_proc = start_pair_flows(net, args.time)
     
-    # Mede tempo de fetch (equivalente ao "curl") usando QUIC
-    # Baixar 'index.html' 3 vezes de h1 -> h2
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    fetch_times = []
-    for i in range(3):
-        cmd = (
-            f"python -m aioquic.examples.http3_client "
-            f"--connect {h1.IP()}:4433 "
-            f"https://{h1.IP()}:4433/index.html "
-            f"--output-file /dev/null "
-            f"--insecure "
-        )
-        print(f"Teste de fetch QUIC {i+1} -> {cmd}")
-        start_t = time()
-        h2.cmd(cmd)
-        end_t = time()
-        fetch_time = end_t - start_t
-        fetch_times.append(fetch_time)
-        print(f"[Fetch {i+1}] Tempo: {fetch_time:.4f} s")
-        sleep(2)
-
-    avg_fetch_time = sum(fetch_times) / len(fetch_times)
-    variance = sum((x - avg_fetch_time) ** 2 for x in fetch_times) / len(fetch_times)
-    stddev_fetch_time = math.sqrt(variance)
-    print(f"Average page fetch time (QUIC): {avg_fetch_time:.2f} s")
-    print(f"Standard deviation: {stddev_fetch_time:.2f} s")
-
-    # Espera o tempo total do experimento
-    sleep(args.time)
+    # Mede o tempo de fetch (equivalente ao "curl") usando QUIC durante
+    # todo o fluxo longo, para ter a cauda da distribuição e não só a média
+    sampler = start_fetch_sampler(net, args.time)
+
+    # Espera o tempo total do experimento, acompanhando fila e vazão ao vivo
+    watch_telemetry(buses, args.time)
+    done = fetch_agent.wait(sampler)
+    print(f"{done['samples']} amostras de fetch, {done['errors']} falharam")
+    if done['errors']:
+        # Erros (e respostas não-2xx) ficam fora das estatísticas de cauda:
+        # a rodada não vale, mas a rede ainda precisa ser desmontada
+        print(f"ERRO: {done['errors']} amostras de fetch falharam em {args.dir}")
+        failed_runs.append(args.dir)
+    finish_quic_long_flow(quic_long_flow)
 
     # Encerra processos de monitor e servidores
-    qmon.terminate()
-    quic_long_flow_proc.terminate()
-    quic_server_proc.terminate()
+    if trace_proc is not None:
+        trace_proc.terminate()
+        trace_proc.join()
+    for m in monitors:
+        m.terminate()
+    if ping_proc is not None:
+        ping_proc.terminate()
+        ping_proc.join()
+    for m in monitors:
+        m.join()
+    for b in buses:
+        if os.path.exists(b):
+            os.unlink(b)
+    if bulk_proc is not None:
+        bulk_proc.join(timeout=5)
+        bulk_proc.terminate()
+        bulk_proc.join()
+        if os.path.exists(f'{args.dir}/flows.csv.summary'):
+            print(open(f'{args.dir}/flows.csv.summary').read())
+    if pairs_proc is not None:
+        pairs_proc.join(timeout=5)
+        pairs_proc.terminate()
+        pairs_proc.join()
+        summary = f'{args.dir}/pairs.csv.summary'
+        if os.path.exists(summary):
+            # Só o agregado: com dezenas de pares a tabela não cabe na tela
+            print("Outros pares:", open(summary).read().splitlines()[-1])
+    if fetch_agent is not None:
+        fetch_agent.close()
+    # SIGTERM e tempo para o servidor gravar os qlogs das conexões abertas;
+    # a próxima rodada (mesma rede) volta a usar a porta 4433
+    stop_server(net, quic_server_proc, 4433, proto='udp', timeout=30.0)
+
+    if args.instance is None:
+        Popen("pgrep -f 'webserve.py --quic' | xargs kill -9", shell=True).wait()
+    else:
+        # Em paralelo, o pgrep mataria os servidores das outras rodadas.
+        # Os popen do Mininet são líderes de sessão: mata só o grupo deles.
+        try:
+            os.killpg(quic_server_proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+def bufferbloat_quic():
+    print(args)
+    if not os.path.exists(args.dir):
+        os.makedirs(args.dir)
+    prepare_site()
+
+    runs = run_configs()
+    net = None
+    for bw_net, delay, maxq, run_dir in runs:
+        begin_run(run_dir)
+        if net is None:
+            args.bw_net, args.delay, args.maxq = bw_net, delay, maxq
+            t0 = time()
+            net = build_net()
+            startup.add('network', time() - t0)
+        else:
+            configure_bottleneck(net, bw_net, delay, maxq)
+        if len(runs) > 1:
+            print(f"\n##### Rodada {run_dir} #####")
+        run_phases(net)
+
+        startup.write()
+        fetch_report()
+        quic_report()
 
-    Popen("pgrep -f http3_server | xargs kill -9", shell=True).wait()
+        # Relatório de overhead da medição (monitores + driver)
+        driver_meter.close()
+        print(f"Overhead da medição em {summarize(overhead_file)}")
     net.stop()
+    if failed_runs:
+        sys.exit("Fetches falharam em: " + ", ".join(failed_runs))
 
 # -----------------------------------------------------------------------------
 # Execução
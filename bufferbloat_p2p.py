@@ -1,4 +1,3 @@
-from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.log import lg, info
 from mininet.util import dumpNodeConnections
@@ -13,7 +12,9 @@ from time import sleep, time
 from multiprocessing import Process
 from argparse import ArgumentParser
 
-from monitor import monitor_qlen
+from monitor import read_qlens, open_qdisc_sampler
+from samplewriter import handle_sigterm
+from topology import StarTopo
 
 import sys
 import os
@@ -21,45 +22,34 @@ import math
 import time
 import threading
 
-class BBTopo(Topo):
-    "Simple topology for bufferbloat experiment."
-
-    def build(self, n=2):
-        server = self.addHost('server', ip='10.0.0.1')
-        client2 = self.addHost('client1', ip='10.0.0.2')
-        client2 = self.addHost('client2', ip='10.0.0.3')
-
-        switch = self.addSwitch('s1')
-
-
 def qmon_logger(switch, filename, duration=60, interval=0.1):
     """
     Monitor queue lengths on the switch and log to a file
     every `interval` seconds, for `duration` seconds.
+    All ports are read in one pass per tick, from this single process.
     """
-    with open(filename, 'w') as f:
-        f.write("Time,QueueLength,Switch\n")
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            stats = monitor_qlen(switch)  # returns list of (iface, qlen)
-            for iface, qlen in stats:
-                timestamp = time.time() - start_time
-                f.write(f"{timestamp},{qlen},{switch.name}-{iface}\n")
-            time.sleep(interval)
+    handle_sigterm()  # terminate() still closes the file and the sampler
+    sampler = open_qdisc_sampler()
+    try:
+        with open(filename, 'w') as f:
+            f.write("Time,QueueLength,Switch\n")
+            start_time = time.time()
+            while time.time() - start_time < duration:
+                stats = read_qlens(switch, sampler)  # returns list of (iface, qlen)
+                for iface, qlen in stats:
+                    timestamp = time.time() - start_time
+                    f.write(f"{timestamp},{qlen},{switch.name}-{iface}\n")
+                time.sleep(interval)
+    finally:
+        sampler.close()
 
 
 def bufferbloat():
-    net = Mininet(link=TCLink)
-
-    server = net.addHost('server', ip='10.0.0.1')
-    client1 = net.addHost('client1', ip='10.0.0.2')
-    client2 = net.addHost('client2', ip='10.0.0.3')
-
-    switch = net.addSwitch('s1')
-
-    link1 = net.addLink(server,switch,bw=100,delay='120ms', max_queue_size=1000)
-    link2 = net.addLink(client1,switch,cls=TCLink,bw=50,delay='50ms', max_queue_size=1000)
-    link3 = net.addLink(client2,switch,bw=10,delay='30ms', max_queue_size=1000)
+    # server (h1, 10.0.0.1), client1 (h2, 10.0.0.2), client2 (h3, 10.0.0.3)
+    topo = StarTopo(links=[(100, 120, 1000), (50, 50, 1000), (10, 30, 1000)])
+    net = Mininet(topo=topo, link=TCLink)
+    server, client1, client2 = net.get('h1', 'h2', 'h3')
+    switch = net.get('s0')
 
     net.start()
 
@@ -12,6 +12,8 @@ from multiprocessing import Process
 from argparse import ArgumentParser
 
 from monitor import monitor_qlen
+from prober import start_ping
+from trafficgen import generate
 
 import sys
 import os
@@ -48,6 +50,10 @@ parser.add_argument('--maxq',
 parser.add_argument('--cong',
                     help="Congestion control algorithm to use (TCP fallback)",
                     default="reno")
+parser.add_argument('--ping-interval',
+                    type=float,
+                    help="Interval (sec) between RTT probes, down to 0.001",
+                    default=0.1)
 
 args = parser.parse_args()
 
@@ -80,25 +86,13 @@ class BBTopo(Topo):
 # -----------------------------------------------------------------------------
 # Monitor de fila
 # -----------------------------------------------------------------------------
-def start_qmon(iface, interval_sec=0.1, outfile="q.txt"):
+def start_qmon(iface, interval_sec=0.1, outfile="q.txt", stats_outfile=None):
     monitor = Process(target=monitor_qlen,
-                      args=(iface, interval_sec, outfile))
+                      args=(iface, interval_sec, outfile,
+                            stats_outfile, args.bw_net))
     monitor.start()
     return monitor
 
-# -----------------------------------------------------------------------------
-# Ping para medir RTT
-# -----------------------------------------------------------------------------
-def start_ping(net):
-    """
-    Dispara pings de h1 -> h2 a cada 0.1s, gravando no arquivo de saída.
-    """
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    ping_output = os.path.join(args.dir, 'ping.txt')
-    print(f"Iniciando ping: h1 -> h2, salvando em {ping_output}")
-    h1.popen(f"ping -i 0.1 -c 100 {h2.IP()} > {ping_output}", shell=True)
-
 # -----------------------------------------------------------------------------
 # Servidor TCP (HTTP) - Navegação Complexa (para TCP Reno/BBR)
 # -----------------------------------------------------------------------------
@@ -208,18 +202,17 @@ def start_quic_server(net):
 
 def start_quic_long_flow(net):
     """
-    Cliente QUIC em h2 para fluxo longo (baixar algo grande).
+    Um fluxo QUIC longo de h1 para h2 com o gerador interno, até ser
+    encerrado. Goodput a cada segundo em {dir}/flows.csv.
     """
     h1 = net.get('h1')
     h2 = net.get('h2')
-    client_cmd = (
-        f"python -m aioquic.examples.http3_client "
-        f"--connect {h1.IP()}:4433 "
-        f"https://{h1.IP()}:4433/largefile --output-file /dev/null "
-    )
-    print(f"Iniciando fluxo QUIC (long) em h2: {client_cmd}")
-    proc = h2.popen(client_cmd, shell=True)
-    return proc
+    print("Iniciando fluxo QUIC (long) h1 -> h2...")
+    flow = Process(target=generate,
+                   args=(f'{args.dir}/flows.csv', h1.pid, h2.pid, h2.IP()),
+                   kwargs=dict(tcp_flows=0, quic_flows=1))
+    flow.start()
+    return flow
 
 # -----------------------------------------------------------------------------
 # Função principal do experimento
@@ -242,7 +235,8 @@ def bufferbloat_quic():
     net.pingAll()
 
     # Inicia monitor de fila na interface do gargalo (verifique se é s0-eth2 ou s0-eth1)
-    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt')
+    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt',
+                      stats_outfile=f'{args.dir}/qdisc.txt')
 
     # ---------------------------
     # Exemplo de experimento:
@@ -251,7 +245,9 @@ def bufferbloat_quic():
     print("\n=== [Fase 1] Navegação Complexa em TCP ===")
     tcp_server_proc = start_complex_tcp_server(net)
     sleep(2)  # dá tempo de iniciar
-    start_ping(net)  # para medir RTT durante a navegação
+    # RTT h1 -> h2 até o fim do experimento
+    print(f"Iniciando ping: h1 -> h2, salvando em {args.dir}/ping.txt")
+    ping_proc = start_ping(net, args.dir, args.ping_interval)
     start_complex_web_browsing_tcp(net)
     tcp_server_proc.terminate()
     sleep(2)
@@ -262,7 +258,6 @@ def bufferbloat_quic():
     print("\n=== [Fase 2] Navegação Complexa em QUIC ===")
     quic_server_proc_complex = start_complex_quic_server(net)
     sleep(2)  # tempo para iniciar
-    start_ping(net)  # outro ping, ou pode manter o anterior
     start_complex_web_browsing_quic(net)
     quic_server_proc_complex.terminate()
     sleep(2)
@@ -273,7 +268,6 @@ def bufferbloat_quic():
     print("\n=== [Fase 3] Fluxo Longo QUIC (substituindo iperf) ===")
     quic_server_proc = start_quic_server(net)
     quic_long_flow_proc = start_quic_long_flow(net)
-    start_ping(net)
     
     # Mede tempo de fetch (equivalente ao "curl") usando QUIC
     # Baixar 'index.html' 3 vezes de h1 -> h2
@@ -308,7 +302,10 @@ def bufferbloat_quic():
 
     # Encerra processos de monitor e servidores
     qmon.terminate()
+    if ping_proc is not None:
+        ping_proc.terminate()
     quic_long_flow_proc.terminate()
+    quic_long_flow_proc.join()
     quic_server_proc.terminate()
 
     Popen("pgrep -f http3_server | xargs kill -9", shell=True).wait()
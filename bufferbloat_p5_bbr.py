@@ -17,7 +17,9 @@ from time import sleep, time
 from multiprocessing import Process
 from argparse import ArgumentParser
 
-from monitor import monitor_qlen
+from monitor import monitor_qlen, monitor_tcp
+from prober import start_ping
+from trafficgen import generate
 
 import sys
 import os
@@ -54,6 +56,10 @@ parser.add_argument('--maxq',
 parser.add_argument('--cong',
                     help="Congestion control algorithm to use (TCP fallback)",
                     default="bbr")
+parser.add_argument('--ping-interval',
+                    type=float,
+                    help="Interval (sec) between RTT probes, down to 0.001",
+                    default=0.1)
 
 args = parser.parse_args()
 
@@ -85,40 +91,45 @@ class BBTopo(Topo):
 # -----------------------------------------------------------------------------
 # Monitor de fila
 # -----------------------------------------------------------------------------
-def start_qmon(iface, interval_sec=0.01, outfile="q.txt"):
+def start_qmon(iface, interval_sec=0.01, outfile="q.txt", stats_outfile=None):
     monitor = Process(target=monitor_qlen,
-                      args=(iface, interval_sec, outfile))
+                      args=(iface, interval_sec, outfile,
+                            stats_outfile, args.bw_net))
     monitor.start()
     return monitor
 
 # -----------------------------------------------------------------------------
-# Ping para medir RTT
+# Estado do TCP no emissor (cwnd, srtt, pacing, retransmissões)
 # -----------------------------------------------------------------------------
-def start_ping(net):
+def start_tcpmon(net, interval_sec=0.01, outfile="tcp_info.txt"):
+    """
+    Amostra o tcp_info do kernel (via sock_diag, como o `ss -ti`) de todos
+    os fluxos de h1, o emissor do fluxo longo: é o que explica a fila que
+    o qmon vê.
+    """
     h1 = net.get('h1')
-    h2 = net.get('h2')
-    ping_output = os.path.join(args.dir, 'ping.txt')
-    print(f"Iniciando ping: h1 -> h2, salvando em {ping_output}")
-    h1.popen(f"ping -i 0.1 -c 100 {h2.IP()} > {ping_output}", shell=True)
+    monitor = Process(target=monitor_tcp,
+                      args=(outfile, [('h1', h1.pid)], interval_sec))
+    monitor.start()
+    return monitor
 
 # -----------------------------------------------------------------------------
-# Fluxo de longa duração em TCP (exemplo: iperf)
+# Fluxo de longa duração em TCP (gerador interno, no lugar do iperf)
 # -----------------------------------------------------------------------------
 def start_tcp_long_flow(net):
     """
-    Inicia iperf: h2 como servidor e h1 como cliente (fluxo longo).
+    Um fluxo TCP longo de h1 para h2 (--cong), pelo tempo do experimento.
+    Goodput a cada segundo em {dir}/flows.csv.
     """
     h1 = net.get('h1')
     h2 = net.get('h2')
 
-    # Servidor
-    print("Iniciando iperf servidor em h2...")
-    server = h2.popen("iperf -s -w 16m")
-
-    # Cliente
-    print("Iniciando iperf cliente em h1 (fluxo de 60s)...")
-    client = h1.popen(f"iperf -c {h2.IP()} -t 60") 
-    return server, client
+    print(f"Iniciando fluxo TCP h1 -> h2 ({args.time}s)...")
+    flow = Process(target=generate,
+                   args=(f'{args.dir}/flows.csv', h1.pid, h2.pid, h2.IP()),
+                   kwargs=dict(duration=args.time, congs=[args.cong]))
+    flow.start()
+    return flow
 
 # -----------------------------------------------------------------------------
 # Workload adicional: Navegação Web com Páginas Complexas
@@ -188,13 +199,16 @@ def bufferbloat_bbr():
     dumpNodeConnections(net.hosts)
     net.pingAll()
 
-    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt')
+    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt',
+                      stats_outfile=f'{args.dir}/qdisc.txt')
+    tcpmon = start_tcpmon(net, outfile=f'{args.dir}/tcp_info.txt')
 
     # Inicia iperf (TCP BBR)
-    server_proc, client_proc = start_tcp_long_flow(net)
+    flow_proc = start_tcp_long_flow(net)
 
     # Inicia ping
-    start_ping(net)
+    print(f"Iniciando ping: h1 -> h2, salvando em {args.dir}/ping.txt")
+    ping_proc = start_ping(net, args.dir, args.ping_interval)
 
     # (Opcional) Navegação complexa
     web_server_proc = start_complex_web_server(net)
@@ -203,10 +217,13 @@ def bufferbloat_bbr():
 
     sleep(args.time)
     qmon.terminate()
+    tcpmon.terminate()
+    if ping_proc is not None:
+        ping_proc.terminate()
 
     # Finaliza processos
-    client_proc.terminate()
-    server_proc.terminate()
+    flow_proc.terminate()
+    flow_proc.join()
     web_server_proc.terminate()
     web_client_proc.terminate()
     net.stop()
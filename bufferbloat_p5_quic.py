@@ -15,6 +15,8 @@ from multiprocessing import Process
 from argparse import ArgumentParser
 
 from monitor import monitor_qlen
+from prober import start_ping
+from trafficgen import generate
 
 import os
 import math
@@ -30,6 +32,7 @@ parser.add_argument('--dir', '-d', required=True)
 parser.add_argument('--time', '-t', type=int, default=10)
 parser.add_argument('--maxq', type=int, default=100)
 parser.add_argument('--cong', default="reno")  # Cong TCP não afeta QUIC, mas deixamos
+parser.add_argument('--ping-interval', type=float, default=0.1)  # pode ir até 0.001
 
 args = parser.parse_args()
 
@@ -47,21 +50,11 @@ class BBTopo(Topo):
 # -----------------------------------------------------------------------------
 # Monitor de fila
 # -----------------------------------------------------------------------------
-def start_qmon(iface, interval_sec=0.1, outfile="q.txt"):
-    monitor = Process(target=monitor_qlen, args=(iface, interval_sec, outfile))
+def start_qmon(iface, interval_sec=0.1, outfile="q.txt", stats_outfile=None):
+    monitor = Process(target=monitor_qlen, args=(iface, interval_sec, outfile, stats_outfile, args.bw_net))
     monitor.start()
     return monitor
 
-# -----------------------------------------------------------------------------
-# Ping
-# -----------------------------------------------------------------------------
-def start_ping(net):
-    h1 = net.get('h1')
-    h2 = net.get('h2')
-    ping_output = os.path.join(args.dir, 'ping.txt')
-    print(f"Iniciando ping: h1 -> h2, salvando em {ping_output}")
-    h1.popen(f"ping -i 0.1 -c 100 {h2.IP()} > {ping_output}", shell=True)
-
 # -----------------------------------------------------------------------------
 # Servidor QUIC
 # -----------------------------------------------------------------------------
@@ -98,17 +91,18 @@ def start_quic_server(net):
 # Fluxo longo QUIC
 # -----------------------------------------------------------------------------
 def start_quic_long_flow(net):
+    """
+    Um fluxo QUIC longo de h1 para h2 com o gerador interno, até ser
+    encerrado. Goodput a cada segundo em {dir}/flows.csv.
+    """
     h1 = net.get('h1')
     h2 = net.get('h2')
-
-    client_cmd = (
-        f"python -m aioquic.examples.http3_client "
-        f"--connect {h1.IP()}:4433 "
-        f"https://{h1.IP()}:4433/index.html "
-    )
-    print(f"Iniciando fluxo QUIC em h2: {client_cmd}")
-    proc = h2.popen(client_cmd, shell=True)
-    return proc
+    print("Iniciando fluxo QUIC (long) h1 -> h2...")
+    flow = Process(target=generate,
+                   args=(f'{args.dir}/flows.csv', h1.pid, h2.pid, h2.IP()),
+                   kwargs=dict(tcp_flows=0, quic_flows=1))
+    flow.start()
+    return flow
 
 # -----------------------------------------------------------------------------
 # Workload adicional: Navegação Complexa em QUIC
@@ -156,7 +150,8 @@ def bufferbloat_quic():
     net.pingAll()
 
     # Monitor
-    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt')
+    qmon = start_qmon(iface='s0-eth2', outfile=f'{args.dir}/q.txt',
+                      stats_outfile=f'{args.dir}/qdisc.txt')
 
     # Servidor QUIC
     quic_server_proc = start_quic_server(net)
@@ -165,7 +160,8 @@ def bufferbloat_quic():
     quic_long_flow_proc = start_quic_long_flow(net)
 
     # Ping
-    start_ping(net)
+    print(f"Iniciando ping: h1 -> h2, salvando em {args.dir}/ping.txt")
+    ping_proc = start_ping(net, args.dir, args.ping_interval)
 
     # Teste de “Navegação Complexa” em QUIC
     start_complex_web_navigation_quic(net)
@@ -197,8 +193,11 @@ def bufferbloat_quic():
 
     sleep(args.time)
     qmon.terminate()
+    if ping_proc is not None:
+        ping_proc.terminate()
 
     quic_long_flow_proc.terminate()
+    quic_long_flow_proc.join()
     quic_server_proc.terminate()
 
     # Mata possíveis processos remanescentes
@@ -0,0 +1,188 @@
+'''
+Unified asyncio telemetry collector.
+
+Queue sampling, RTT probing and interface-rate sampling run as tasks on
+one event loop, in one process, and share one clock. Everything goes to
+a single merged time series:
+
+    time,metric,key,value
+
+e.g. "1734752415.491450,qlen,s0-eth2,12" or "...,rtt_ms,10.0.0.2,20.4".
+Timestamps are wall-clock, derived from the loop's monotonic clock and a
+single wall/monotonic pair taken at start-up, so there is no skew between
+metrics.
+'''
+
+import asyncio
+from time import time
+
+from monitor import (open_qdisc_sampler, port_names, backlog_qdisc,
+                     DevStatsSampler, DevRates, QdiscCounters)
+from netlink import AQM_KINDS
+from prober import (open_prober, ProbeTracker, UdpEcho, UdpProber,
+                    UDP_ECHO_PORT)
+from samplewriter import SampleWriter, handle_sigterm
+from ticker import Ticker, periodic
+from overhead import OverheadMeter, overhead_path
+
+merged_header = 'time,metric,key,value\n'
+merged_fmt = '%f,%s,%s,%s\n'
+# UDP echo of add_rtt: off the port of prober.probe, which may run alongside
+RTT_ECHO_PORT = UDP_ECHO_PORT + 1
+
+
+class Collector(object):
+    """Add sources with add_*(), then run(duration)."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.out = SampleWriter(fname, merged_fmt, header=merged_header)
+        self.sources = []
+        self.tickers = []
+        self.readers = []
+        self.closers = []
+        self.meter = OverheadMeter('collector', overhead_path(fname))
+
+    def clock(self):
+        """Wall-clock time of now, on the loop's monotonic clock."""
+        return self.wall0 + (self.loop.time() - self.mono0)
+
+    def emit(self, t, metric, key, value):
+        self.out.append(t, metric, key, value)
+
+    def every(self, name, interval_sec, sample):
+        """Calls sample(t) every interval_sec on absolute deadlines."""
+        self.sources.append((name, interval_sec, sample))
+
+    def add_queue(self, target, interval_sec=0.01, rate_mbps=None):
+        """qlen per port; with rate_mbps also backlog, drops and qdelay
+        (and, on an AQM, its ECN marks and delay estimate)."""
+        ifaces = port_names(target)
+        sampler = open_qdisc_sampler()
+        counters = QdiscCounters(rate_mbps)
+        self.closers.append(sampler.close)
+
+        def sample(t):
+            for iface, qdiscs in sampler.sample_all(ifaces).items():
+                q = backlog_qdisc(qdiscs)
+                if q is None:
+                    continue
+                self.emit(t, 'qlen', iface, q.qlen)
+                if not rate_mbps:
+                    continue
+                for row in counters.rows(t, iface, [q]):
+                    self.emit(t, 'backlog_bytes', iface, q.backlog)
+                    self.emit(t, 'drops', iface, q.drops)
+                    self.emit(t, 'drop_rate_pps', iface, '%.3f' % row[9])
+                    self.emit(t, 'qdelay_ms', iface, '%.3f' % row[10])
+                    if q.kind in AQM_KINDS:
+                        self.emit(t, 'ecn_marks', iface, q.ecn_marks)
+                        self.emit(t, 'aqm_delay_ms', iface,
+                                  '%.3f' % q.aqm_delay_ms)
+        self.every('qlen', interval_sec, sample)
+
+    def add_rate(self, target, interval_sec=0.1):
+        """tx/rx bits per second per interface."""
+        sampler = DevStatsSampler(port_names(target))
+        rates = DevRates()
+        self.closers.append(sampler.close)
+
+        def sample(t):
+            for row in rates.rows(t, sampler.sample()):
+                self.emit(t, 'tx_bps', row[1], '%.0f' % row[2])
+                self.emit(t, 'rx_bps', row[1], '%.0f' % row[3])
+        self.every('rate', interval_sec, sample)
+
+    def add_rtt(self, dst, interval_sec=0.1, netns=None, timeout=2.0,
+                echo_netns=None, udp_port=RTT_ECHO_PORT):
+        """RTT probes to dst (ICMP, or UDP echo without privileges), from
+        netns (a Mininet host or pid) if given.
+
+        The UDP fallback needs echo_netns, the namespace of dst: its echo
+        responder is served from this same loop, as prober.probe does.
+        Replies are written as rtt_ms at their send time; probes with no
+        reply within timeout are written as a loss (value "lost").
+        """
+        prober = open_prober(dst, netns=netns, udp_port=udp_port)
+        self.closers.append(prober.close)
+        if isinstance(prober, UdpProber):
+            if echo_netns is None:
+                raise RuntimeError('no ICMP socket and no echo_netns for the '
+                                   'UDP echo of %s' % dst)
+            echo = UdpEcho(udp_port, echo_netns)
+            self.closers.append(echo.close)
+            self.readers.append((echo.fileno(), echo.serve))
+        tracker = ProbeTracker(timeout)
+
+        def on_readable():
+            r = prober.recv()
+            while r is not None:
+                row = tracker.reply(*r)
+                if row:
+                    self.emit(row[0], 'rtt_ms', dst, '%.3f' % row[2])
+                r = prober.recv()
+
+        def sample(t):
+            for row in tracker.expire(t):
+                self.emit(row[0], 'rtt_ms', dst, 'lost')
+            prober.send(tracker.sent(t))
+
+        self.readers.append((prober.fileno(), on_readable))
+        self.every('rtt', interval_sec, sample)
+
+    async def _periodic(self, name, interval_sec, sample):
+        ticker = Ticker(interval_sec, clock=self.loop.time)
+        self.tickers.append((name, ticker))
+        sample(self.clock())
+        await periodic(ticker, sample, self.clock, self.meter)
+
+    async def _run(self, duration):
+        self.loop = asyncio.get_running_loop()
+        self.mono0, self.wall0 = self.loop.time(), time()
+        for fd, cb in self.readers:
+            self.loop.add_reader(fd, cb)
+        tasks = [asyncio.ensure_future(self._periodic(*s)) for s in self.sources]
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            for task in tasks:
+                task.cancel()
+            for fd, _ in self.readers:
+                self.loop.remove_reader(fd)
+
+    def run(self, duration=None):
+        try:
+            asyncio.run(self._run(duration))
+        finally:
+            self.close()
+
+    def close(self):
+        self.out.close()
+        for close in self.closers:
+            close()
+        self.closers = []
+        self.meter.close()
+        with open(self.fname + '.sched', 'w') as f:
+            for name, ticker in self.tickers:
+                f.write(''.join('%s.%s=%s\n' % ((name,) + kv)
+                                for kv in ticker.report()))
+
+
+def collect(fname, duration=None, qifaces=None, rate_mbps=None,
+            rate_ifaces=None, rtt_dst=None, rtt_netns=None,
+            q_interval=0.01, rate_interval=0.1, rtt_interval=0.1,
+            rtt_echo_netns=None):
+    """Process target: one collector for queue, rate and RTT."""
+    handle_sigterm()
+    c = Collector(fname)
+    if qifaces:
+        c.add_queue(qifaces, q_interval, rate_mbps)
+    if rate_ifaces:
+        c.add_rate(rate_ifaces, rate_interval)
+    if rtt_dst:
+        c.add_rtt(rtt_dst, rtt_interval, netns=rtt_netns,
+                  echo_netns=rtt_echo_netns)
+    c.run(duration)
@@ -0,0 +1,64 @@
+'''
+Tail-latency report of periodic fetch samples (fetch_samples.csv)
+'''
+from helper import *
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--files', '-f',
+                    help="Fetch sample CSVs (fetchagent.py) to summarize",
+                    required=True,
+                    action="store",
+                    nargs='+')
+
+parser.add_argument('--metrics', '-m',
+                    help="Columns to summarize",
+                    nargs='+',
+                    default=['total_ms', 'ttfb_ms'])
+
+parser.add_argument('--resamples',
+                    help="Bootstrap resamples for the confidence intervals",
+                    type=int,
+                    default=1000)
+
+parser.add_argument('--out', '-o',
+                    help="Output text file (default: print only)",
+                    default=None)
+
+args = parser.parse_args()
+
+STATS = [('p50', pc50), ('p95', pc95), ('p99', pc99), ('max', max)]
+
+def read_samples(fname):
+    """Returns (header, rows) of a fetch CSV; failed fetches have status 0."""
+    lines = open(fname).readlines()
+    header = lines[0].strip().split(',')
+    rows = [dict(zip(header, l.strip().split(','))) for l in lines[1:]]
+    return header, rows
+
+def report(fname):
+    header, rows = read_samples(fname)
+    # Failed fetches (status 0) and non-2xx answers stay out of the stats
+    ok = [r for r in rows if 200 <= int(r['status']) < 300]
+    out = ["%s: %d samples, %d failed" % (fname, len(rows), len(rows) - len(ok))]
+    if len(rows) > 1:
+        t = sorted(float(r['time']) for r in rows)
+        out.append("  %.1f s, one every %.3f s" %
+                   (t[-1] - t[0], (t[-1] - t[0]) / (len(t) - 1)))
+    for metric in args.metrics:
+        values = [float(r[metric]) for r in ok]
+        if not values:
+            continue
+        cols = []
+        for name, stat in STATS:
+            lo, hi = bootstrap_ci(values, stat, n=args.resamples)
+            cols.append("%s %.1f [%.1f, %.1f]" % (name, stat(values), lo, hi))
+        out.append("  %-12s %s" % (metric, "  ".join(cols)))
+    return out
+
+lines = []
+for f in args.files:
+    lines += report(f)
+lines.append("(ms; 95% bootstrap confidence intervals in brackets)")
+print("\n".join(lines))
+if args.out:
+    open(args.out, 'w').write("\n".join(lines) + "\n")
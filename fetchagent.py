@@ -0,0 +1,660 @@
+'''
+Persistent fetch agent for HTTP/1.1 (TCP) and HTTP/3 (QUIC).
+
+The agent is one long-lived asyncio process on the client host, started
+once with h2.popen, so no fetch time includes interpreter start-up,
+imports or module loading. Commands come in on stdin and results go out
+on stdout, one JSON object per line:
+
+    {"id": 1, "proto": "quic", "host": "10.0.0.1", "port": 4433,
+     "path": "/index.html", "reuse": true}
+
+    {"id": 1, "time": 1734752415.49, "status": 200, "bytes": 93,
+     "reused": false, "connect_ms": 20.3, "handshake_ms": 20.9,
+     "ttfb_ms": 20.4, "transfer_ms": 0.1, "total_ms": 61.7}
+
+The phases are measured the same way for both protocols:
+
+    connect_ms    transport connect: TCP SYN -> SYN/ACK, or QUIC Initial
+                  -> first datagram from the server
+    handshake_ms  rest of the handshake (0 for plain HTTP over TCP)
+    ttfb_ms       request sent -> first response byte
+    transfer_ms   first -> last response byte
+
+Commands are served concurrently. With reuse, QUIC requests to a server
+share one connection (a stream each) and TCP requests take an idle
+keep-alive connection; a reused connection has no connect or handshake
+time, except for waiting on a connection that is still being opened.
+
+A page command loads several objects the way a browser does: over TCP
+with up to `conns` parallel HTTP/1.1 connections, over QUIC as
+multiplexed streams on one connection:
+
+    {"id": 2, "cmd": "page", "proto": "tcp", "host": "10.0.0.1",
+     "port": 8080, "paths": ["/index.html", "/image.jpg"], "conns": 6}
+
+    {"id": 2, "time": 1734752416.01, "plt_ms": 84.2, "objects": [
+     {"path": "/index.html", "start_ms": 0.0, "end_ms": 41.3, ...}, ...]}
+
+plt_ms goes from the first request to the last byte; every object has
+the per-request fields above plus its start and end relative to the page
+start (the waterfall). With "parents" ({path: parent path}, see
+pagetree.py) an object is requested only after the document that
+references it has arrived, as a browser discovers it. Unless "reuse" is
+set, a page starts on new connections and closes them when done.
+
+A sample command fetches one path every `interval` seconds for
+`duration` seconds, open loop (a slow fetch does not delay the next
+one), and the agent itself appends one fetch row per sample to `fname`;
+the only reply comes at the end:
+
+    {"id": 3, "cmd": "sample", "proto": "quic", "host": "10.0.0.1",
+     "port": 4433, "path": "/index.html", "interval": 0.5,
+     "duration": 60, "fname": "/tmp/run/fetch_samples.csv"}
+
+    {"id": 3, "done": true, "samples": 120, "errors": 0}
+
+FetchAgent is the driver side: it starts the agent on a Mininet host and
+writes one CSV row per fetch, and per page one summary row plus one
+waterfall row per object.
+'''
+
+from subprocess import PIPE
+from time import time
+import asyncio
+import json
+import os
+import socket
+import ssl
+import sys
+
+from samplewriter import SampleWriter
+
+try:
+    from aioquic.asyncio.protocol import QuicConnectionProtocol
+    from aioquic.h3.connection import H3_ALPN, H3Connection
+    from aioquic.h3.events import DataReceived, HeadersReceived
+    from aioquic.quic.configuration import QuicConfiguration
+    from aioquic.quic.connection import QuicConnection
+    from aioquic.quic.events import ConnectionTerminated
+    HAVE_AIOQUIC = True
+except ImportError:
+    # TCP only; H3Client below is never instantiated.
+    QuicConnectionProtocol = object
+    HAVE_AIOQUIC = False
+
+AGENT = os.path.abspath(__file__)
+
+CHUNK = 65536
+FETCH_TIMEOUT = 30.0
+
+fetch_header = ('time,label,proto,path,status,bytes,reused,connect_ms,'
+                'handshake_ms,ttfb_ms,transfer_ms,total_ms\n')
+fetch_fmt = '%f,%s,%s,%s,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%.3f\n'
+
+page_header = 'time,label,proto,objects,bytes,conns,errors,plt_ms\n'
+page_fmt = '%f,%s,%s,%d,%d,%d,%d,%.3f\n'
+
+waterfall_header = ('page_time,label,proto,path,parent,status,bytes,reused,'
+                    'start_ms,connect_ms,handshake_ms,ttfb_ms,transfer_ms,'
+                    'end_ms\n')
+waterfall_fmt = '%f,%s,%s,%s,%s,%d,%d,%d,%.3f,%.3f,%.3f,%.3f,%.3f,%.3f\n'
+
+PHASES = ('connect_ms', 'handshake_ms', 'ttfb_ms', 'transfer_ms', 'total_ms')
+BROWSER_CONNS = 6
+
+
+def fetch_row(label, req, res):
+    """fetch_fmt fields of one result (nan timings for errors)."""
+    if 'error' in res:
+        nan = float('nan')
+        return (res['time'], label, req['proto'], req['path'], 0, 0, 0,
+                nan, nan, nan, nan, nan)
+    return ((res['time'], label, req['proto'], req['path'], res['status'],
+             res['bytes'], res['reused']) + tuple(res[k] for k in PHASES))
+
+
+class Timing(object):
+    """Phase timestamps of one request, on the event loop's clock."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.wall = time()
+        self.t0 = loop.time()
+        self.connected = None
+        self.handshaken = None
+        self.sent = None
+        self.first = None
+        self.end = None
+        self.status = 0
+        self.nbytes = 0
+        self.reused = False
+
+    def now(self):
+        return self.loop.time()
+
+    def reuse(self):
+        self.reused = True
+        self.connected = self.handshaken = self.now()
+
+    def result(self):
+        ms = lambda a, b: (b - a) * 1000
+        return {'time': self.wall, 'status': self.status,
+                'bytes': self.nbytes, 'reused': self.reused,
+                'connect_ms': ms(self.t0, self.connected),
+                'handshake_ms': ms(self.connected, self.handshaken),
+                'ttfb_ms': ms(self.sent, self.first),
+                'transfer_ms': ms(self.first, self.end),
+                'total_ms': ms(self.t0, self.end)}
+
+
+# -----------------------------------------------------------------------------
+# HTTP/1.1
+# -----------------------------------------------------------------------------
+async def drain(reader, n=None):
+    """Reads and discards n bytes (until EOF if None); returns the count."""
+    got = 0
+    while n is None or got < n:
+        data = await reader.read(CHUNK if n is None else min(CHUNK, n - got))
+        if not data:
+            if n is None:
+                break
+            raise asyncio.IncompleteReadError(b'', n - got)
+        got += len(data)
+    return got
+
+async def drain_chunked(reader):
+    got = 0
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            return got
+        got += await drain(reader, size)
+        await reader.readexactly(2)
+
+async def http_get(reader, writer, host, port, path, timing):
+    """One GET on an open connection; returns True if it can be kept."""
+    writer.write(('GET %s HTTP/1.1\r\nHost: %s:%d\r\n\r\n' %
+                  (path, host, port)).encode())
+    timing.sent = timing.now()
+    first = await reader.readexactly(1)
+    timing.first = timing.now()
+    head = (first + await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    lines = head.split('\r\n')
+    version, status = lines[0].split()[:2]
+    headers = {}
+    for line in lines[1:]:
+        k, _, v = line.partition(':')
+        headers[k.strip().lower()] = v.strip().lower()
+    timing.status = int(status)
+    keep = (version == 'HTTP/1.1' and headers.get('connection') != 'close')
+    if 'chunked' in headers.get('transfer-encoding', ''):
+        timing.nbytes = await drain_chunked(reader)
+    elif 'content-length' in headers:
+        timing.nbytes = await drain(reader, int(headers['content-length']))
+    else:
+        timing.nbytes = await drain(reader)
+        keep = False
+    timing.end = timing.now()
+    return keep
+
+
+# -----------------------------------------------------------------------------
+# HTTP/3
+# -----------------------------------------------------------------------------
+class H3Client(QuicConnectionProtocol):
+    """HTTP/3 over one QUIC connection; get() runs one request per stream."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.h3 = H3Connection(self._quic)
+        self.streams = {}
+        self.first_rx = None
+        self.terminated = False
+
+    def datagram_received(self, data, addr):
+        if self.first_rx is None:
+            self.first_rx = self._loop.time()
+        super().datagram_received(data, addr)
+
+    def quic_event_received(self, event):
+        if isinstance(event, ConnectionTerminated):
+            self.terminated = True
+            for timing, done in self.streams.values():
+                if not done.done():
+                    done.set_exception(ConnectionError(
+                        event.reason_phrase or 'connection terminated'))
+            self.streams.clear()
+            return
+        for ev in self.h3.handle_event(event):
+            s = self.streams.get(getattr(ev, 'stream_id', None))
+            if s is None:
+                continue
+            timing, done = s
+            now = self._loop.time()
+            if timing.first is None:
+                timing.first = now
+            if isinstance(ev, HeadersReceived):
+                for k, v in ev.headers:
+                    if k == b':status':
+                        timing.status = int(v)
+            elif isinstance(ev, DataReceived):
+                timing.nbytes += len(ev.data)
+            if ev.stream_ended:
+                timing.end = now
+                del self.streams[ev.stream_id]
+                done.set_result(timing)
+
+    async def get(self, authority, path, timing):
+        sid = self._quic.get_next_available_stream_id()
+        done = self._loop.create_future()
+        self.streams[sid] = (timing, done)
+        self.h3.send_headers(sid, [(b':method', b'GET'),
+                                   (b':scheme', b'https'),
+                                   (b':authority', authority.encode()),
+                                   (b':path', path.encode()),
+                                   (b'user-agent', b'fetchagent')],
+                             end_stream=True)
+        self.transmit()
+        timing.sent = self._loop.time()
+        return await done
+
+async def open_quic(host, port):
+    """Connects and completes the handshake; returns (client, first_rx,
+    handshake_done) with the times on the loop's clock."""
+    loop = asyncio.get_running_loop()
+    config = QuicConfiguration(is_client=True, alpn_protocols=H3_ALPN,
+                               verify_mode=ssl.CERT_NONE, server_name=host)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    transport, client = await loop.create_datagram_endpoint(
+        lambda: H3Client(QuicConnection(configuration=config)), sock=sock)
+    client.udp = transport
+    client.connect((host, port))
+    await client.wait_connected()
+    return client, client.first_rx, loop.time()
+
+async def close_quic(client):
+    client.close()
+    await client.wait_closed()
+    client.udp.close()
+
+
+# -----------------------------------------------------------------------------
+# Agent
+# -----------------------------------------------------------------------------
+class Agent(object):
+    """Serves fetch commands from stdin until EOF."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.tcp_idle = {}
+        self.quic = {}
+        self.closing = set()
+
+    def reply(self, obj):
+        sys.stdout.write(json.dumps(obj) + '\n')
+        sys.stdout.flush()
+
+    async def fetch_tcp(self, req, timing, pool=None):
+        key = (req['host'], req['port'])
+        reuse = req.get('reuse', True)
+        idle = (self.tcp_idle if pool is None else pool).setdefault(key, [])
+        if reuse and idle:
+            reader, writer = idle.pop()
+            timing.reuse()
+        else:
+            reader, writer = await asyncio.open_connection(*key)
+            timing.connected = timing.handshaken = timing.now()
+        try:
+            keep = await http_get(reader, writer, key[0], key[1],
+                                  req['path'], timing)
+        except BaseException:
+            writer.close()
+            raise
+        if keep and reuse:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    async def fetch_quic(self, req, timing, pool=None):
+        if not HAVE_AIOQUIC:
+            raise RuntimeError('aioquic is not installed')
+        pool = self.quic if pool is None else pool
+        key = (req['host'], req['port'])
+        reuse = req.get('reuse', True)
+        pending = pool.get(key) if reuse else None
+        if pending is not None and pending.done() and (
+                pending.exception() or pending.result()[0].terminated):
+            pending = None
+        if pending is None:
+            pending = asyncio.ensure_future(open_quic(*key))
+            if reuse:
+                pool[key] = pending
+            try:
+                client, timing.connected, timing.handshaken = await pending
+            except BaseException:
+                if pool.get(key) is pending:
+                    del pool[key]
+                raise
+        else:
+            client = (await pending)[0]
+            timing.reuse()
+        await client.get('%s:%d' % key, req['path'], timing)
+        if not reuse:
+            self.background(close_quic(client))
+
+    def background(self, coro):
+        t = asyncio.ensure_future(coro)
+        self.closing.add(t)
+        t.add_done_callback(self.closing.discard)
+
+    async def run(self, req, timing, tcp_pool=None, quic_pool=None):
+        """Runs one fetch; returns its result or error dict."""
+        if req.get('proto') == 'quic':
+            fetch = self.fetch_quic(req, timing, quic_pool)
+        else:
+            fetch = self.fetch_tcp(req, timing, tcp_pool)
+        try:
+            await asyncio.wait_for(fetch, req.get('timeout', FETCH_TIMEOUT))
+            return timing.result()
+        except Exception as e:
+            return {'time': timing.wall,
+                    'error': '%s: %s' % (type(e).__name__, e)}
+
+    async def handle(self, req):
+        res = await self.run(req, Timing(self.loop))
+        res['id'] = req.get('id')
+        self.reply(res)
+
+    async def page(self, req):
+        """Loads req['paths'] concurrently: `conns` TCP connections taking
+        objects in order, or every object at once as QUIC streams. An
+        object with an entry in req['parents'] only starts once its parent
+        has arrived; if the parent failed, it is not loaded at all.
+        Repeated paths are loaded once, and a parent that is not among
+        the paths (or a cycle of parents) is ignored."""
+        start = self.loop.time()
+        wall = time()
+        if req.get('reuse'):
+            tcp_pool = quic_pool = None
+        else:
+            tcp_pool, quic_pool = {}, {}
+        # The page completes when every path has a result: each must be
+        # listed once and reachable from a root
+        paths = list(dict.fromkeys(req['paths']))
+        parents = dict((p, q) for p, q in (req.get('parents') or {}).items()
+                       if p in paths and q in paths and q != p)
+        while True:
+            reached = set()
+            todo = [p for p in paths if p not in parents]
+            while todo:
+                p = todo.pop()
+                reached.add(p)
+                todo += [c for c, q in parents.items() if q == p]
+            cut = [p for p in paths if p not in reached]
+            if not cut:
+                break
+            del parents[cut[0]]
+        children = {}
+        for path in paths:
+            children.setdefault(parents.get(path), []).append(path)
+        ready = asyncio.Queue()
+        for path in children.get(None, []):
+            ready.put_nowait(path)
+        objects = {}
+        if req.get('proto') == 'quic':
+            conns = len(paths)
+        else:
+            conns = min(req.get('conns', BROWSER_CONNS), len(paths))
+
+        def finish(path, res):
+            objects[path] = res
+            res['path'] = path
+            res['parent'] = parents.get(path)
+            for child in children.get(path, []):
+                if 'error' in res:
+                    finish(child, {'time': res['time'],
+                                   'start_ms': res['end_ms'],
+                                   'end_ms': res['end_ms'],
+                                   'error': 'parent %s failed' % path})
+                else:
+                    ready.put_nowait(child)
+            if len(objects) == len(paths):
+                for _ in range(conns):
+                    ready.put_nowait(None)
+
+        async def worker():
+            while True:
+                path = await ready.get()
+                if path is None:
+                    return
+                timing = Timing(self.loop)
+                res = await self.run(dict(req, path=path, reuse=True), timing,
+                                     tcp_pool, quic_pool)
+                res['start_ms'] = (timing.t0 - start) * 1000
+                res['end_ms'] = (self.loop.time() - start) * 1000
+                finish(path, res)
+
+        await asyncio.gather(*[worker() for _ in range(conns)])
+        plt = (self.loop.time() - start) * 1000
+        if tcp_pool is not None:
+            await self.close(tcp_pool, quic_pool)
+        self.reply({'id': req.get('id'), 'time': wall, 'plt_ms': plt,
+                    'objects': [objects[p] for p in paths]})
+
+    async def sample(self, req):
+        """Fetches req['path'] every req['interval'] s on absolute
+        deadlines until req['duration'] s have passed."""
+        interval = req['interval']
+        end = self.loop.time() + req['duration']
+        fetches = set()
+        errors = []
+
+        async def one():
+            res = await self.run(req, Timing(self.loop))
+            if 'error' in res:
+                errors.append(res['error'])
+            elif not 200 <= res['status'] < 300:
+                errors.append('status %d' % res['status'])
+            out.append(*fetch_row('sample', req, res))
+
+        n = 0
+        deadline = self.loop.time()
+        with SampleWriter(req['fname'], fetch_fmt, header=fetch_header,
+                          capacity=256) as out:
+            try:
+                while deadline < end:
+                    t = asyncio.ensure_future(one())
+                    fetches.add(t)
+                    t.add_done_callback(fetches.discard)
+                    n += 1
+                    deadline += interval
+                    await asyncio.sleep(max(deadline - self.loop.time(), 0))
+                if fetches:
+                    await asyncio.wait(fetches)
+            finally:
+                for t in fetches:
+                    t.cancel()
+        self.reply({'id': req.get('id'), 'done': True, 'samples': n,
+                    'errors': len(errors)})
+
+    async def close(self, tcp_pool=None, quic_pool=None):
+        """Closes the pooled connections (the agent's own by default)."""
+        tcp_pool = self.tcp_idle if tcp_pool is None else tcp_pool
+        quic_pool = self.quic if quic_pool is None else quic_pool
+        for idle in tcp_pool.values():
+            for reader, writer in idle:
+                writer.close()
+        tcp_pool.clear()
+        for pending in quic_pool.values():
+            if pending.done() and not pending.exception():
+                self.background(close_quic(pending.result()[0]))
+        quic_pool.clear()
+        if self.closing:
+            await asyncio.wait(self.closing, timeout=2.0)
+
+    async def serve(self):
+        reader = asyncio.StreamReader()
+        await self.loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+        self.reply({'ready': True, 'quic': HAVE_AIOQUIC})
+        tasks = set()
+        samplers = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            req = json.loads(line)
+            if req.get('cmd') == 'close':
+                # Drops pooled connections: the next fetches start cold.
+                await self.close()
+                self.reply({'id': req.get('id'), 'closed': True})
+                continue
+            if req.get('cmd') == 'sample':
+                t = asyncio.ensure_future(self.sample(req))
+                samplers.add(t)
+                t.add_done_callback(samplers.discard)
+                continue
+            if req.get('cmd') == 'page':
+                t = asyncio.ensure_future(self.page(req))
+            else:
+                t = asyncio.ensure_future(self.handle(req))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        # Samplers run until their duration; on EOF they stop right away.
+        for t in samplers:
+            t.cancel()
+        if tasks or samplers:
+            await asyncio.wait(tasks | samplers)
+        await self.close()
+
+async def serve():
+    await Agent().serve()
+
+
+# -----------------------------------------------------------------------------
+# Driver side
+# -----------------------------------------------------------------------------
+class FetchAgent(object):
+    """Starts the agent on a Mininet host; fetch() runs one request and
+    appends its timings to fname."""
+
+    def __init__(self, host, fname, timeout=FETCH_TIMEOUT):
+        self.timeout = timeout
+        self.proc = host.popen([sys.executable, AGENT], stdin=PIPE,
+                               stdout=PIPE, stderr=None,
+                               universal_newlines=True)
+        self.seq = 0
+        self.results = {}
+        self.started = {}
+        hello = self.read()
+        if not hello or not hello.get('ready'):
+            raise RuntimeError('fetch agent did not start on %s' % host.name)
+        self.quic = hello['quic']
+        self.out = SampleWriter(fname, fetch_fmt, header=fetch_header,
+                                capacity=256)
+        base = os.path.join(os.path.dirname(fname) or '.', '')
+        self.pages = SampleWriter(base + 'pages.csv', page_fmt,
+                                  header=page_header, capacity=64)
+        self.waterfall = SampleWriter(base + 'waterfall.csv', waterfall_fmt,
+                                      header=waterfall_header, capacity=256)
+
+    def read(self):
+        line = self.proc.stdout.readline()
+        return json.loads(line) if line else None
+
+    def send(self, req):
+        self.seq += 1
+        req['id'] = self.seq
+        self.proc.stdin.write(json.dumps(req) + '\n')
+        self.proc.stdin.flush()
+        return self.seq
+
+    def wait(self, rid):
+        while rid not in self.results:
+            res = self.read()
+            if res is None:
+                raise RuntimeError('fetch agent exited')
+            self.results[res['id']] = res
+        return self.results.pop(rid)
+
+    def record(self, label, req, res):
+        self.out.append(*fetch_row(label, req, res))
+
+    def fetch(self, proto, host, port, path, reuse=True, label=''):
+        return self.finish(self.start(proto, host, port, path, reuse),
+                           label)
+
+    def start(self, proto, host, port, path, reuse=True, timeout=None):
+        """Sends one fetch without waiting for it; returns the id to
+        finish()."""
+        req = dict(proto=proto, host=host, port=port, path=path,
+                   reuse=reuse, timeout=timeout or self.timeout)
+        rid = self.send(req)
+        self.started[rid] = req
+        return rid
+
+    def finish(self, rid, label=''):
+        """Waits for a fetch from start() and records it."""
+        res = self.wait(rid)
+        self.record(label, self.started.pop(rid), res)
+        return res
+
+    def page(self, proto, host, port, paths, conns=BROWSER_CONNS,
+             reuse=False, label='', parents=None):
+        """Loads paths like a browser, each after its entry in parents;
+        returns the page result, whose 'objects' are in the order of
+        paths."""
+        req = dict(cmd='page', proto=proto, host=host, port=port,
+                   paths=list(paths), conns=conns, reuse=reuse,
+                   parents=parents or {}, timeout=self.timeout)
+        res = self.wait(self.send(req))
+        nan = float('nan')
+        errors = 0
+        for obj in res['objects']:
+            if 'error' in obj:
+                errors += 1
+                row = (0, 0, 0, obj['start_ms'], nan, nan, nan, nan,
+                       obj['end_ms'])
+            else:
+                row = (obj['status'], obj['bytes'], obj['reused'],
+                       obj['start_ms'], obj['connect_ms'],
+                       obj['handshake_ms'], obj['ttfb_ms'],
+                       obj['transfer_ms'], obj['end_ms'])
+            self.waterfall.append(res['time'], label, proto, obj['path'],
+                                  obj.get('parent') or '', *row)
+        self.pages.append(res['time'], label, proto, len(res['objects']),
+                          sum(o.get('bytes', 0) for o in res['objects']),
+                          1 if proto == 'quic' else conns, errors,
+                          res['plt_ms'])
+        return res
+
+    def sample(self, proto, host, port, path, fname, interval=0.5,
+               duration=60.0, reuse=False):
+        """Starts periodic fetches (rows in fname, written by the agent);
+        returns the id to wait() on for the final count."""
+        return self.send(dict(cmd='sample', proto=proto, host=host,
+                              port=port, path=path, reuse=reuse,
+                              interval=interval, duration=duration,
+                              fname=os.path.abspath(fname),
+                              timeout=self.timeout))
+
+    def reset(self):
+        """Closes the agent's pooled connections."""
+        self.wait(self.send({'cmd': 'close'}))
+
+    def close(self):
+        self.out.close()
+        self.pages.close()
+        self.waterfall.close()
+        self.proc.stdin.close()
+        try:
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve())
@@ -10,6 +10,7 @@ m.use("Agg")
 import matplotlib.pyplot as plt
 import argparse
 import math
+import random
 
 def read_list(fname, delim=','):
     lines = open(fname)
@@ -111,6 +112,10 @@ def parse_cpu_usage(fname, nprocessors=8):
         ret.append(total[0:3] + total[4:])
     return ret
 
+def pc50(lst):
+    l = len(lst)
+    return sorted(lst)[ int(0.50 * l) ]
+
 def pc95(lst):
     l = len(lst)
     return sorted(lst)[ int(0.95 * l) ]
@@ -122,3 +127,13 @@ def pc99(lst):
 def coeff_variation(lst):
     return stdev(lst) / avg(lst)
 
+def bootstrap_ci(lst, stat, n=1000, conf=0.95, seed=0):
+    """(low, high) confidence interval of stat(lst), from n resamples
+    with replacement (percentile bootstrap, fixed seed)."""
+    rnd = random.Random(seed)
+    k = len(lst)
+    stats = sorted(stat([lst[rnd.randrange(k)] for _ in range(k)])
+                   for _ in range(n))
+    tail = (1 - conf) / 2
+    return stats[int(tail * n)], stats[min(int((1 - tail) * n), n - 1)]
+
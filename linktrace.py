@@ -0,0 +1,175 @@
+'''
+Trace-driven bottleneck: replays a bandwidth (and delay/loss) trace on a
+running topology (its first bottleneck port).
+
+A trace is a CSV of
+
+    time_sec,rate_mbps[,delay_ms[,loss_pct]]
+
+(a header line and '#' comments are skipped; an empty delay or loss keeps
+the previous value). A file with one integer per line is read as a
+Mahimahi trace instead: each line is the millisecond at which one
+1500-byte packet may leave, turned into a rate every `window` seconds.
+
+play() sends every change, at its absolute deadline from the start, to
+one long-lived `tc -batch` process per namespace, so an update costs a
+line on a pipe instead of a fork and exec of tc. The rate goes to the
+htb class 5:1 of the bottleneck port (the h1 -> h2 direction), delay and
+loss to the netem 10: that holds the bottleneck's delay. After the last
+point the trace starts over (unless loop=False). Every applied point is
+written as
+
+    time,rate_mbps,delay_ms,loss_pct
+
+and the start values are put back on exit.
+'''
+
+from collections import namedtuple
+from subprocess import Popen, PIPE
+from time import time, perf_counter, sleep
+
+from netns import in_netns
+from samplewriter import SampleWriter, handle_sigterm
+from overhead import OverheadMeter, overhead_path, spawned
+
+MAHIMAHI_MTU = 1500
+
+TracePoint = namedtuple('TracePoint', 'time rate_mbps delay_ms loss_pct')
+
+trace_header = 'time,rate_mbps,delay_ms,loss_pct\n'
+trace_fmt = '%f,%.3f,%.3f,%.3f\n'
+
+
+def load_trace(fname, window=0.1):
+    """Reads a CSV or Mahimahi trace into TracePoints sorted by time."""
+    lines = [l.strip() for l in open(fname)]
+    lines = [l for l in lines if l and not l.startswith('#')]
+    if lines and all(l.isdigit() for l in lines):
+        return mahimahi_points([int(l) for l in lines], window)
+    rows = []
+    for line in lines:
+        f = [x.strip() for x in line.split(',')]
+        try:
+            t, rate = float(f[0]), float(f[1])
+        except ValueError:
+            continue  # header
+        rows.append((t, rate, f[2:4]))
+    if not rows:
+        raise ValueError('%s: no trace points' % fname)
+    # "Previous" is in time, not file, order
+    points = []
+    delay = loss = None
+    for t, rate, f in sorted(rows, key=lambda r: r[0]):
+        if len(f) > 0 and f[0]:
+            delay = float(f[0])
+        if len(f) > 1 and f[1]:
+            loss = float(f[1])
+        points.append(TracePoint(t, rate, delay, loss))
+    return points
+
+def mahimahi_points(stamps_ms, window=0.1):
+    """Packets per window -> one TracePoint per window."""
+    nwin = int(stamps_ms[-1] / 1e3 / window) + 1
+    counts = [0] * nwin
+    for ms in stamps_ms:
+        counts[int(ms / 1e3 / window)] += 1
+    # htb cannot take 0: an empty window becomes a trickle
+    return [TracePoint(i * window,
+                       max(n * MAHIMAHI_MTU * 8 / window / 1e6, 0.001),
+                       None, None)
+            for i, n in enumerate(counts)]
+
+def trace_period(points):
+    """How long one pass of the trace lasts: up to the last point plus
+    the step before it."""
+    if len(points) < 2:
+        return points[0].time + 1.0
+    return points[-1].time + (points[-1].time - points[-2].time)
+
+
+class TcBatch(object):
+    """A `tc -batch -` kept open in a namespace; change() costs one line."""
+
+    def __init__(self, netns=None):
+        with in_netns(netns):
+            spawned()
+            # Own session: a signal to the player's group must not kill
+            # tc before the start values are put back
+            self.proc = Popen(['tc', '-force', '-batch', '-'], stdin=PIPE,
+                              universal_newlines=True, start_new_session=True)
+
+    def change(self, line):
+        self.proc.stdin.write(line + '\n')
+        self.proc.stdin.flush()
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+def play(fname, trace, iface, rate_mbps, delay_ms, limit, netem_iface=None,
+         netem_netns=None, delay_offset=0.0, loop=True, window=0.1):
+    """Replays trace (a file name or TracePoints) on iface until SIGTERM.
+
+    iface is the bottleneck port (its htb class gets the rate), in this
+    process' namespace. The netem holding the bottleneck's delay is on
+    netem_iface (default: iface) in netem_netns; it is set to delay_offset
+    plus the trace's delay (delay_ms until the trace gives one), with
+    limit packets. rate_mbps and delay_ms are the link's configured values,
+    restored on exit. Applied points go to fname.
+    """
+    handle_sigterm()
+    points = load_trace(trace, window) if isinstance(trace, str) else trace
+    period = trace_period(points)
+    netem_iface = netem_iface or iface
+    rate_tc = TcBatch()
+    netem_tc = rate_tc if netem_netns is None else TcBatch(netem_netns)
+    meter = OverheadMeter('linktrace', overhead_path(fname))
+
+    def apply(rate, delay, loss):
+        rate_tc.change('class change dev %s parent 5:0 classid 5:1 htb '
+                       'rate %fMbit burst 15k' % (iface, rate))
+        if delay is not None or loss is not None:
+            netem = 'delay %sms' % (delay_offset + (delay or 0.0))
+            if loss:
+                netem += ' loss %s%%' % loss
+            netem_tc.change('qdisc change dev %s parent 5:1 handle 10: '
+                            'netem %s limit %d' % (netem_iface, netem, limit))
+
+    try:
+        with SampleWriter(fname, trace_fmt, header=trace_header,
+                          capacity=256) as out:
+            t0 = perf_counter()
+            k = 0
+            delay, loss = delay_ms, 0.0
+            touched = False
+            while loop or k < len(points):
+                p = points[k % len(points)]
+                deadline = t0 + (k // len(points)) * period + p.time
+                remaining = deadline - perf_counter()
+                if remaining > 0:
+                    sleep(remaining)
+                meter.begin()
+                if p.delay_ms is not None:
+                    delay = p.delay_ms
+                if p.loss_pct is not None:
+                    loss = p.loss_pct
+                changed = p.delay_ms is not None or p.loss_pct is not None
+                touched = touched or changed
+                apply(p.rate_mbps, delay if changed else None,
+                      loss if changed else None)
+                out.append(time(), p.rate_mbps, delay, loss)
+                meter.end()
+                k += 1
+            # Without loop, keep the last point until the experiment ends
+            while True:
+                sleep(3600)
+    finally:
+        meter.close()
+        if touched:
+            apply(rate_mbps, delay_ms, 0.0)
+        else:
+            apply(rate_mbps, None, None)
+        rate_tc.close()
+        if netem_tc is not rate_tc:
+            netem_tc.close()
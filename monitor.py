@@ -1,30 +1,392 @@
 from time import sleep, time
 from subprocess import *
 import re
+import os
+
+from netlink import QdiscSampler, QdiscStats, AQM_KINDS, TcpInfoSampler
+from netns import in_netns
+from samplewriter import SampleWriter, handle_sigterm
+from ticker import Ticker
+from telemetry import TelemetryBus
+from overhead import OverheadMeter, overhead_path, spawned
 
 default_dir = '.'
 
-def monitor_qlen(iface, interval_sec = 0.01, fname='%s/qlen.txt' % default_dir):
-    pat_queued = re.compile(rb'backlog\s[^\s]+\s([\d]+)p')
-    cmd = "tc -s qdisc show dev %s" % (iface)
+pat_qdisc = re.compile(
+    rb'qdisc\s+(\S+)\s+(\S+)\s+(?:dev\s+(\S+)\s+)?(?:root|parent\s+(\S+)).*?'
+    rb'Sent\s+(\d+)\s+bytes\s+(\d+)\s+pkt\s+'
+    rb'\(dropped\s+(\d+),\s+overlimits\s+(\d+)\s+requeues\s+(\d+)\)\s+'
+    rb'backlog\s+([\d.]+)([KMG]?)b\s+(\d+)p', re.S)
+
+size_units = {b'': 1, b'K': 1024, b'M': 1024 ** 2, b'G': 1024 ** 3}
+
+# AQM lines that follow the counters (fq_codel/codel/pie: "ecn_mark N",
+# codel "ldelay 3us", pie "delay 3us"; cake: one column per tin)
+pat_ecn_mark = re.compile(rb'\becn_mark (\d+)')
+pat_delay = re.compile(rb'\b(?:ldelay|delay) ([\d.]+)(us|ms|s)\b')
+pat_cake_marks = re.compile(rb'^\s*marks((?:[ \t]+\d+)+)', re.M)
+pat_cake_delay = re.compile(rb'^\s*av_delay((?:[ \t]+[\d.]+(?:us|ms|s))+)', re.M)
+pat_time = re.compile(rb'([\d.]+)(us|ms|s)')
+
+time_units_ms = {b'us': 1e-3, b'ms': 1.0, b's': 1e3}
+
+def parse_tc_xstats(kind, text):
+    """(ecn_marks, aqm_delay_ms) from the AQM part of `tc -s` output."""
+    nan = float('nan')
+    if kind == 'cake':
+        m = pat_cake_marks.search(text)
+        marks = sum(int(x) for x in m.group(1).split()) if m else 0
+        m = pat_cake_delay.search(text)
+        delays = [float(v) * time_units_ms[u]
+                  for v, u in pat_time.findall(m.group(1))] if m else []
+        return marks, max(delays) if delays else nan
+    m = pat_ecn_mark.search(text)
+    marks = int(m.group(1)) if m else 0
+    m = pat_delay.search(text)
+    delay = float(m.group(1)) * time_units_ms[m.group(2)] if m else nan
+    return marks, delay
+
+def parse_tc_qdisc(output, ifindex=0, devs=None):
+    """Parses `tc -s qdisc show` output into QdiscStats, in print order.
+
+    If devs is a dict, the qdiscs are also appended to devs[dev] for every
+    dev named in the output (only present when no `dev` was given to tc).
+    """
     ret = []
-    open(fname, 'w').write('')
-    while 1:
+    matches = list(pat_qdisc.finditer(output))
+    for i, m in enumerate(matches):
+        (kind, handle, dev, parent, nbytes, packets, drops, overlimits,
+         requeues, backlog, unit, qlen) = m.groups()
+        kind = kind.decode()
+        xstats = ()
+        if kind in AQM_KINDS:
+            end = matches[i + 1].start() if i + 1 < len(matches) else None
+            xstats = parse_tc_xstats(kind, output[m.end():end])
+        q = QdiscStats(
+            ifindex, handle.decode(), (parent or b'root').decode(),
+            kind, int(nbytes), int(packets), int(qlen),
+            int(float(backlog) * size_units[unit]), int(drops),
+            int(requeues), int(overlimits), *xstats)
+        ret.append(q)
+        if devs is not None and dev is not None and dev.decode() in devs:
+            devs[dev.decode()].append(q)
+    return ret
+
+class TcQdiscSampler(object):
+    """Fallback sampler that forks `tc -s qdisc show` on every call."""
+
+    def sample(self, iface):
+        cmd = "tc -s qdisc show dev %s" % (iface)
         p = Popen(cmd, shell=True, stdout=PIPE)
-        output = p.stdout.read()
-        # Not quite right, but will do for now
-        matches = pat_queued.findall(output)
-        if matches and len(matches) > 1:
-            ret.append(matches[1])
-            t = "%f" % time()
-            open(fname, 'a').write('{},{}\n'.format(t, matches[1].decode('utf-8')))
-        sleep(interval_sec)
-    #open('qlen.txt', 'w').write('\n'.join(ret))
-    return
-
-def monitor_devs_ng(fname="%s/txrate.txt" % default_dir, interval_sec=0.01):
-    """Uses bwm-ng tool to collect iface tx rate stats.  Very reliable."""
-    cmd = ("sleep 1; bwm-ng -t %s -o csv "
-           "-u bits -T rate -C ',' > %s" %
-           (interval_sec * 1000, fname))
-    Popen(cmd, shell=True).wait()
+        spawned()
+        output = p.communicate()[0]
+        return parse_tc_qdisc(output)
+
+    def sample_all(self, ifaces):
+        p = Popen("tc -s qdisc show", shell=True, stdout=PIPE)
+        spawned()
+        ret = dict((i, []) for i in ifaces)
+        parse_tc_qdisc(p.communicate()[0], devs=ret)
+        return ret
+
+    def close(self):
+        pass
+
+def open_qdisc_sampler():
+    """Returns a netlink sampler, or the `tc` one if netlink is unavailable."""
+    try:
+        return QdiscSampler()
+    except OSError:
+        return TcQdiscSampler()
+
+qdisc_header = ('time,iface,kind,handle,qlen,backlog_bytes,drops,'
+                'overlimits,requeues,drop_rate_pps,qdelay_ms,'
+                'ecn_marks,aqm_delay_ms\n')
+qdisc_fmt = '%f,%s,%s,%s,%d,%d,%d,%d,%d,%.3f,%.3f,%d,%.3f\n'
+
+class QdiscCounters(object):
+    """Turns cumulative qdisc counters into per-interval rows.
+
+    The drop rate is the drops delta over the time since the previous
+    sample of the same qdisc; the queueing delay is the byte backlog
+    drained at the bottleneck rate (nan when rate_mbps is unknown). For
+    an AQM, ecn_marks and aqm_delay_ms are its own counters (see
+    netlink.QdiscStats).
+    """
+
+    def __init__(self, rate_mbps=None):
+        self.byte_rate = rate_mbps * 1e6 / 8 if rate_mbps else None
+        self.prev = {}
+
+    def rows(self, t, iface, qdiscs):
+        for q in qdiscs:
+            key = (iface, q.handle)
+            pt, pdrops = self.prev.get(key, (t, q.drops))
+            self.prev[key] = (t, q.drops)
+            drop_rate = (q.drops - pdrops) / (t - pt) if t > pt else 0.0
+            if self.byte_rate:
+                qdelay = q.backlog / self.byte_rate * 1000
+            else:
+                qdelay = float('nan')
+            yield (t, iface, q.kind, q.handle, q.qlen, q.backlog, q.drops,
+                   q.overlimits, q.requeues, drop_rate, qdelay, q.ecn_marks,
+                   q.aqm_delay_ms)
+
+def open_qdisc_writer(stats_fname):
+    if not stats_fname:
+        return None
+    return SampleWriter(stats_fname, qdisc_fmt, header=qdisc_header)
+
+def open_bus(bus_path):
+    return TelemetryBus(bus_path) if bus_path else None
+
+def monitor_qlen(iface, interval_sec = 0.01, fname='%s/qlen.txt' % default_dir,
+                 stats_fname=None, rate_mbps=None, bus_path=None):
+    """Writes time,qlen for iface every interval_sec; the achieved rate,
+    missed ticks and jitter go to fname.sched.
+
+    With stats_fname, every qdisc of iface also gets a row with its full
+    counters (see qdisc_header); rate_mbps is the bottleneck rate used to
+    turn the byte backlog into a queueing delay.
+
+    With bus_path, the latest qlen is also published on a telemetry bus
+    (channel "qlen") for live readers.
+    """
+    handle_sigterm()
+    sampler = open_qdisc_sampler()
+    ticker = Ticker(interval_sec)
+    counters = QdiscCounters(rate_mbps)
+    stats = open_qdisc_writer(stats_fname)
+    bus = open_bus(bus_path)
+    meter = OverheadMeter('qmon', overhead_path(fname))
+    try:
+        with SampleWriter(fname, '%f,%d\n') as out:
+            while 1:
+                meter.begin()
+                # Not quite right, but will do for now: the second qdisc is
+                # the netem one that TCLink installs below tbf/htb.
+                qdiscs = sampler.sample(iface)
+                t = time()
+                if len(qdiscs) > 1:
+                    out.append(t, qdiscs[1].qlen)
+                    if bus:
+                        bus.publish('qlen', qdiscs[1].qlen, t)
+                if stats:
+                    for row in counters.rows(t, iface, qdiscs):
+                        stats.append(*row)
+                meter.end()
+                ticker.wait()
+    finally:
+        sampler.close()
+        if stats:
+            stats.close()
+        meter.close()
+        ticker.write_report(fname + '.sched')
+
+def port_names(target):
+    """Interface names to watch: a name, a list of names, or every data
+    port of a Mininet switch."""
+    if isinstance(target, str):
+        return [target]
+    if hasattr(target, 'intfList'):
+        return [i.name for i in target.intfList() if i.name != 'lo']
+    return list(target)
+
+def backlog_qdisc(qdiscs):
+    """The qdisc holding the queue: netem below tbf/htb on TCLink ports,
+    the root one on unshaped ports."""
+    if len(qdiscs) > 1:
+        return qdiscs[1]
+    return qdiscs[0] if qdiscs else None
+
+def read_qlens(target, sampler=None):
+    """Reads every port of target in one pass; returns [(iface, qlen)].
+    A sampler opened here (none given) is closed before returning."""
+    own = sampler is None
+    if own:
+        sampler = open_qdisc_sampler()
+    ret = []
+    try:
+        for iface, qdiscs in sampler.sample_all(port_names(target)).items():
+            q = backlog_qdisc(qdiscs)
+            if q is not None:
+                ret.append((iface, q.qlen))
+    finally:
+        if own:
+            sampler.close()
+    return ret
+
+def monitor_qlens(target, interval_sec = 0.01, fname='%s/qlens.txt' % default_dir,
+                  stats_fname=None, rate_mbps=None, bus_path=None):
+    """Single-process monitor for several ports; writes time,qlen,iface.
+
+    stats_fname, rate_mbps and bus_path work as in monitor_qlen, for every
+    port (bus channels are "qlen:<iface>").
+    """
+    handle_sigterm()
+    ifaces = port_names(target)
+    sampler = open_qdisc_sampler()
+    ticker = Ticker(interval_sec)
+    counters = QdiscCounters(rate_mbps)
+    stats = open_qdisc_writer(stats_fname)
+    bus = open_bus(bus_path)
+    meter = OverheadMeter('qmon', overhead_path(fname))
+    try:
+        with SampleWriter(fname, '%f,%d,%s\n') as out:
+            while 1:
+                meter.begin()
+                t = time()
+                for iface, qdiscs in sampler.sample_all(ifaces).items():
+                    q = backlog_qdisc(qdiscs)
+                    if q is not None:
+                        out.append(t, q.qlen, iface)
+                        if bus:
+                            bus.publish('qlen:' + iface, q.qlen, t)
+                    if stats:
+                        for row in counters.rows(t, iface, qdiscs):
+                            stats.append(*row)
+                meter.end()
+                ticker.wait()
+    finally:
+        sampler.close()
+        if stats:
+            stats.close()
+        meter.close()
+        ticker.write_report(fname + '.sched')
+
+dev_counters = ('tx_bytes', 'rx_bytes', 'tx_packets', 'rx_packets')
+dev_header = 'time,iface,tx_bps,rx_bps,tx_pps,rx_pps\n'
+dev_fmt = '%f,%s,%.0f,%.0f,%.1f,%.1f\n'
+
+class DevStatsSampler(object):
+    """Reads interface counters from /sys/class/net/<iface>/statistics.
+
+    The counter files stay open and are re-read with pread(), so a sample
+    costs four small syscalls per interface and no process.
+    """
+
+    def __init__(self, ifaces=None):
+        if ifaces is None:
+            ifaces = sorted(os.listdir('/sys/class/net'))
+        self.fds = {}
+        for iface in ifaces:
+            path = '/sys/class/net/%s/statistics/' % iface
+            self.fds[iface] = [os.open(path + c, os.O_RDONLY)
+                               for c in dev_counters]
+
+    def sample(self):
+        """Returns {iface: (tx_bytes, rx_bytes, tx_packets, rx_packets)}."""
+        return dict((iface, tuple(int(os.pread(fd, 32, 0)) for fd in fds))
+                    for iface, fds in self.fds.items())
+
+    def close(self):
+        for fds in self.fds.values():
+            for fd in fds:
+                os.close(fd)
+        self.fds = {}
+
+class DevRates(object):
+    """Turns cumulative interface counters into tx/rx bit and packet rates."""
+
+    def __init__(self):
+        self.prev = {}
+
+    def rows(self, t, counters):
+        for iface, cur in counters.items():
+            prev = self.prev.get(iface)
+            self.prev[iface] = (t, cur)
+            if prev is None or t <= prev[0]:
+                continue
+            dt = t - prev[0]
+            d = [c - p for c, p in zip(cur, prev[1])]
+            yield (t, iface, d[0] * 8 / dt, d[1] * 8 / dt, d[2] / dt, d[3] / dt)
+
+def monitor_devs_ng(fname="%s/txrate.txt" % default_dir, interval_sec=0.01,
+                    ifaces=None, bus_path=None):
+    """Samples tx/rx bits and packets per second for ifaces (a name, a list,
+    a Mininet switch, or every interface when None) and writes one
+    time,iface,tx_bps,rx_bps,tx_pps,rx_pps row per interface per tick.
+
+    Replaces the old bwm-ng wrapper; no external tool is needed. With
+    bus_path, rates are published as "tx_bps:<iface>" / "rx_bps:<iface>".
+    """
+    handle_sigterm()
+    sampler = DevStatsSampler(None if ifaces is None else port_names(ifaces))
+    ticker = Ticker(interval_sec)
+    rates = DevRates()
+    bus = open_bus(bus_path)
+    meter = OverheadMeter('ratemon', overhead_path(fname))
+    try:
+        with SampleWriter(fname, dev_fmt, header=dev_header) as out:
+            while 1:
+                meter.begin()
+                for row in rates.rows(time(), sampler.sample()):
+                    out.append(*row)
+                    if bus:
+                        bus.publish('tx_bps:' + row[1], row[2], row[0])
+                        bus.publish('rx_bps:' + row[1], row[3], row[0])
+                meter.end()
+                ticker.wait()
+    finally:
+        sampler.close()
+        meter.close()
+        ticker.write_report(fname + '.sched')
+
+tcp_header = ('time,host,flow,cong,state,ca_state,cwnd,ssthresh,srtt_ms,'
+              'rttvar_ms,min_rtt_ms,inflight,inflight_bytes,retrans,lost,'
+              'total_retrans,delivery_mbps,pacing_mbps,bytes_acked,'
+              'bbr_bw_mbps,bbr_min_rtt_ms\n')
+tcp_fmt = ('%f,%s,%s,%s,%s,%s,%d,%d,%.3f,%.3f,%.3f,%d,%d,%d,%d,%d,%.3f,%.3f,'
+           '%d,%.3f,%.3f\n')
+
+def tcp_rows(t, host, infos):
+    """tcp_header rows for the TcpInfos sampled on host at t."""
+    for i in infos:
+        yield (t, host, '%s:%d-%s:%d' % (i.src, i.sport, i.dst, i.dport),
+               i.cong, i.state, i.ca_state, i.cwnd, i.ssthresh, i.srtt_ms,
+               i.rttvar_ms, i.min_rtt_ms, i.inflight, i.inflight * i.mss,
+               i.retrans, i.lost, i.total_retrans,
+               i.delivery_rate * 8 / 1e6, i.pacing_rate * 8 / 1e6,
+               i.bytes_acked, i.bbr_bw * 8 / 1e6, i.bbr_min_rtt_ms)
+
+def monitor_tcp(fname='%s/tcp_info.txt' % default_dir, hosts=None,
+                interval_sec=0.01, ports=None, bus_path=None):
+    """Samples the kernel's tcp_info of every TCP flow on hosts, a list of
+    (name, netns) (netns as for in_netns; None is this namespace), and
+    writes one tcp_header row per flow per tick: cwnd and ssthresh in
+    packets, inflight in packets and bytes, rates in Mb/s.
+
+    ports keeps only flows with a local or remote port in it. With
+    bus_path, cwnd and srtt_ms are published as "cwnd:<host>:<port>" /
+    "srtt:<host>:<port>" (the local port).
+    """
+    handle_sigterm()
+    samplers = []
+    for name, netns in hosts or [('-', None)]:
+        # The netlink socket stays in the namespace it was created in
+        with in_netns(netns):
+            samplers.append((name, TcpInfoSampler(ports)))
+    ticker = Ticker(interval_sec)
+    bus = open_bus(bus_path)
+    meter = OverheadMeter('tcpmon', overhead_path(fname))
+    try:
+        with SampleWriter(fname, tcp_fmt, header=tcp_header) as out:
+            while 1:
+                meter.begin()
+                t = time()
+                for name, sampler in samplers:
+                    infos = sampler.sample()
+                    for row in tcp_rows(t, name, infos):
+                        out.append(*row)
+                    if bus:
+                        for i in infos:
+                            key = '%s:%d' % (name, i.sport)
+                            bus.publish('cwnd:' + key, i.cwnd, t)
+                            bus.publish('srtt:' + key, i.srtt_ms, t)
+                meter.end()
+                ticker.wait()
+    finally:
+        for _, sampler in samplers:
+            sampler.close()
+        meter.close()
+        ticker.write_report(fname + '.sched')
@@ -0,0 +1,352 @@
+'''
+Minimal rtnetlink client used by the monitors.
+
+Keeps one NETLINK_ROUTE socket open and dumps qdisc statistics with
+RTM_GETQDISC, so sampling the queues does not fork `tc` on every tick.
+For the AQMs (fq_codel, codel, pie, cake) the qdisc-specific xstats are
+read too: ECN marks and the AQM's own queueing-delay estimate.
+
+The same client, on a NETLINK_SOCK_DIAG socket, dumps the kernel's
+struct tcp_info of every TCP socket in a namespace (what `ss -ti`
+prints): cwnd, RTT, delivery and pacing rate, in-flight and
+retransmitted packets, plus BBR's bandwidth and min_rtt estimates.
+'''
+
+from collections import namedtuple
+import socket
+import math
+import struct
+import os
+
+NETLINK_ROUTE = 0
+NETLINK_SOCK_DIAG = 4
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_GETQDISC = 38
+SOCK_DIAG_BY_FAMILY = 20
+
+TCA_KIND = 1
+TCA_STATS = 3
+TCA_STATS2 = 7
+
+TCA_STATS_BASIC = 1
+TCA_STATS_QUEUE = 3
+TCA_STATS_APP = 4
+
+# cake's xstats are nested: per-tin attributes under TIN_STATS
+TCA_CAKE_STATS_TIN_STATS = 10
+TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS = 8
+TCA_CAKE_TIN_STATS_AVG_DELAY_US = 19
+
+NLA_TYPE_MASK = 0x3fff
+
+# inet_diag extensions (requested as 1 << (ext - 1) in a u8, so BBRINFO
+# cannot be asked for directly: BBR answers a VEGASINFO request with it)
+INET_DIAG_INFO = 2
+INET_DIAG_VEGASINFO = 3
+INET_DIAG_CONG = 4
+INET_DIAG_BBRINFO = 16
+
+TCP_ESTABLISHED = 1
+TCP_TIME_WAIT = 6
+TCP_CLOSE = 7
+TCP_LISTEN = 10
+# Every state with a peer (no listeners, no TIME_WAIT leftovers)
+TCP_STATES = 0xfff & ~(1 << TCP_TIME_WAIT | 1 << TCP_CLOSE | 1 << TCP_LISTEN)
+TCP_STATE_NAMES = ('', 'established', 'syn_sent', 'syn_recv', 'fin_wait1',
+                   'fin_wait2', 'time_wait', 'close', 'close_wait',
+                   'last_ack', 'listen', 'closing', 'new_syn_recv')
+TCP_CA_STATE_NAMES = ('open', 'disorder', 'cwr', 'recovery', 'loss')
+
+NLMSGHDR = struct.Struct('=LHHLL')
+TCMSG = struct.Struct('=BxxxiLLL')
+RTATTR = struct.Struct('=HH')
+GNET_BASIC = struct.Struct('=QL')
+GNET_QUEUE = struct.Struct('=LLLLL')
+# struct tc_stats: bytes, packets, drops, overlimits, bps, pps, qlen, backlog
+TC_STATS = struct.Struct('=QLLLLLLL')
+# struct tc_fq_codel_xstats (type 0, qdisc): type, maxpacket,
+# drop_overlimit, ecn_mark
+FQ_CODEL_XSTATS = struct.Struct('=LLLL')
+# struct tc_codel_xstats: maxpacket, count, lastcount, ldelay (us),
+# drop_next, drop_overlimit, ecn_mark
+CODEL_XSTATS = struct.Struct('=LLLLlLL')
+# struct tc_pie_xstats: prob, delay (us), avg_dq_rate, [dq_rate_estimating,]
+# packets_in, dropped, overlimit, maxq, ecn_mark; prob became 64-bit and
+# dq_rate_estimating appeared in Linux 5.2
+PIE_XSTATS = struct.Struct('=QLLLLLLLL')
+PIE_XSTATS_OLD = struct.Struct('=LLLLLLLL')
+# struct inet_diag_req_v2: family, protocol, ext, states, then the
+# inet_diag_sockid (ports and addresses in network order)
+INET_DIAG_REQ = struct.Struct('=BBBxL48x')
+# struct inet_diag_msg: family, state, timer, retrans, sockid, expires,
+# rqueue, wqueue, uid, inode
+INET_DIAG_MSG = struct.Struct('=BBBB48sLLLLL')
+INET_DIAG_SOCKID = struct.Struct('!HH16s16s')
+# struct tcp_info up to delivery_rate (Linux 4.9): state, ca_state,
+# retransmits, probes, backoff, options, wscale, flags; rto, ato, snd_mss,
+# rcv_mss; unacked, sacked, lost, retrans, fackets; last_data_sent,
+# last_ack_sent, last_data_recv, last_ack_recv; pmtu, rcv_ssthresh, rtt,
+# rttvar, snd_ssthresh, snd_cwnd, advmss, reordering; rcv_rtt, rcv_space;
+# total_retrans; pacing_rate, max_pacing_rate; bytes_acked,
+# bytes_received; segs_out, segs_in; notsent_bytes, min_rtt, data_segs_in,
+# data_segs_out; delivery_rate
+TCP_INFO = struct.Struct('=8B4L5L4L8L2LL2Q2Q2L4LQ')
+# struct tcp_bbr_info: bw_lo, bw_hi (bytes/s), min_rtt (us), pacing_gain,
+# cwnd_gain
+TCP_BBR_INFO = struct.Struct('=LLLLL')
+UINT64_MAX = (1 << 64) - 1
+
+AQM_KINDS = ('fq_codel', 'codel', 'pie', 'cake')
+
+# ecn_marks and aqm_delay_ms (the AQM's sojourn/queue-delay estimate) are
+# only known for AQM_KINDS; fq_codel keeps no delay estimate.
+QdiscStats = namedtuple('QdiscStats',
+                        'ifindex handle parent kind bytes packets '
+                        'qlen backlog drops requeues overlimits '
+                        'ecn_marks aqm_delay_ms',
+                        defaults=(0, float('nan')))
+
+# One TCP socket as seen by sock_diag. Rates are in bytes/s, times in ms;
+# inflight is packets in flight (unacked - sacked - lost + retrans, as the
+# kernel counts it). pacing_rate is nan when unlimited, the bbr_* fields
+# when the socket does not use BBR.
+TcpInfo = namedtuple('TcpInfo',
+                     'src sport dst dport state cong ca_state mss cwnd '
+                     'ssthresh srtt_ms rttvar_ms min_rtt_ms inflight '
+                     'retrans lost total_retrans delivery_rate pacing_rate '
+                     'bytes_acked bbr_bw bbr_min_rtt_ms',
+                     defaults=(float('nan'), float('nan')))
+
+
+def _align(n):
+    return (n + 3) & ~3
+
+def parse_attrs(data, offset=0, end=None):
+    """Returns a {type: payload} dict for the rtattrs in data[offset:end]."""
+    attrs = {}
+    end = len(data) if end is None else end
+    while offset + RTATTR.size <= end:
+        alen, atype = RTATTR.unpack_from(data, offset)
+        if alen < RTATTR.size:
+            break
+        attrs[atype & NLA_TYPE_MASK] = data[offset + RTATTR.size:offset + alen]
+        offset += _align(alen)
+    return attrs
+
+def format_handle(h):
+    """Formats a tc handle the way `tc` prints it ("5:", "5:1", "root")."""
+    if h == 0xffffffff:
+        return 'root'
+    major, minor = h >> 16, h & 0xffff
+    if minor:
+        return '%x:%x' % (major, minor)
+    return '%x:' % major
+
+
+class RtNetlink(object):
+    """One long-lived rtnetlink (or, with protocol, other netlink) socket."""
+
+    def __init__(self, bufsize=1 << 16, protocol=NETLINK_ROUTE):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  protocol)
+        self.sock.bind((0, 0))
+        self.bufsize = bufsize
+        self.seq = 0
+
+    def dump(self, msg_type, payload):
+        """Sends a dump request and yields (type, body) for every reply."""
+        self.seq += 1
+        hdr = NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type,
+                            NLM_F_REQUEST | NLM_F_DUMP, self.seq, 0)
+        self.sock.send(hdr + payload)
+        while True:
+            data = self.sock.recv(self.bufsize)
+            offset = 0
+            while offset + NLMSGHDR.size <= len(data):
+                mlen, mtype, _, seq, _ = NLMSGHDR.unpack_from(data, offset)
+                if mlen < NLMSGHDR.size:
+                    return
+                body = data[offset + NLMSGHDR.size:offset + mlen]
+                offset += _align(mlen)
+                if seq != self.seq:
+                    continue
+                if mtype == NLMSG_DONE:
+                    return
+                if mtype == NLMSG_ERROR:
+                    err = -struct.unpack_from('=i', body)[0]
+                    if err:
+                        raise OSError(err, os.strerror(err))
+                    return
+                yield mtype, body
+
+    def close(self):
+        self.sock.close()
+
+
+def parse_xstats(kind, data):
+    """(ecn_marks, aqm_delay_ms) from a qdisc's TCA_STATS_APP payload."""
+    nan = float('nan')
+    try:
+        if kind == 'fq_codel':
+            xtype, _, _, ecn = FQ_CODEL_XSTATS.unpack_from(data)
+            return (ecn, nan) if xtype == 0 else (0, nan)
+        if kind == 'codel':
+            f = CODEL_XSTATS.unpack_from(data)
+            return f[6], f[3] / 1e3
+        if kind == 'pie':
+            if len(data) >= PIE_XSTATS.size:
+                f = PIE_XSTATS.unpack_from(data)
+            else:
+                f = PIE_XSTATS_OLD.unpack_from(data)
+            return f[-1], f[1] / 1e3
+        if kind == 'cake':
+            tins = parse_attrs(data).get(TCA_CAKE_STATS_TIN_STATS, b'')
+            marks, delay = 0, nan
+            for tin in parse_attrs(tins).values():
+                t = parse_attrs(tin)
+                if TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS in t:
+                    marks += struct.unpack_from(
+                        '=L', t[TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS])[0]
+                if TCA_CAKE_TIN_STATS_AVG_DELAY_US in t:
+                    d = struct.unpack_from(
+                        '=L', t[TCA_CAKE_TIN_STATS_AVG_DELAY_US])[0] / 1e3
+                    delay = d if math.isnan(delay) else max(delay, d)
+            return marks, delay
+    except struct.error:
+        pass
+    return 0, nan
+
+def _parse_qdisc(body):
+    _, ifindex, handle, parent, _ = TCMSG.unpack_from(body)
+    attrs = parse_attrs(body, TCMSG.size)
+    kind = attrs.get(TCA_KIND, b'').rstrip(b'\0').decode()
+    nbytes = packets = qlen = backlog = drops = requeues = overlimits = 0
+    ecn_marks, aqm_delay = 0, float('nan')
+    if TCA_STATS2 in attrs:
+        stats = parse_attrs(attrs[TCA_STATS2])
+        if TCA_STATS_BASIC in stats:
+            nbytes, packets = GNET_BASIC.unpack_from(stats[TCA_STATS_BASIC])
+        if TCA_STATS_QUEUE in stats:
+            qlen, backlog, drops, requeues, overlimits = \
+                GNET_QUEUE.unpack_from(stats[TCA_STATS_QUEUE])
+        if kind in AQM_KINDS and TCA_STATS_APP in stats:
+            ecn_marks, aqm_delay = parse_xstats(kind, stats[TCA_STATS_APP])
+    elif TCA_STATS in attrs:
+        nbytes, packets, drops, overlimits, _, _, qlen, backlog = \
+            TC_STATS.unpack_from(attrs[TCA_STATS])
+    return QdiscStats(ifindex, format_handle(handle), format_handle(parent),
+                      kind, nbytes, packets, qlen, backlog, drops,
+                      requeues, overlimits, ecn_marks, aqm_delay)
+
+
+class QdiscSampler(object):
+    """Reads qdisc stats over rtnetlink.
+
+    sample(iface) returns the qdiscs of one interface in the same order
+    `tc -s qdisc show dev iface` prints them; sample_all(ifaces) does the
+    same for several interfaces with a single dump.
+    """
+
+    def __init__(self):
+        self.nl = RtNetlink()
+        self.ifindex = {}
+
+    def _index(self, iface):
+        if iface not in self.ifindex:
+            self.ifindex[iface] = socket.if_nametoindex(iface)
+        return self.ifindex[iface]
+
+    def dump(self):
+        req = TCMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        return [_parse_qdisc(body) for _, body in self.nl.dump(RTM_GETQDISC, req)]
+
+    def sample(self, iface):
+        idx = self._index(iface)
+        return [q for q in self.dump() if q.ifindex == idx]
+
+    def sample_all(self, ifaces):
+        """One dump for many interfaces; returns {iface: [QdiscStats]}."""
+        by_index = dict((self._index(i), i) for i in ifaces)
+        ret = dict((i, []) for i in ifaces)
+        for q in self.dump():
+            if q.ifindex in by_index:
+                ret[by_index[q.ifindex]].append(q)
+        return ret
+
+    def close(self):
+        self.nl.close()
+
+
+def _parse_tcp(body):
+    family, state, _, _, sockid = INET_DIAG_MSG.unpack_from(body)[:5]
+    sport, dport, src, dst = INET_DIAG_SOCKID.unpack_from(sockid)
+    alen = 4 if family == socket.AF_INET else 16
+    attrs = parse_attrs(body, INET_DIAG_MSG.size)
+    if INET_DIAG_INFO not in attrs:
+        return None
+    # Older kernels send a shorter tcp_info: missing fields read as 0
+    raw = attrs[INET_DIAG_INFO][:TCP_INFO.size]
+    f = TCP_INFO.unpack(raw + bytes(TCP_INFO.size - len(raw)))
+    (ca_state, mss, unacked, sacked, lost, retrans, rtt, rttvar, ssthresh,
+     cwnd, total_retrans, pacing_rate, bytes_acked, min_rtt,
+     delivery_rate) = (f[1], f[10], f[12], f[13], f[14], f[15], f[23],
+                       f[24], f[25], f[26], f[31], f[32], f[34], f[39],
+                       f[42])
+    cong = attrs.get(INET_DIAG_CONG, b'').rstrip(b'\0').decode()
+    bbr_bw = bbr_min_rtt = float('nan')
+    if INET_DIAG_BBRINFO in attrs:
+        bw_lo, bw_hi, bbr_rtt, _, _ = TCP_BBR_INFO.unpack_from(
+            attrs[INET_DIAG_BBRINFO])
+        bbr_bw, bbr_min_rtt = bw_hi << 32 | bw_lo, bbr_rtt / 1e3
+    return TcpInfo(socket.inet_ntop(family, src[:alen]), sport,
+                   socket.inet_ntop(family, dst[:alen]), dport,
+                   TCP_STATE_NAMES[state] if state < len(TCP_STATE_NAMES)
+                   else str(state),
+                   cong or '-',
+                   TCP_CA_STATE_NAMES[ca_state]
+                   if ca_state < len(TCP_CA_STATE_NAMES) else str(ca_state),
+                   mss, cwnd, ssthresh, rtt / 1e3, rttvar / 1e3,
+                   min_rtt / 1e3, unacked - sacked - lost + retrans,
+                   retrans, lost, total_retrans, delivery_rate,
+                   float('nan') if pacing_rate == UINT64_MAX else pacing_rate,
+                   bytes_acked, bbr_bw, bbr_min_rtt)
+
+
+class TcpInfoSampler(object):
+    """Reads tcp_info of every TCP socket over sock_diag.
+
+    The socket belongs to the namespace it is created in (open it inside
+    netns.in_netns to watch a host). sample() returns one TcpInfo per
+    connected socket, optionally only those with a local or remote port
+    in ports.
+    """
+
+    def __init__(self, ports=None):
+        self.nl = RtNetlink(protocol=NETLINK_SOCK_DIAG)
+        self.ports = set(ports) if ports else None
+        self.ext = (1 << (INET_DIAG_INFO - 1) |
+                    1 << (INET_DIAG_VEGASINFO - 1) |
+                    1 << (INET_DIAG_CONG - 1))
+
+    def sample(self):
+        ret = []
+        for family in (socket.AF_INET, socket.AF_INET6):
+            req = INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, self.ext,
+                                     TCP_STATES)
+            for _, body in self.nl.dump(SOCK_DIAG_BY_FAMILY, req):
+                info = _parse_tcp(body)
+                if info is None:
+                    continue
+                if self.ports and not (info.sport in self.ports or
+                                       info.dport in self.ports):
+                    continue
+                ret.append(info)
+        return ret
+
+    def close(self):
+        self.nl.close()
@@ -0,0 +1,50 @@
+'''
+Network namespace helpers.
+
+Mininet hosts are processes in their own network namespace. A monitor in
+the root namespace can still open sockets "inside" a host: it switches to
+the host's namespace with setns(2), creates the socket, and switches back.
+The socket stays bound to the host's namespace for its whole life.
+'''
+
+from contextlib import contextmanager
+import ctypes
+import os
+
+CLONE_NEWNET = 0x40000000
+
+_libc = ctypes.CDLL(None, use_errno=True)
+
+
+def setns(fd, nstype=CLONE_NEWNET):
+    if _libc.setns(fd, nstype) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+def ns_path(target):
+    """Accepts a pid, a Mininet node (anything with .pid) or a path."""
+    if isinstance(target, str):
+        return target
+    pid = getattr(target, 'pid', target)
+    return '/proc/%d/ns/net' % pid
+
+@contextmanager
+def in_netns(target):
+    """Runs the with-block inside target's network namespace.
+
+    target=None is a no-op, so callers can pass an optional host through.
+    """
+    if target is None:
+        yield
+        return
+    own = os.open('/proc/self/ns/net', os.O_RDONLY)
+    other = os.open(ns_path(target), os.O_RDONLY)
+    try:
+        setns(other)
+        try:
+            yield
+        finally:
+            setns(own)
+    finally:
+        os.close(other)
+        os.close(own)
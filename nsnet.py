@@ -0,0 +1,378 @@
+'''
+Lightweight network backend: plain namespaces, veth pairs and a bridge.
+
+NsNet builds the hosts, switches and links of a Mininet Topo (any of
+topology.py's) without Mininet, OVS or a controller:
+
+    host    a process (`unshare --net sleep`) holding a new network
+            namespace; its pid is the host's pid, as in Mininet
+    switch  a Linux bridge in the root namespace, named like the switch,
+            with one port per link (s0-eth1, s0-eth2, ...)
+    link    a veth pair, host end moved into the host's namespace
+
+Every link end gets the same shaping TCLink installs (htb class 5:1 for
+bw above netem 10: for delay and max_queue_size, GRO off), so
+topology.reconfigure() and the qdisc monitors work unchanged. Nodes,
+interfaces and links expose the part of Mininet's API the experiment
+scripts use (get, hosts, pingAll, stop; pid, IP, cmd, popen, intfList,
+defaultIntf), and host addresses are Mininet's (10.0.0.1/8, ...).
+
+Bring-up is one `ip -batch`/`tc -batch` pair for the root namespace and
+one per host, the hosts' all running at once, so even a hundred hosts
+come up in about a second (Mininet creates and shapes links one at a
+time). Commands run in a host with nsenter and, if the host was given
+cores, taskset.
+'''
+
+from subprocess import Popen, PIPE, STDOUT, DEVNULL
+from time import time, sleep
+import ipaddress
+import os
+import re
+import signal
+
+from overhead import spawned
+
+IP_BASE = '10.0.0.0/8'
+
+# -----------------------------------------------------------------------------
+# Topo without Mininet
+# -----------------------------------------------------------------------------
+class Topo(object):
+    """The subset of mininet.topo.Topo that topology.py and NsNet use; stands
+    in for it when Mininet is not installed."""
+
+    def __init__(self, *args, **params):
+        self.nodes = {}
+        self.ports = {}
+        self.link_info = []
+        self.build(*args, **params)
+
+    def build(self, *args, **params):
+        pass
+
+    def addHost(self, name, **opts):
+        self.nodes[name] = opts
+        return name
+
+    def addSwitch(self, name, **opts):
+        self.nodes[name] = dict(opts, isSwitch=True)
+        return name
+
+    def addPort(self, node):
+        # Like Mininet: host ports count from 0, switch ports from 1
+        base = 1 if self.isSwitch(node) else 0
+        port = self.ports.get(node, base)
+        self.ports[node] = port + 1
+        return port
+
+    def addLink(self, node1, node2, port1=None, port2=None, **opts):
+        if port1 is None:
+            port1 = self.addPort(node1)
+        if port2 is None:
+            port2 = self.addPort(node2)
+        opts = dict(opts, node1=node1, node2=node2, port1=port1, port2=port2)
+        self.link_info.append(opts)
+        return node1, node2
+
+    def isSwitch(self, name):
+        return self.nodes[name].get('isSwitch', False)
+
+    def nodeInfo(self, name):
+        return self.nodes[name]
+
+    def hosts(self, sort=True):
+        return natural_sorted(n for n in self.nodes if not self.isSwitch(n))
+
+    def switches(self, sort=True):
+        return natural_sorted(n for n in self.nodes if self.isSwitch(n))
+
+    def links(self, sort=False, withKeys=False, withInfo=False):
+        return [(i['node1'], i['node2'], i) if withInfo
+                else (i['node1'], i['node2']) for i in self.link_info]
+
+
+def natural_sorted(names):
+    """h2 before h10, like Mininet's natural sort."""
+    return sorted(names, key=lambda s: [int(t) if t.isdigit() else t
+                                        for t in re.split(r'(\d+)', s)])
+
+# -----------------------------------------------------------------------------
+# Nodes, interfaces and links
+# -----------------------------------------------------------------------------
+def run(argv, pid=None, input=None, cores=None, check=False):
+    """Runs argv (in pid's namespace) and returns its stdout+stderr; with
+    check, a non-zero exit raises RuntimeError."""
+    return run_all([(argv, pid, input)], cores, check)[0]
+
+def run_all(jobs, cores=None, check=False):
+    """Like run() for several (argv, pid, input) at once: all are started,
+    then waited for; returns their outputs in order."""
+    procs = []
+    for argv, pid, input in jobs:
+        spawned()
+        procs.append(Popen(ns_argv(argv, pid, cores),
+                           stdin=PIPE if input else DEVNULL, stdout=PIPE,
+                           stderr=STDOUT, universal_newlines=True))
+    outs = [p.communicate(input)[0]
+            for (argv, pid, input), p in zip(jobs, procs)]
+    for (argv, pid, input), p, out in zip(jobs, procs, outs):
+        if check and p.returncode:
+            raise RuntimeError('%s: %s' % (' '.join(argv), out.strip()))
+    return outs
+
+def ns_argv(argv, pid=None, cores=None):
+    if cores is not None:
+        argv = ['taskset', '-c', str(cores)] + argv
+    if pid is not None:
+        argv = ['nsenter', '--net=/proc/%d/ns/net' % pid, '--'] + argv
+    return argv
+
+
+class Intf(object):
+    """One end of a link; str() is the interface name."""
+
+    def __init__(self, name, node, ip=None):
+        self.name = name
+        self.node = node
+        self.ip = ip
+        self.link = None
+        self.params = {}
+
+    def cmd(self, *args):
+        return self.node.cmd(*args)
+
+    def IP(self):
+        return self.ip
+
+    def __str__(self):
+        return self.name
+
+
+class Link(object):
+
+    def __init__(self, intf1, intf2, **params):
+        self.intf1 = intf1
+        self.intf2 = intf2
+        intf1.link = intf2.link = self
+        intf1.params = dict(params)
+        intf2.params = dict(params)
+
+
+class Node(object):
+    """A host (own namespace, pid set) or a switch (root namespace)."""
+
+    def __init__(self, name, pid=None, cores=None, ip=None):
+        self.name = name
+        self.pid = pid
+        self.cores = cores
+        self.ip = ip
+        self.intfs = []
+
+    def cmd(self, *args):
+        """Runs a shell command in the node; returns its output."""
+        return run(['sh', '-c', ' '.join(args)], self.pid, cores=self.cores)
+
+    def popen(self, cmd, shell=False, **kwargs):
+        """Like Mininet's popen: the process runs in the node, in its own
+        session (so os.killpg reaches everything it starts)."""
+        if isinstance(cmd, str):
+            cmd = ['sh', '-c', cmd] if shell else cmd.split()
+        kwargs.setdefault('start_new_session', True)
+        return Popen(ns_argv(list(cmd), self.pid, self.cores), **kwargs)
+
+    def IP(self):
+        return self.ip
+
+    def intfList(self):
+        return list(self.intfs)
+
+    def defaultIntf(self):
+        return self.intfs[0] if self.intfs else None
+
+    def __str__(self):
+        return self.name
+
+# -----------------------------------------------------------------------------
+# Network
+# -----------------------------------------------------------------------------
+def shaping(intf, bw=None, delay=None, max_queue_size=None, **params):
+    """tc -batch lines reproducing TCLink's default qdiscs on intf."""
+    lines = []
+    parent = 'root'
+    if bw is not None:
+        lines += ['qdisc add dev %s root handle 5:0 htb default 1' % intf,
+                  'class add dev %s parent 5:0 classid 5:1 htb rate %fMbit '
+                  'burst 15k' % (intf, bw)]
+        parent = 'parent 5:1'
+    netem = ''
+    if delay is not None:
+        netem += ' delay %s' % delay
+    if max_queue_size is not None:
+        netem += ' limit %d' % max_queue_size
+    if netem:
+        lines.append('qdisc add dev %s %s handle 10: netem%s' %
+                     (intf, parent, netem))
+    return lines
+
+
+class NsNet(object):
+    """Builds topo from namespaces, veths and bridges; see the module
+    docstring. start() brings it up, stop() removes it."""
+
+    def __init__(self, topo, ip_base=IP_BASE):
+        self.topo = topo
+        self.ip_base = ipaddress.ip_network(ip_base)
+        self.nameToNode = {}
+        self.hosts = []
+        self.switches = []
+        self.links = []
+        self.holders = []
+
+    def get(self, name):
+        return self.nameToNode[name]
+
+    def __getitem__(self, name):
+        return self.nameToNode[name]
+
+    def start(self):
+        try:
+            return self.build()
+        except Exception:
+            self.stop()
+            raise
+
+    def build(self):
+        topo = self.topo
+        prefix = self.ip_base.prefixlen
+        addrs = self.ip_base.hosts()
+        root_ip, root_tc = [], []
+        host_ip, host_tc = {}, {}
+        for name in topo.hosts():
+            opts = topo.nodeInfo(name)
+            spawned()
+            holder = Popen(['unshare', '--net', '--', 'sleep', 'infinity'],
+                           start_new_session=True)
+            self.holders.append(holder)
+            node = Node(name, holder.pid, opts.get('cores'), str(next(addrs)))
+            self.hosts.append(node)
+            self.nameToNode[name] = node
+            host_ip[name] = ['link set lo up']
+            host_tc[name] = []
+        self.wait_unshared()
+        for name in topo.switches():
+            node = Node(name)
+            self.switches.append(node)
+            self.nameToNode[name] = node
+            root_ip += ['link add %s type bridge' % name,
+                        'link set %s up' % name]
+        for n1, n2, info in topo.links(withInfo=True):
+            params = dict((k, v) for k, v in info.items()
+                          if k not in ('node1', 'node2', 'port1', 'port2'))
+            ends = [Intf('%s-eth%d' % (n, port), self.get(n),
+                         self.get(n).ip)
+                    for n, port in ((n1, info['port1']), (n2, info['port2']))]
+            # Created from the root namespace, each host end straight
+            # into its host's namespace; switch ends join the bridge.
+            root_ip.append('link add %s type veth peer %s' %
+                           tuple(self.veth_end(i) for i in ends))
+            for intf in ends:
+                intf.node.intfs.append(intf)
+                if intf.node.pid:
+                    host_ip[intf.node.name] += [
+                        'addr add %s/%d dev %s' % (intf.ip, prefix, intf),
+                        'link set %s up' % intf]
+                    host_tc[intf.node.name] += shaping(intf, **params)
+                else:
+                    root_ip.append('link set %s master %s up' %
+                                   (intf, intf.node.name))
+                    root_tc += shaping(intf, **params)
+            self.links.append(Link(ends[0], ends[1], **params))
+        # The root's ip batch creates every veth; the rest only configures
+        # them, each namespace on its own
+        self.batch([(None, 'ip', root_ip)])
+        self.batch([(None, 'tc', root_tc)] +
+                   [(node.pid, tool, cmds[node.name]) for node in self.hosts
+                    for tool, cmds in (('ip', host_ip), ('tc', host_tc))])
+        # Like TCIntf: GRO off, or netem sees 64 kB super-packets. ethtool
+        # may be missing: its failures are ignored.
+        gro = [(['sh', '-c', '; '.join('ethtool -K %s gro off' % i
+                                       for i in node.intfs)], node.pid, None)
+               for node in self.hosts + self.switches if node.intfs]
+        run_all(gro)
+        return self
+
+    def wait_unshared(self, timeout=10.0):
+        """Waits until every holder is in its own namespace: until then
+        `ip link ... netns PID` would move veths into ours."""
+        own = os.stat('/proc/self/ns/net').st_ino
+        pending = list(self.hosts)
+        deadline = time() + timeout
+        while pending:
+            pending = [n for n in pending
+                       if os.stat('/proc/%d/ns/net' % n.pid).st_ino == own]
+            if pending and time() > deadline:
+                raise RuntimeError('%s: no namespace of its own' %
+                                   pending[0].name)
+            if pending:
+                sleep(0.001)
+
+    @staticmethod
+    def veth_end(intf):
+        if intf.node.pid:
+            return 'name %s netns %d' % (intf, intf.node.pid)
+        return 'name %s' % intf
+
+    def batch(self, jobs):
+        """Runs the (pid, tool, lines) batches at once."""
+        run_all([([tool, '-batch', '-'], pid, '\n'.join(lines) + '\n')
+                 for pid, tool, lines in jobs if lines], check=True)
+
+    def pingAll(self, timeout=1):
+        """One ping between every pair of hosts; returns the loss in %."""
+        sent = lost = 0
+        print('*** Ping: testing ping reachability')
+        for src in self.hosts:
+            got = []
+            for dst in self.hosts:
+                if dst is src:
+                    continue
+                sent += 1
+                out = src.cmd('ping -c1 -W%d %s' % (timeout, dst.IP()))
+                if ' 0% packet loss' in out:
+                    got.append(dst.name)
+                else:
+                    lost += 1
+                    got.append('X')
+            print('%s -> %s' % (src.name, ' '.join(got)))
+        loss = 100.0 * lost / sent if sent else 0.0
+        print('*** Results: %d%% dropped (%d/%d received)' %
+              (loss, sent - lost, sent))
+        return loss
+
+    def stop(self):
+        """Kills the namespace holders (their veths go with them) and
+        deletes the bridges."""
+        for holder in self.holders:
+            try:
+                os.killpg(holder.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            holder.wait()
+        self.holders = []
+        for node in self.switches:
+            for intf in node.intfs:
+                run(['ip', 'link', 'del', intf.name])
+            run(['ip', 'link', 'del', node.name])
+        self.switches = []
+
+
+def dump_connections(nodes):
+    """Prints each node's interfaces and their peers, like Mininet's
+    dumpNodeConnections."""
+    for node in nodes:
+        conns = []
+        for intf in node.intfList():
+            peer = intf.link.intf2 if intf.link.intf1 is intf else intf.link.intf1
+            conns.append('%s:%s' % (intf, peer))
+        print('%s %s' % (node.name, ' '.join(conns)))
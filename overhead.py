@@ -0,0 +1,107 @@
+'''
+Self-instrumentation of the measurement overhead.
+
+Every monitor (and the experiment driver) keeps an OverheadMeter: its own
+CPU time, the wall time spent per sample and the number of processes it
+started. On close the meter appends one line to overhead.txt in the run
+directory; summarize() turns those lines into overhead_report.txt, next
+to q.txt and ping.txt.
+'''
+
+from time import perf_counter
+import os
+import resource
+
+overhead_header = ('name,pid,wall_sec,cpu_user_sec,cpu_sys_sec,cpu_pct,'
+                   'samples,sample_mean_us,sample_max_us,procs_started,'
+                   'children_cpu_sec\n')
+
+_spawned = 0
+
+def spawned(n=1):
+    """Counts processes started by this process (tc, ping, clients...)."""
+    global _spawned
+    _spawned += n
+
+def overhead_path(fname):
+    """overhead.txt in the directory of a monitor's output file."""
+    return os.path.join(os.path.dirname(fname) or '.', 'overhead.txt')
+
+
+class OverheadMeter(object):
+    """begin()/end() around the work of each sample; close() at exit."""
+
+    def __init__(self, name, fname):
+        self.name = name
+        self.fname = fname
+        self.wall0 = perf_counter()
+        self.ru0 = resource.getrusage(resource.RUSAGE_SELF)
+        self.rc0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        self.spawned0 = _spawned
+        self.samples = 0
+        self.sample_sum = 0.0
+        self.sample_max = 0.0
+        self.t = None
+        self.closed = False
+
+    def begin(self):
+        self.t = perf_counter()
+
+    def end(self):
+        dt = perf_counter() - self.t
+        self.samples += 1
+        self.sample_sum += dt
+        if dt > self.sample_max:
+            self.sample_max = dt
+
+    def row(self):
+        wall = perf_counter() - self.wall0
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        rc = resource.getrusage(resource.RUSAGE_CHILDREN)
+        user = ru.ru_utime - self.ru0.ru_utime
+        system = ru.ru_stime - self.ru0.ru_stime
+        children = (rc.ru_utime - self.rc0.ru_utime +
+                    rc.ru_stime - self.rc0.ru_stime)
+        n = max(self.samples, 1)
+        return (self.name, os.getpid(), wall, user, system,
+                100.0 * (user + system) / wall if wall else 0.0,
+                self.samples, self.sample_sum / n * 1e6,
+                self.sample_max * 1e6, _spawned - self.spawned0, children)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        line = '%s,%d,%.3f,%.3f,%.3f,%.2f,%d,%.1f,%.1f,%d,%.3f\n' % self.row()
+        new = not os.path.exists(self.fname)
+        # One O_APPEND write per process, so concurrent monitors don't mix.
+        with open(self.fname, 'a') as f:
+            f.write((overhead_header if new else '') + line)
+
+
+def summarize(fname, out=None):
+    """Writes a per-run report from overhead.txt; returns its path."""
+    out = out or os.path.join(os.path.dirname(fname) or '.',
+                              'overhead_report.txt')
+    rows = []
+    for line in open(fname):
+        if line.startswith('name,'):
+            continue
+        f = line.strip().split(',')
+        rows.append((f[0], float(f[2]), float(f[3]) + float(f[4]),
+                     int(f[6]), float(f[7]), float(f[8]), int(f[9]),
+                     float(f[10])))
+    wall = max([r[1] for r in rows] or [0.0])
+    cpu = sum(r[2] + r[7] for r in rows)
+    with open(out, 'w') as f:
+        f.write('%-12s %9s %9s %9s %12s %12s %6s\n' %
+                ('name', 'wall_s', 'cpu_s', 'child_s', 'mean_us',
+                 'max_us', 'procs'))
+        for r in rows:
+            f.write('%-12s %9.2f %9.3f %9.3f %12.1f %12.1f %6d\n' %
+                    (r[0], r[1], r[2], r[7], r[4], r[5], r[6]))
+        f.write('total cpu %.3f s over %.2f s wall (%.2f%% of one core), '
+                '%d processes started\n' %
+                (cpu, wall, 100.0 * cpu / wall if wall else 0.0,
+                 sum(r[6] for r in rows)))
+    return out
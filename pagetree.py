@@ -0,0 +1,208 @@
+'''
+Page dependency tree for the browsing workload.
+
+parse_page() reads a page's HTML and collects what a browser would fetch
+for it: stylesheets, scripts, images, icons, media, frames, and the
+url()/@import references of inline <style> blocks, style attributes and
+(when they exist locally) the stylesheets themselves. Every reference is
+an object of the tree whose parent is the document that referenced it,
+so a browser-like client can only start it once the parent has arrived.
+
+build_site() lays the tree out in a directory one server can serve:
+absolute URLs are mapped to /<host>/<path> under the same origin, files
+found next to the page are copied, and missing objects are generated at
+realistic sizes: per-type median sizes, scaled for images by their
+width/height attributes, with a deterministic per-object spread.
+'''
+
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit, quote, unquote
+import posixpath
+import random
+import math
+import os
+import re
+import shutil
+
+ORIGIN = 'http://origin'
+
+# Median transfer sizes per type (bytes), roughly HTTP Archive's.
+SIZES = {
+    '.html': 30000, '.htm': 30000, '.css': 20000, '.js': 20000,
+    '.jpg': 30000, '.jpeg': 30000, '.png': 10000, '.gif': 3000,
+    '.svg': 3000, '.ico': 2000, '.webp': 20000, '.woff': 25000,
+    '.woff2': 20000, '.ttf': 40000, '.json': 5000, '.xml': 5000,
+    '.mp4': 1000000, '.webm': 800000, '.mp3': 500000,
+}
+DEFAULT_SIZE = 10000
+SPREAD = 0.5
+# Compressed bytes per pixel, for images that declare width and height.
+BYTES_PER_PIXEL = {'.jpg': 0.25, '.jpeg': 0.25, '.png': 0.5, '.gif': 0.15,
+                   '.webp': 0.15}
+TEXT_TYPES = ('.html', '.htm', '.css', '.js', '.json', '.xml', '.svg')
+
+# (tag, attribute) pairs a browser fetches; <link> only for the rel below.
+FETCHED = {('img', 'src'), ('script', 'src'), ('iframe', 'src'),
+           ('frame', 'src'), ('embed', 'src'), ('video', 'src'),
+           ('video', 'poster'), ('audio', 'src'), ('source', 'src'),
+           ('input', 'src'), ('object', 'data')}
+LINK_RELS = {'stylesheet', 'icon', 'shortcut', 'preload', 'apple-touch-icon'}
+
+pat_css_url = re.compile(r'''url\(\s*['"]?([^'")\s]+)['"]?\s*\)''')
+pat_css_import = re.compile(r'''@import\s+['"]([^'"]+)['"]''')
+
+
+def css_refs(text):
+    return pat_css_import.findall(text) + pat_css_url.findall(text)
+
+def local_path(ref, base):
+    """Same-origin URL path for ref as seen from base, or None if it is
+    not something to fetch (data:, javascript:, fragments...)."""
+    ref = ref.strip()
+    if not ref or ref.startswith(('#', 'data:', 'javascript:', 'mailto:',
+                                  'about:')):
+        return None
+    url = urlsplit(urljoin(base, ref))
+    if url.scheme not in ('http', 'https'):
+        return None
+    path = posixpath.normpath(unquote(url.path) or '/')
+    if url.netloc != urlsplit(ORIGIN).netloc:
+        path = posixpath.join('/', url.netloc, path.lstrip('/'))
+    if url.path.endswith('/') or not url.path:
+        path = posixpath.join(path, 'index.html')
+    return quote(path)
+
+
+class PageParser(HTMLParser):
+    """Collects (ref, size_hint) pairs of an HTML document."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.refs = []
+        self.in_style = False
+
+    def handle_starttag(self, tag, attrs):
+        a = dict((k, v or '') for k, v in attrs)
+        if tag == 'link':
+            rels = set(a.get('rel', '').lower().split())
+            if rels & LINK_RELS and a.get('href'):
+                self.refs.append((a['href'], None))
+        for name, value in a.items():
+            if (tag, name) in FETCHED and value:
+                self.refs.append((value, self.pixels(a)))
+        if 'style' in a:
+            self.refs.extend((r, None) for r in css_refs(a['style']))
+        self.in_style = tag == 'style'
+
+    def handle_endtag(self, tag):
+        self.in_style = False
+
+    def handle_data(self, data):
+        if self.in_style:
+            self.refs.extend((r, None) for r in css_refs(data))
+
+    @staticmethod
+    def pixels(a):
+        try:
+            return int(a['width']) * int(a['height'])
+        except (KeyError, ValueError):
+            return None
+
+
+class PageTree(object):
+    """Objects of a page in discovery order: path -> (parent, size, src),
+    where src is the local file to copy (None: generate size bytes)."""
+
+    def __init__(self, page):
+        self.root = '/' + quote(os.path.basename(page))
+        self.objects = {}
+
+    def add(self, path, parent, size, src):
+        if path not in self.objects:
+            self.objects[path] = (parent, size, src)
+            return True
+        return False
+
+    def paths(self):
+        return list(self.objects)
+
+    def parents(self):
+        return dict((p, o[0]) for p, o in self.objects.items() if o[0])
+
+    def depth(self, path):
+        d = 0
+        while self.objects[path][0]:
+            path = self.objects[path][0]
+            d += 1
+        return d
+
+    def size(self):
+        return sum(self.file_size(p) for p in self.objects)
+
+    def file_size(self, path):
+        parent, size, src = self.objects[path]
+        return os.path.getsize(src) if src else size
+
+
+def synthetic_size(path, pixels=None):
+    ext = posixpath.splitext(unquote(path))[1].lower()
+    if pixels and ext in BYTES_PER_PIXEL:
+        median = max(pixels * BYTES_PER_PIXEL[ext], 500)
+    else:
+        median = SIZES.get(ext, DEFAULT_SIZE)
+    return int(random.Random(path).lognormvariate(math.log(median), SPREAD))
+
+def parse_page(page):
+    """Builds the PageTree of an HTML file; references are looked up in
+    the page's directory (absolute URLs under <dir>/<host>/<path>)."""
+    src_dir = os.path.dirname(os.path.abspath(page))
+    tree = PageTree(page)
+    tree.add(tree.root, None, None, page)
+    todo = [(tree.root, page, 'html')]
+    while todo:
+        doc, fname, kind = todo.pop(0)
+        text = open(fname, encoding='utf-8', errors='replace').read()
+        if kind == 'html':
+            parser = PageParser()
+            parser.feed(text)
+            refs = parser.refs
+        else:
+            refs = [(r, None) for r in css_refs(text)]
+        base = ORIGIN + doc
+        for ref, pixels in refs:
+            path = local_path(ref, base)
+            if path is None or path == doc:
+                continue
+            local = os.path.join(src_dir, unquote(path).lstrip('/'))
+            src = local if os.path.isfile(local) else None
+            size = None if src else synthetic_size(path, pixels)
+            if tree.add(path, doc, size, src) and src:
+                ext = posixpath.splitext(unquote(path))[1].lower()
+                if ext == '.css':
+                    todo.append((path, src, 'css'))
+                elif ext in ('.html', '.htm'):
+                    todo.append((path, src, 'html'))
+    return tree
+
+def filler(path, size):
+    """size bytes for a generated object: comments for text types, random
+    bytes otherwise."""
+    rnd = random.Random(path)
+    ext = posixpath.splitext(unquote(path))[1].lower()
+    if ext not in TEXT_TYPES:
+        return rnd.randbytes(size)
+    line = b'/* generated filler for ' + path.encode() + b' */\n'
+    return (line * (size // len(line) + 1))[:size]
+
+def build_site(page, site_dir):
+    """Parses page and writes its objects under site_dir; returns the tree."""
+    tree = parse_page(page)
+    for path, (parent, size, src) in tree.objects.items():
+        dst = os.path.join(site_dir, unquote(path).lstrip('/'))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if src:
+            shutil.copyfile(src, dst)
+        elif not os.path.exists(dst) or os.path.getsize(dst) != size:
+            with open(dst, 'wb') as f:
+                f.write(filler(path, size))
+    return tree
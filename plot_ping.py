@@ -15,7 +15,7 @@ parser.add_argument('--files', '-f',
                     nargs='+')
 
 parser.add_argument('--freq',
-                    help="Frequency of pings (per second)",
+                    help="Frequency of pings (per second), for `ping` text output",
                     type=int,
                     default=10)
 
@@ -26,8 +26,16 @@ parser.add_argument('--out', '-o',
 args = parser.parse_args()
 
 def parse_ping(fname):
+    """Returns [seconds, rtt_ms] pairs from either the prober's CSV
+    (time,seq,rtt_ms,lost; lost probes are skipped) or `ping` output."""
     ret = []
     lines = open(fname).readlines()
+    if lines and lines[0].startswith('time,seq,rtt_ms'):
+        for line in lines[1:]:
+            t, seq, rtt, lost = line.strip().split(',')
+            if lost == '0':
+                ret.append([float(t), float(rtt)])
+        return sorted(ret)
     num = 0
     for line in lines:
         if 'bytes from' not in line:
@@ -36,10 +44,10 @@ def parse_ping(fname):
             rtt = line.split(' ')[-2]
             rtt = rtt.split('=')[1]
             rtt = float(rtt)
-            ret.append([num, rtt])
+            ret.append([num / args.freq, rtt])
             num += 1
         except:
-            break
+            continue
     return ret
 
 m.rc('figure', figsize=(16, 6))
@@ -49,7 +57,7 @@ for i, f in enumerate(args.files):
     data = parse_ping(f)
     xaxis = list(map(float, list(col(0, data))))
     start_time = xaxis[0]
-    xaxis = list(map(lambda x: (x - start_time) / args.freq, xaxis))
+    xaxis = list(map(lambda x: x - start_time, xaxis))
     qlens = list(map(float, col(1, data)))
 
     ax.plot(xaxis, qlens, lw=2)
@@ -0,0 +1,307 @@
+'''
+In-process RTT prober (ICMP echo, or UDP echo when ICMP is not allowed).
+
+Sends probes from an already open socket and matches the replies by
+sequence number, so RTT probing needs neither a `ping` child nor any
+text parsing. Sockets can be opened inside a Mininet host's namespace
+(see netns.in_netns) by a monitor running in the root namespace; for UDP
+the echo responder is served from the same process, in the far host's
+namespace.
+
+probe() writes one CSV row per probe:
+
+    time,seq,rtt_ms,lost
+
+where time is the send timestamp and rtt_ms is nan for lost probes.
+Rows come out in send order; probes still unanswered when the prober
+stops are written as lost.
+'''
+
+from multiprocessing import Process
+import os
+import select
+import socket
+import struct
+from time import time, perf_counter
+
+from netns import in_netns
+from samplewriter import SampleWriter, handle_sigterm
+from ticker import Ticker
+from overhead import OverheadMeter, overhead_path
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+
+ICMP_HDR = struct.Struct('!BBHHH')
+STAMP = struct.Struct('!d')
+UDP_PROBE = struct.Struct('!Hd')
+
+UDP_ECHO_PORT = 7007
+
+probe_header = 'time,seq,rtt_ms,lost\n'
+probe_fmt = '%f,%d,%.3f,%d\n'
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    s = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    s = (s >> 16) + (s & 0xffff)
+    s += s >> 16
+    return ~s & 0xffff
+
+def icmp_socket():
+    """Unprivileged ICMP datagram socket if allowed, raw socket otherwise."""
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM,
+                             socket.IPPROTO_ICMP), False
+    except OSError:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                             socket.IPPROTO_ICMP), True
+
+
+class IcmpProber(object):
+    """Echo request/reply bookkeeping for one destination.
+
+    send(seq) sends a probe; parse(data) returns (seq, rtt_sec) for a
+    reply to one of our probes, or None.
+    """
+
+    def __init__(self, dst, netns=None, payload=56):
+        with in_netns(netns):
+            self.sock, self.raw = icmp_socket()
+        self.sock.setblocking(False)
+        self.dst = dst
+        self.ident = os.getpid() & 0xffff
+        self.pad = b'\0' * max(payload - STAMP.size, 0)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, seq):
+        seq &= 0xffff
+        body = STAMP.pack(time()) + self.pad
+        hdr = ICMP_HDR.pack(ICMP_ECHO_REQUEST, 0, 0, self.ident, seq)
+        csum = checksum(hdr + body)
+        hdr = ICMP_HDR.pack(ICMP_ECHO_REQUEST, 0, csum, self.ident, seq)
+        self.sock.sendto(hdr + body, (self.dst, 0))
+
+    def parse(self, data):
+        now = time()
+        if self.raw:
+            data = data[(data[0] & 0x0f) * 4:]
+        if len(data) < ICMP_HDR.size + STAMP.size:
+            return None
+        mtype, _, _, ident, seq = ICMP_HDR.unpack_from(data)
+        # Datagram ICMP sockets rewrite the id and only deliver our replies.
+        if mtype != ICMP_ECHO_REPLY or (self.raw and ident != self.ident):
+            return None
+        sent = STAMP.unpack_from(data, ICMP_HDR.size)[0]
+        return seq, now - sent
+
+    def recv(self):
+        """Non-blocking; returns parse() of one pending datagram or None."""
+        try:
+            return self.parse(self.sock.recv(2048))
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpProber(object):
+    """Same interface as IcmpProber, against a UDP echo responder."""
+
+    raw = False
+
+    def __init__(self, dst, port=UDP_ECHO_PORT, netns=None, payload=56):
+        with in_netns(netns):
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.dst = (dst, port)
+        self.pad = b'\0' * max(payload - UDP_PROBE.size, 0)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, seq):
+        self.sock.sendto(UDP_PROBE.pack(seq & 0xffff, time()) + self.pad,
+                         self.dst)
+
+    def parse(self, data):
+        now = time()
+        if len(data) < UDP_PROBE.size:
+            return None
+        seq, sent = UDP_PROBE.unpack_from(data)
+        return seq, now - sent
+
+    def recv(self):
+        try:
+            return self.parse(self.sock.recv(2048))
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        self.sock.close()
+
+
+class UdpEcho(object):
+    """UDP echo responder; serve() answers everything pending."""
+
+    def __init__(self, port=UDP_ECHO_PORT, netns=None):
+        with in_netns(netns):
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind(('0.0.0.0', port))
+        self.sock.setblocking(False)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def serve(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except BlockingIOError:
+                return
+            self.sock.sendto(data, addr)
+
+    def close(self):
+        self.sock.close()
+
+
+def open_prober(dst, netns=None, udp_port=UDP_ECHO_PORT):
+    """ICMP prober if this process may open an ICMP socket, UDP otherwise."""
+    try:
+        return IcmpProber(dst, netns=netns)
+    except PermissionError:
+        return UdpProber(dst, udp_port, netns=netns)
+
+
+class ProbeTracker(object):
+    """Outstanding probes: matches replies and expires lost probes.
+
+    Sequence numbers on the wire are 16 bits; the tracker keeps the full
+    counter so output rows never wrap.
+    """
+
+    def __init__(self, timeout=2.0):
+        self.timeout = timeout
+        self.seq = 0
+        self.pending = {}
+
+    def sent(self, t):
+        """Registers a probe sent at t; returns its wire sequence number."""
+        self.seq += 1
+        self.pending[self.seq & 0xffff] = (self.seq, t)
+        return self.seq & 0xffff
+
+    def reply(self, wire_seq, rtt):
+        """Returns a (time, seq, rtt_ms, lost) row, or None for strays."""
+        p = self.pending.pop(wire_seq, None)
+        if p is None:
+            return None
+        return p[1], p[0], rtt * 1000, 0
+
+    def expire(self, now):
+        """Rows for probes older than timeout, marked as lost."""
+        ret = []
+        for wire_seq, (seq, t) in list(self.pending.items()):
+            if now - t > self.timeout:
+                del self.pending[wire_seq]
+                ret.append((t, seq, float('nan'), 1))
+        return ret
+
+    def flush(self):
+        """Rows for every outstanding probe, marked as lost."""
+        ret = [(t, seq, float('nan'), 1) for seq, t in self.pending.values()]
+        self.pending = {}
+        return ret
+
+
+class SendOrder(object):
+    """Holds rows back until every earlier probe is answered or lost, so
+    they come out sorted by send time."""
+
+    def __init__(self):
+        self.rows = {}
+        self.next = 1
+
+    def push(self, rows):
+        """Takes (time, seq, ...) rows; returns those now in order."""
+        for row in rows:
+            self.rows[row[1]] = row
+        ret = []
+        while self.next in self.rows:
+            ret.append(self.rows.pop(self.next))
+            self.next += 1
+        return ret
+
+
+def probe(fname, dst, interval_sec=0.1, duration=None, netns=None,
+          echo_netns=None, udp_port=UDP_ECHO_PORT, timeout=2.0):
+    """Probes dst every interval_sec (down to 1 ms) for duration sec, or
+    until SIGTERM when duration is None.
+
+    netns is the namespace to probe from (e.g. h1.pid). echo_netns is the
+    namespace of dst (e.g. h2.pid); it is only used when ICMP is not
+    available, to serve the UDP echo responder from this same process.
+    """
+    handle_sigterm()
+    prober = open_prober(dst, netns, udp_port)
+    echo = None
+    if isinstance(prober, UdpProber) and echo_netns is not None:
+        echo = UdpEcho(udp_port, echo_netns)
+    tracker = ProbeTracker(timeout)
+    order = SendOrder()
+    ticker = Ticker(interval_sec, spin_sec=0)
+    fds = [prober] + ([echo] if echo else [])
+    end = None if duration is None else perf_counter() + duration
+    meter = OverheadMeter('prober', overhead_path(fname))
+    try:
+        with SampleWriter(fname, probe_fmt, header=probe_header) as out:
+            try:
+                while end is None or perf_counter() < end:
+                    meter.begin()
+                    prober.send(tracker.sent(time()))
+                    meter.end()
+                    deadline = ticker.advance()
+                    while True:
+                        wait = deadline - perf_counter()
+                        if wait <= 0:
+                            break
+                        ready = select.select(fds, [], [], wait)[0]
+                        if echo in ready:
+                            echo.serve()
+                        if prober in ready:
+                            r = prober.recv()
+                            while r is not None:
+                                row = tracker.reply(*r)
+                                for row in order.push([row] if row else []):
+                                    out.append(*row)
+                                r = prober.recv()
+                    ticker.record(perf_counter() - deadline)
+                    for row in order.push(tracker.expire(time())):
+                        out.append(*row)
+            finally:
+                # SIGTERM included: what is still in flight counts as lost
+                for row in order.push(tracker.flush()):
+                    out.append(*row)
+    finally:
+        prober.close()
+        if echo:
+            echo.close()
+        meter.close()
+        ticker.write_report(fname + '.sched')
+
+def start_ping(net, outdir, interval_sec=0.1, src='h1', dst='h2'):
+    """Starts probe() from Mininet host src to dst in a process of its own,
+    until terminate(); rows go to {outdir}/ping.txt. Returns the Process."""
+    h1 = net.get(src)
+    h2 = net.get(dst)
+    proc = Process(target=probe,
+                   args=(os.path.join(outdir, 'ping.txt'), h2.IP(),
+                         interval_sec),
+                   kwargs=dict(netns=h1.pid, echo_netns=h2.pid))
+    proc.start()
+    return proc
@@ -0,0 +1,270 @@
+'''
+Sender-side QUIC time series from the servers' qlog files.
+
+webserve.py --quic-log DIR leaves one qlog per connection in DIR
+(aioquic: <ODCID>.qlog, one JSON document). Those grow to hundreds of MB
+on a long flow, so they are never loaded whole: the "events" array is
+decoded one event at a time from a 64 kB window (JSON-SEQ files, one
+record per event, are read the same way). Out of every connection come
+
+    quic_metrics.txt  time,conn,cwnd,bytes_in_flight,ssthresh,
+                      smoothed_rtt_ms,latest_rtt_ms,min_rtt_ms,
+                      rtt_variance_ms
+                      (recovery:metrics_updated, at most one row per
+                      --interval, RTTs carried forward between samples)
+    quic_losses.txt   time,conn,space,packet_number (recovery:packet_lost)
+    quic_spaces.txt   conn,space,sent,received,lost,bytes_sent,
+                      largest_sent (per packet-number space)
+
+with time in seconds since the epoch, the clock of q.txt and ping.txt.
+'''
+import argparse
+import glob
+import json
+import os
+import re
+
+from samplewriter import SampleWriter
+
+CHUNK = 1 << 16
+
+# Packet type (qlog header.packet_type) -> packet-number space
+SPACES = {'initial': 'initial', 'handshake': 'handshake',
+          '0RTT': 'application', '1RTT': 'application'}
+
+pat_events = re.compile(r'"events"\s*:\s*\[')
+pat_odcid = re.compile(r'"ODCID"\s*:\s*"([0-9a-fA-F]*)"')
+pat_reference_time = re.compile(r'"reference_time"\s*:\s*([\d.eE+-]+)')
+
+metrics_header = ('time,conn,cwnd,bytes_in_flight,ssthresh,smoothed_rtt_ms,'
+                  'latest_rtt_ms,min_rtt_ms,rtt_variance_ms\n')
+metrics_fmt = '%f,%s,%d,%d,%.0f,%.3f,%.3f,%.3f,%.3f\n'
+losses_header = 'time,conn,space,packet_number\n'
+losses_fmt = '%f,%s,%s,%d\n'
+spaces_header = 'conn,space,sent,received,lost,bytes_sent,largest_sent\n'
+
+RTTS = ('smoothed_rtt', 'latest_rtt', 'min_rtt', 'rtt_variance')
+
+
+class EventStream(object):
+    """Decodes the JSON objects of a qlog file through a bounded window."""
+
+    def __init__(self, f, chunk=CHUNK):
+        self.f = f
+        self.chunk = chunk
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+
+    def fill(self):
+        """Drops what was consumed and reads one more chunk; False at EOF."""
+        data = self.f.read(self.chunk)
+        if not data:
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self, skip=' \t\r\n,\x1e'):
+        """Next character after the skip ones ('' at EOF)."""
+        while True:
+            buf, pos = self.buf, self.pos
+            while pos < len(buf) and buf[pos] in skip:
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self.fill():
+                return ''
+
+    def find(self, pattern):
+        """Moves past the next match of pattern; returns the text skipped
+        (at most one chunk of it), or None at EOF."""
+        while True:
+            m = pattern.search(self.buf, self.pos)
+            if m:
+                skipped = self.buf[max(self.pos, m.start() - self.chunk):
+                                   m.start()]
+                self.pos = m.end()
+                return skipped
+            # Keep a tail: the match may straddle two chunks
+            self.pos = max(self.pos, len(self.buf) - 64)
+            if not self.fill():
+                return None
+
+    def decode(self):
+        """The object at the current position. Objects bigger than the
+        window make it grow until they fit."""
+        while True:
+            try:
+                obj, self.pos = self.decoder.raw_decode(self.buf, self.pos)
+                return obj
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+
+
+def trace_fields(text):
+    """(ODCID, reference_time in ms) found in a trace's header text."""
+    m = pat_odcid.search(text)
+    r = pat_reference_time.search(text)
+    return (m.group(1) if m else None, float(r.group(1)) if r else 0.0)
+
+def read_events(fname):
+    """Yields (odcid, reference_time_ms, event) for every event in fname,
+    a JSON (one or more traces) or JSON-SEQ qlog."""
+    with open(fname) as f:
+        stream = EventStream(f)
+        first = stream.peek(' \t\r\n')
+        head = stream.buf[stream.pos:stream.pos + 512]
+        if first == '\x1e' or '"JSON-SEQ"' in head:
+            # Header record first, then one record per event
+            odcid, ref = None, 0.0
+            while stream.peek():
+                record = stream.decode()
+                if 'name' in record:
+                    yield odcid, ref, record
+                else:
+                    odcid, ref = trace_fields(json.dumps(record))
+            return
+        while True:
+            skipped = stream.find(pat_events)
+            if skipped is None:
+                return
+            odcid, ref = trace_fields(skipped)
+            while True:
+                c = stream.peek()
+                if c == ']':
+                    stream.pos += 1
+                    break
+                if not c:
+                    return
+                yield odcid, ref, stream.decode()
+
+
+class ConnStats(object):
+    """Recovery state and per-space counters of one connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cwnd = self.bytes_in_flight = 0
+        self.ssthresh = float('nan')
+        self.rtts = dict((k, float('nan')) for k in RTTS)
+        self.last_row = self.last_t = None
+        self.spaces = {}
+
+    def space(self, packet_type):
+        name = SPACES.get(packet_type)
+        if name is None:
+            return None
+        if name not in self.spaces:
+            # sent, received, lost, bytes_sent, largest_sent
+            self.spaces[name] = [0, 0, 0, 0, -1]
+        return self.spaces[name]
+
+    def metrics_row(self, t):
+        return (t, self.conn, self.cwnd, self.bytes_in_flight, self.ssthresh,
+                self.rtts['smoothed_rtt'], self.rtts['latest_rtt'],
+                self.rtts['min_rtt'], self.rtts['rtt_variance'])
+
+
+def analyze(fname, metrics, losses, interval=0.01):
+    """Streams one qlog into the metrics/losses writers; returns the
+    ConnStats of its connection(s)."""
+    conns = {}
+    default = os.path.basename(fname).split('.')[0]
+    for odcid, ref, event in read_events(fname):
+        conn = odcid or default
+        st = conns.get(conn)
+        if st is None:
+            st = conns[conn] = ConnStats(conn)
+        name = event.get('name', '')
+        data = event.get('data') or {}
+        t = (ref + float(event.get('time', 0.0))) / 1e3
+        st.last_t = t
+        if name == 'recovery:metrics_updated':
+            st.cwnd = data.get('cwnd', st.cwnd)
+            st.bytes_in_flight = data.get('bytes_in_flight',
+                                          st.bytes_in_flight)
+            st.ssthresh = data.get('ssthresh', st.ssthresh)
+            for k in RTTS:
+                if k in data:
+                    st.rtts[k] = data[k]
+            if st.last_row is None or t - st.last_row >= interval:
+                metrics.append(*st.metrics_row(t))
+                st.last_row = t
+        elif name in ('transport:packet_sent', 'transport:packet_received'):
+            header = data.get('header') or {}
+            sp = st.space(header.get('packet_type'))
+            if sp is None:
+                continue
+            if name == 'transport:packet_sent':
+                sp[0] += 1
+                sp[3] += (data.get('raw') or {}).get('length', 0)
+                sp[4] = max(sp[4], header.get('packet_number', -1))
+            else:
+                sp[1] += 1
+        elif name == 'recovery:packet_lost':
+            packet_type = data.get('type') or \
+                (data.get('header') or {}).get('packet_type')
+            sp = st.space(packet_type)
+            if sp is not None:
+                sp[2] += 1
+            pn = data.get('packet_number',
+                          (data.get('header') or {}).get('packet_number', -1))
+            losses.append(t, conn, SPACES.get(packet_type, '-'), pn)
+    # The last state of a connection is always kept
+    for st in conns.values():
+        if st.last_row is not None and st.last_row < st.last_t:
+            metrics.append(*st.metrics_row(st.last_t))
+    return list(conns.values())
+
+def qlog_files(paths):
+    """Files in paths, directories expanded to their *.qlog/*.sqlog."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(glob.glob(os.path.join(p, '*.qlog')) +
+                            glob.glob(os.path.join(p, '*.sqlog')))
+        elif os.path.exists(p):
+            files.append(p)
+    return files
+
+def summarize(paths, out_dir, interval=0.01):
+    """Writes quic_metrics.txt, quic_losses.txt and quic_spaces.txt for
+    the qlogs in paths into out_dir; returns the number of connections."""
+    stats = []
+    with SampleWriter(os.path.join(out_dir, 'quic_metrics.txt'),
+                      metrics_fmt, header=metrics_header) as metrics, \
+            SampleWriter(os.path.join(out_dir, 'quic_losses.txt'),
+                         losses_fmt, header=losses_header) as losses:
+        for fname in qlog_files(paths):
+            stats += analyze(fname, metrics, losses, interval)
+    with open(os.path.join(out_dir, 'quic_spaces.txt'), 'w') as f:
+        f.write(spaces_header)
+        for st in stats:
+            for space, c in sorted(st.spaces.items()):
+                f.write('%s,%s,%d,%d,%d,%d,%d\n' % ((st.conn, space) +
+                                                     tuple(c)))
+    return len(stats)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', '-f',
+                        help="qlog files or directories (--quic-log)",
+                        required=True,
+                        nargs='+')
+    parser.add_argument('--dir', '-d',
+                        help="Output directory (default: the one holding the "
+                             "first input)",
+                        default=None)
+    parser.add_argument('--interval',
+                        help="Min seconds between metrics rows per connection",
+                        type=float,
+                        default=0.01)
+    args = parser.parse_args()
+    out_dir = args.dir or os.path.dirname(
+        os.path.normpath(args.files[0])) or '.'
+    n = summarize(args.files, out_dir, args.interval)
+    print('%d QUIC connections -> %s' % (n, out_dir))
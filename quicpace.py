@@ -0,0 +1,81 @@
+'''
+Send-side pacing for the QUIC senders (webserve.py's HTTP/3 bodies and
+trafficgen.py's bulk flows).
+
+aioquic buffers whatever is written to a stream, with no public way to
+read how much of it is still waiting. A PacedProtocol keeps at most
+QUIC_WINDOW bytes written but not yet drained per connection; writers
+wait on an asyncio.Event, set whenever the window has room again, so a
+blocked stream costs no wakeups at all.
+
+What drains the window is one of two signals:
+
+    on the wire   (default) transmit() counts the datagrams it hands to
+                  the socket; headers, ACKs and retransmissions count
+                  too, so this is an upper bound on what left the buffer
+    delivered     with wire=False, only drained() does: trafficgen's
+                  sink is in the same process and reports exactly the
+                  stream bytes it received
+'''
+
+import asyncio
+
+try:
+    from aioquic.asyncio.protocol import QuicConnectionProtocol
+    HAVE_AIOQUIC = True
+except ImportError:
+    QuicConnectionProtocol = object
+    HAVE_AIOQUIC = False
+
+# Per connection. Delivered: above the bandwidth-delay product plus the
+# bottleneck queue of the experiments, so it does not limit the flow. On
+# the wire: what a body may lag behind its source (a /stream ends this
+# much after its last second).
+QUIC_WINDOW = 1 << 20
+
+
+class PacedProtocol(QuicConnectionProtocol):
+    """QuicConnectionProtocol whose send() waits for room in the window."""
+
+    window = QUIC_WINDOW
+    wire = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queued = 0
+        self.room = asyncio.Event()
+        self.room.set()
+
+    def new_stream(self):
+        return self._quic.get_next_available_stream_id()
+
+    def write(self, sid, data, end_stream=False):
+        """Hands data to the connection (raw QUIC stream by default)."""
+        self._quic.send_stream_data(sid, data, end_stream)
+
+    async def send(self, sid, data, end_stream=False):
+        while self.queued >= self.window:
+            self.room.clear()
+            await self.room.wait()
+        self.write(sid, data, end_stream)
+        self.queued += len(data)
+        self.transmit()
+
+    def drained(self, n):
+        """n bytes left the window."""
+        self.queued = max(self.queued - n, 0)
+        if self.queued < self.window:
+            self.room.set()
+
+    def transmit(self):
+        if self.wire:
+            # What the base class would send, counted on the way out; it
+            # then only re-arms the timer.
+            sent = 0
+            for data, addr in self._quic.datagrams_to_send(
+                    now=self._loop.time()):
+                self._transport.sendto(data, addr)
+                sent += len(data)
+            if sent:
+                self.drained(sent)
+        super().transmit()
@@ -0,0 +1,141 @@
+'''
+Readiness probes for the experiment phases.
+
+Instead of sleeping a fixed time after starting a server, the driver waits
+until the port actually accepts: a TCP connect from the client host, or
+for QUIC a bound UDP socket on the server host followed (when aioquic is
+importable) by a real handshake. Every wait returns how long it took, so
+server start-up times can be reported; a timeout raises TimeoutError.
+wait_drained() does the same for the queues between runs that share a
+network.
+'''
+
+from time import perf_counter, sleep
+import asyncio
+import socket
+import ssl
+
+from netns import in_netns
+from monitor import open_qdisc_sampler, backlog_qdisc
+
+POLL_SEC = 0.01
+
+TCP_LISTEN = '0A'
+
+
+def wait_until(pred, timeout, what):
+    """Polls pred() every POLL_SEC; returns the elapsed seconds."""
+    t0 = perf_counter()
+    while not pred():
+        if perf_counter() - t0 > timeout:
+            raise TimeoutError('%s not ready after %.1f s' % (what, timeout))
+        sleep(POLL_SEC)
+    return perf_counter() - t0
+
+def bound_ports(pid, proto='tcp'):
+    """Local ports of sockets in pid's network namespace, read from
+    /proc/<pid>/net/{tcp,udp}[6]; TCP only counts listening sockets."""
+    ports = set()
+    for fname in ('/proc/%d/net/%s' % (pid, proto),
+                  '/proc/%d/net/%s6' % (pid, proto)):
+        try:
+            lines = open(fname).readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            f = line.split()
+            if proto == 'tcp' and f[3] != TCP_LISTEN:
+                continue
+            ports.add(int(f[1].rsplit(':', 1)[1], 16))
+    return ports
+
+def tcp_accepts(ip, port, netns=None, timeout=0.5):
+    with in_netns(netns):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect((ip, port))
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+def quic_handshake(ip, port, netns=None, timeout=1.0):
+    """True if a QUIC handshake with ip:port completes; None if aioquic
+    is not installed."""
+    try:
+        from aioquic.asyncio import connect
+        from aioquic.quic.configuration import QuicConfiguration
+    except ImportError:
+        return None
+
+    async def handshake():
+        config = QuicConfiguration(is_client=True, alpn_protocols=['h3'],
+                                   verify_mode=ssl.CERT_NONE)
+        async with connect(ip, port, configuration=config):
+            pass
+
+    try:
+        with in_netns(netns):
+            asyncio.run(asyncio.wait_for(handshake(), timeout))
+        return True
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        return False
+
+def wait_tcp(ip, port, netns=None, timeout=10.0):
+    """Waits until ip:port accepts TCP connections from netns."""
+    return wait_until(lambda: tcp_accepts(ip, port, netns), timeout,
+                      'tcp %s:%d' % (ip, port))
+
+def wait_quic(ip, port, server_pid, netns=None, timeout=10.0):
+    """Waits until the server has its UDP port bound and, if aioquic is
+    available, a QUIC handshake from netns succeeds."""
+    t = wait_until(lambda: port in bound_ports(server_pid, 'udp'), timeout,
+                   'udp port %d' % port)
+    t += wait_until(lambda: quic_handshake(ip, port, netns) is not False,
+                    max(timeout - t, POLL_SEC), 'quic %s:%d' % (ip, port))
+    return t
+
+def wait_port_free(server_pid, port, proto='tcp', timeout=10.0):
+    """Waits until nothing in server_pid's namespace holds the port."""
+    return wait_until(lambda: port not in bound_ports(server_pid, proto),
+                      timeout, '%s port %d release' % (proto, port))
+
+def wait_drained(ifaces, timeout=10.0, settle=0.2):
+    """Waits until the queue of every iface is empty and stays empty for
+    settle seconds (nothing in flight refills it)."""
+    sampler = open_qdisc_sampler()
+    empty_since = [None]
+
+    def drained():
+        now = perf_counter()
+        qs = [backlog_qdisc(q) for q in sampler.sample_all(ifaces).values()]
+        if any(q is not None and q.qlen for q in qs):
+            empty_since[0] = None
+            return False
+        if empty_since[0] is None:
+            empty_since[0] = now
+        return now - empty_since[0] >= settle
+
+    try:
+        return wait_until(drained, timeout, 'queues of %s' % ', '.join(ifaces))
+    finally:
+        sampler.close()
+
+
+class StartupLog(object):
+    """Collects (name, seconds) for the per-run start-up report."""
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.rows = []
+
+    def add(self, name, seconds):
+        self.rows.append((name, seconds))
+        return seconds
+
+    def write(self):
+        with open(self.fname, 'w') as f:
+            f.write('name,seconds\n')
+            f.write(''.join('%s,%.4f\n' % r for r in self.rows))
@@ -11,26 +11,21 @@ bwnet=1.5
 bw_host=1000
 delay=5
 
-iperf_port=5001
-
-for qsize in 20 100; do
+qsizes="20 100"
+
+# One network for the whole sweep: bufferbloat.py changes the bottleneck
+# queue in place between runs and writes each one to bb-q$qsize.
+python3 bufferbloat.py \
+    --bw-host $bw_host \
+    --bw-net $bwnet \
+    --delay $delay \
+    --dir bb \
+    --time $time \
+    --queues $qsizes \
+    --cong reno
+
+for qsize in $qsizes; do
     dir=bb-q$qsize
-    
-    # Create output directory if it doesn't exist
-
-    mkdir -p $dir
-
-
-    # TODO: Run bufferbloat.py here...
-    python3 bufferbloat.py \
-        --bw-host $bw_host \
-        --bw-net $bwnet \
-        --delay $delay \
-        --dir $dir \
-        --time $time \
-        --maxq $qsize \
-        --cong reno    
-
 
     # TODO: Ensure the input file names match the ones you use in
     # bufferbloat.py script.  Also ensure the plot file names match
@@ -0,0 +1,68 @@
+'''
+Buffered, bounded-memory sample writer shared by the monitors.
+
+Samples go into a fixed-size ring of slots and are formatted and written
+in one batch when the ring fills up or when flush_interval has passed, so
+a monitor does close to one write syscall per batch instead of one
+open/write/close per sample.
+'''
+
+from time import monotonic
+import signal
+
+
+def _raise_exit(signum, frame):
+    raise SystemExit(0)
+
+def handle_sigterm():
+    """Turns SIGTERM into SystemExit, so `with SampleWriter(...)` blocks
+    flush their tail when start_qmon's Process.terminate() is called."""
+    signal.signal(signal.SIGTERM, _raise_exit)
+
+
+class SampleWriter(object):
+    """Writes samples formatted with fmt (e.g. '%f,%d\\n') to fname.
+
+    append(*fields) stores the raw tuple in the ring; formatting happens
+    at flush time.
+    """
+
+    def __init__(self, fname, fmt, capacity=4096, flush_interval=1.0,
+                 header=None, mode='w'):
+        self.f = open(fname, mode)
+        self.fmt = fmt
+        self.ring = [None] * capacity
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.n = 0
+        self.last_flush = monotonic()
+        if header:
+            self.f.write(header)
+            self.f.flush()
+
+    def append(self, *fields):
+        self.ring[self.n] = fields
+        self.n += 1
+        if (self.n == self.capacity or
+                monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        n = self.n
+        if n:
+            fmt, ring = self.fmt, self.ring
+            self.f.write(''.join([fmt % ring[i] for i in range(n)]))
+            self.f.flush()
+            self.n = 0
+        self.last_flush = monotonic()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,128 @@
+'''
+Runs a sweep of bufferbloat.py experiments in parallel.
+
+Every (cong, maxq) pair becomes one run with its own --instance number
+(so host, switch and interface names don't collide), its own output
+directory and its own set of CPUs (--cpus), and up to --parallel runs are
+in flight at once. Arguments this script does not know are passed to
+every run, e.g.
+
+    sudo python3 sweep.py --congs reno bbr --queues 20 100 \\
+        --bw-net 1.5 --delay 5 --time 90
+
+With --aqms the sweep also covers AQMs on the bottleneck (each run gets
+--aqm, and its directory a -<aqm> suffix on the cong), e.g. whether Reno
+with fq_codel and a 100-packet buffer gets the RTT of a 20-packet one:
+
+    sudo python3 sweep.py --congs reno --queues 20 100 \\
+        --aqms none fq_codel --bw-net 1.5 --delay 5 --time 90
+'''
+
+from argparse import ArgumentParser
+from subprocess import Popen, STDOUT
+from time import time, sleep
+import itertools
+import os
+import sys
+
+parser = ArgumentParser(description="Parallel bufferbloat sweep")
+parser.add_argument('--congs',
+                    nargs='+',
+                    help="Congestion control algorithms to sweep",
+                    default=['reno', 'bbr'])
+parser.add_argument('--queues',
+                    nargs='+',
+                    type=int,
+                    help="Values of --maxq to sweep",
+                    default=[20, 100])
+parser.add_argument('--aqms',
+                    nargs='+',
+                    help="Values of --aqm to sweep (none = drop-tail)",
+                    default=None)
+parser.add_argument('--dir', '-d',
+                    help="Base directory; each run writes to DIR/<cong>-q<maxq>",
+                    default='sweep')
+parser.add_argument('--script',
+                    help="Experiment script (must accept --instance/--cpus)",
+                    default='bufferbloat.py')
+parser.add_argument('--cpus-per-run',
+                    type=int,
+                    help="CPUs pinned to each run",
+                    default=2)
+parser.add_argument('--parallel', '-j',
+                    type=int,
+                    help="Max concurrent runs (default: as many as fit the CPUs)",
+                    default=None)
+parser.add_argument('--plot',
+                    help="Plot queue and RTT of every run when done",
+                    action="store_true",
+                    default=False)
+
+
+def cpu_slots(per_run):
+    """Disjoint CPU sets, as --cpus strings, from this process' affinity."""
+    cpus = sorted(os.sched_getaffinity(0))
+    return [','.join(map(str, cpus[i:i + per_run]))
+            for i in range(0, len(cpus) - per_run + 1, per_run)]
+
+def run_dir(base, cong, q, aqm=None):
+    if aqm is not None:
+        cong = f'{cong}-{aqm}'
+    return os.path.join(base, f'{cong}-q{q}')
+
+def sweep(args, extra):
+    slots = cpu_slots(args.cpus_per_run)
+    if not slots:
+        sys.exit("Não há CPUs suficientes para --cpus-per-run")
+    parallel = min(args.parallel or len(slots), len(slots))
+    jobs = list(enumerate(itertools.product(args.congs, args.aqms or [None],
+                                            args.queues)))
+    running = {}
+    results = []
+    while jobs or running:
+        # Dispara enquanto houver CPUs livres
+        while jobs and len(running) < parallel:
+            k, (cong, aqm, q) = jobs.pop(0)
+            used = set(r[1] for r in running.values())
+            cpus = next(s for s in slots if s not in used)
+            d = run_dir(args.dir, cong, q, aqm)
+            os.makedirs(d, exist_ok=True)
+            cmd = [sys.executable, args.script, '--dir', d, '--maxq', str(q),
+                   '--cong', cong, '--instance', str(k), '--cpus', cpus] + extra
+            if aqm is not None:
+                cmd += ['--aqm', aqm]
+            log = open(os.path.join(d, 'run.log'), 'w')
+            print(f"[{k}] {cong} {aqm or ''} q{q} em CPUs {cpus}: {' '.join(cmd)}")
+            running[k] = (Popen(cmd, stdout=log, stderr=STDOUT), cpus, log,
+                          time(), cong, aqm, q)
+        sleep(0.5)
+        for k, (p, cpus, log, t0, cong, aqm, q) in list(running.items()):
+            if p.poll() is not None:
+                log.close()
+                results.append((k, cong, aqm, q, p.returncode, time() - t0))
+                del running[k]
+    return sorted(results)
+
+def plot(args, results):
+    for k, cong, aqm, q, rc, wall in results:
+        d = run_dir(args.dir, cong, q, aqm)
+        name = os.path.basename(d).rsplit('-q', 1)[0]
+        Popen([sys.executable, 'plot_queue.py', '-f', f'{d}/q.txt',
+               '-o', f'{d}/{name}-buffer-q{q}.png']).wait()
+        Popen([sys.executable, 'plot_ping.py', '-f', f'{d}/ping.txt',
+               '-o', f'{d}/{name}-rtt-q{q}.png']).wait()
+
+if __name__ == "__main__":
+    args, extra = parser.parse_known_args()
+    t0 = time()
+    results = sweep(args, extra)
+    print(f"\nSweep: {len(results)} rodadas em {time() - t0:.1f} s")
+    failed = 0
+    for k, cong, aqm, q, rc, wall in results:
+        ok = rc == 0 and os.path.exists(f'{run_dir(args.dir, cong, q, aqm)}/q.txt')
+        failed += not ok
+        print(f"  [{k}] {cong:6s} {aqm or '':8s} q{q:<4d} {wall:7.1f} s  "
+              f"{'ok' if ok else f'FALHOU ({rc})'}")
+    if args.plot:
+        plot(args, results)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,128 @@
+'''
+Shared-memory live telemetry bus.
+
+A monitor publishes its latest samples into a memory-mapped ring (one
+file per publisher, under /dev/shm when available); the experiment
+driver, a live plot or an early-stop check maps the same file and reads
+the current queue, RTT or rate without tailing text files.
+
+Layout: a header (magic, nslots, next sequence number) followed by
+nslots fixed-size records (seq, time, channel, value). There is a single
+writer per file; readers detect records that were overwritten while they
+read them by re-checking the record's sequence number.
+'''
+
+import mmap
+import os
+import struct
+from time import time, sleep
+
+MAGIC = 0x42425431  # "BBT1"
+HEADER = struct.Struct('=LLQ')
+RECORD = struct.Struct('=Qd24sd')
+SEQ = struct.Struct('=Q')
+
+def bus_path(name, dirname=None):
+    """Path of a bus file in dirname (default /dev/shm, or . without it)."""
+    if dirname is None:
+        dirname = '/dev/shm' if os.path.isdir('/dev/shm') else '.'
+    return os.path.join(dirname, name)
+
+
+class TelemetryBus(object):
+    """Writer side: publish(channel, value) into the ring."""
+
+    def __init__(self, path, nslots=4096):
+        self.path = path
+        self.nslots = nslots
+        size = HEADER.size + nslots * RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.seq = 0
+        HEADER.pack_into(self.mm, 0, MAGIC, nslots, 0)
+
+    def publish(self, channel, value, t=None):
+        seq = self.seq + 1
+        off = HEADER.size + (seq % self.nslots) * RECORD.size
+        # Payload first, then the record's seq, then the header: a reader
+        # that sees the new header also sees a complete record.
+        RECORD.pack_into(self.mm, off, 0, time() if t is None else t,
+                         channel.encode()[:24], value)
+        SEQ.pack_into(self.mm, off, seq)
+        SEQ.pack_into(self.mm, 8, seq)
+        self.seq = seq
+
+    def close(self):
+        self.mm.close()
+
+    def unlink(self):
+        self.close()
+        os.unlink(self.path)
+
+
+class TelemetryReader(object):
+    """Reader side; several readers may map the same bus."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.nslots, _ = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a telemetry bus' % path)
+        self.seq = 0
+
+    def head(self):
+        return HEADER.unpack_from(self.mm, 0)[2]
+
+    def _record(self, seq):
+        off = HEADER.size + (seq % self.nslots) * RECORD.size
+        rseq, t, channel, value = RECORD.unpack_from(self.mm, off)
+        if rseq != seq or SEQ.unpack_from(self.mm, off)[0] != seq:
+            return None
+        return t, channel.rstrip(b'\0').decode(), value
+
+    def poll(self):
+        """New records since the previous poll, as (t, channel, value).
+
+        Records the writer already overwrote are skipped.
+        """
+        head = self.head()
+        start = max(self.seq + 1, head - self.nslots + 1)
+        ret = []
+        for seq in range(start, head + 1):
+            rec = self._record(seq)
+            if rec is not None:
+                ret.append(rec)
+        self.seq = head
+        return ret
+
+    def latest(self):
+        """{channel: (t, value)} with the newest value of every channel
+        still in the ring."""
+        head = self.head()
+        ret = {}
+        for seq in range(head, max(head - self.nslots, 0), -1):
+            rec = self._record(seq)
+            if rec is not None and rec[1] not in ret:
+                ret[rec[1]] = (rec[0], rec[2])
+        return ret
+
+    def close(self):
+        self.mm.close()
+
+
+def open_reader(path, timeout=5.0):
+    """Opens a reader, waiting up to timeout sec for the writer to create
+    the bus; returns None if it never shows up."""
+    deadline = time() + timeout
+    while True:
+        try:
+            return TelemetryReader(path)
+        except (OSError, ValueError):
+            if time() >= deadline:
+                return None
+            sleep(0.05)
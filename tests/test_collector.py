@@ -0,0 +1,18 @@
+from collector import Collector
+
+
+def test_rate_source_on_loopback(tmp_path):
+    fname = str(tmp_path / 'telemetry.txt')
+    c = Collector(fname)
+    c.add_rate(['lo'], 0.05)
+    c.run(0.32)
+    lines = open(fname).read().splitlines()
+    assert lines[0] == 'time,metric,key,value'
+    rows = [l.split(',') for l in lines[1:]]
+    assert {(r[1], r[2]) for r in rows} == {('tx_bps', 'lo'),
+                                           ('rx_bps', 'lo')}
+    times = sorted({float(r[0]) for r in rows})
+    assert 5 <= len(times) <= 7
+    sched = dict(l.split('=') for l in open(fname + '.sched'))
+    assert sched['rate.target_interval_sec'].strip() == '0.050000'
+    assert int(sched['rate.ticks']) == len(times)
@@ -0,0 +1,47 @@
+import pytest
+
+from linktrace import TracePoint, load_trace, trace_period
+
+
+def test_csv_trace_carries_delay_and_loss_forward(tmp_path):
+    fname = tmp_path / 'trace.csv'
+    fname.write_text('# 4G drive\n'
+                     'time_sec,rate_mbps,delay_ms,loss_pct\n'
+                     '0,10\n'
+                     '2.5, 1.5, 40\n'
+                     '\n'
+                     '1,5,20,0.5\n'
+                     '4,8,,\n')
+    assert load_trace(str(fname)) == [
+        TracePoint(0.0, 10.0, None, None),
+        TracePoint(1.0, 5.0, 20.0, 0.5),
+        TracePoint(2.5, 1.5, 40.0, 0.5),
+        TracePoint(4.0, 8.0, 40.0, 0.5)]
+
+def test_points_at_the_same_time_keep_file_order(tmp_path):
+    fname = tmp_path / 'trace.csv'
+    fname.write_text('0,10,20\n0,5\n')
+    assert [p.rate_mbps for p in load_trace(str(fname))] == [10.0, 5.0]
+
+def test_mahimahi_trace_becomes_rate_per_window(tmp_path):
+    fname = tmp_path / 'trace.up'
+    # 0-99 ms: 3 packets, 100-199 ms: none, 200-299 ms: 1 packet
+    fname.write_text('0\n10\n99\n250\n')
+    points = load_trace(str(fname), window=0.1)
+    assert [p.time for p in points] == [0.0, 0.1, 0.2]
+    assert points[0].rate_mbps == pytest.approx(3 * 1500 * 8 / 0.1 / 1e6)
+    assert points[1].rate_mbps == 0.001
+    assert points[2].rate_mbps == pytest.approx(0.12)
+    assert points[0].delay_ms is None and points[0].loss_pct is None
+
+def test_empty_trace_is_an_error(tmp_path):
+    fname = tmp_path / 'empty.csv'
+    fname.write_text('time_sec,rate_mbps\n# nothing\n')
+    with pytest.raises(ValueError):
+        load_trace(str(fname))
+
+def test_trace_period():
+    points = [TracePoint(0.0, 1, None, None), TracePoint(1.0, 2, None, None),
+              TracePoint(3.0, 3, None, None)]
+    assert trace_period(points) == 5.0
+    assert trace_period(points[:1]) == 1.0
@@ -0,0 +1,63 @@
+import math
+
+from monitor import parse_tc_qdisc, parse_tc_xstats
+
+TC_OUTPUT = b'''\
+qdisc htb 5: dev s0-eth2 root refcnt 2 r2q 10 default 0x1 direct_packets_stat 0
+ Sent 1523400 bytes 1012 pkt (dropped 7, overlimits 96 requeues 1)
+ backlog 22.5Kb 15p requeues 1
+qdisc netem 10: dev s0-eth2 parent 5:1 limit 100 delay 10ms
+ Sent 1523400 bytes 1012 pkt (dropped 0, overlimits 0 requeues 0)
+ backlog 0b 0p requeues 0
+qdisc noqueue 0: dev lo root refcnt 2
+ Sent 0 bytes 0 pkt (dropped 0, overlimits 0 requeues 0)
+ backlog 0b 0p requeues 0
+'''
+
+
+def test_parse_tc_qdisc_counters_in_print_order():
+    qs = parse_tc_qdisc(TC_OUTPUT, ifindex=3)
+    assert [(q.kind, q.handle, q.parent) for q in qs] == [
+        ('htb', '5:', 'root'), ('netem', '10:', '5:1'),
+        ('noqueue', '0:', 'root')]
+    htb = qs[0]
+    assert htb.ifindex == 3
+    assert (htb.bytes, htb.packets, htb.drops, htb.overlimits,
+            htb.requeues) == (1523400, 1012, 7, 96, 1)
+    assert (htb.qlen, htb.backlog) == (15, int(22.5 * 1024))
+    assert htb.ecn_marks == 0 and math.isnan(htb.aqm_delay_ms)
+
+def test_parse_tc_qdisc_groups_by_dev():
+    devs = {'s0-eth2': [], 'h1-eth0': []}
+    parse_tc_qdisc(TC_OUTPUT, devs=devs)
+    assert [q.kind for q in devs['s0-eth2']] == ['htb', 'netem']
+    assert devs['h1-eth0'] == []
+
+def test_parse_tc_qdisc_without_dev():
+    out = (b'qdisc netem 10: parent 5:1 limit 100 delay 10ms\n'
+           b' Sent 60 bytes 1 pkt (dropped 0, overlimits 0 requeues 0)\n'
+           b' backlog 1514b 1p requeues 0\n')
+    [q] = parse_tc_qdisc(out)
+    assert (q.kind, q.qlen, q.backlog) == ('netem', 1, 1514)
+
+
+def test_parse_tc_qdisc_aqm_lines():
+    out = (b'qdisc codel 8001: dev s0-eth2 parent 5:1 limit 1000p '
+           b'target 5ms interval 100ms ecn\n'
+           b' Sent 9000 bytes 6 pkt (dropped 1, overlimits 0 requeues 0)\n'
+           b' backlog 3028b 2p requeues 0\n'
+           b'  count 1 lastcount 0 ldelay 2.5ms drop_next 0us\n'
+           b'  maxpacket 1514 ecn_mark 4 drop_overlimit 0\n')
+    [q] = parse_tc_qdisc(out)
+    assert (q.kind, q.ecn_marks, q.aqm_delay_ms) == ('codel', 4, 2.5)
+
+def test_parse_tc_xstats_pie_and_cake():
+    assert parse_tc_xstats('pie', b'  prob 0 delay 1200us\n'
+                                  b'  pkts_in 10 overlimit 0 dropped 0 '
+                                  b'maxq 3 ecn_mark 2\n') == (2, 1.2)
+    cake = (b'                   Bulk  Best Effort        Voice\n'
+            b'  av_delay         10us        1.5ms         20us\n'
+            b'  marks               1            5            0\n')
+    assert parse_tc_xstats('cake', cake) == (6, 1.5)
+    marks, delay = parse_tc_xstats('fq_codel', b'  maxpacket 1514\n')
+    assert marks == 0 and math.isnan(delay)
@@ -0,0 +1,182 @@
+import math
+import socket
+import struct
+
+import pytest
+
+import netlink
+from netlink import (RTATTR, TCMSG, GNET_BASIC, GNET_QUEUE, TC_STATS,
+                     TCA_KIND, TCA_STATS, TCA_STATS2, TCA_STATS_BASIC,
+                     TCA_STATS_QUEUE, parse_attrs, format_handle)
+
+
+def rta(atype, payload):
+    """One rtattr, padded to 4 bytes like the kernel sends it."""
+    attr = RTATTR.pack(RTATTR.size + len(payload), atype) + payload
+    return attr + bytes(-len(attr) % 4)
+
+def tcmsg(ifindex, handle, parent, *attrs):
+    return TCMSG.pack(0, ifindex, handle, parent, 0) + b''.join(attrs)
+
+
+def test_parse_attrs_skips_padding_and_masks_flags():
+    data = rta(1, b'abc') + rta(2 | 0x8000, b'\1\2\3\4\5')
+    assert parse_attrs(data) == {1: b'abc', 2: b'\1\2\3\4\5'}
+
+def test_parse_attrs_stops_at_truncated_attr():
+    data = rta(1, b'abcd') + RTATTR.pack(2, 3)
+    assert parse_attrs(data) == {1: b'abcd'}
+
+def test_format_handle():
+    assert format_handle(0xffffffff) == 'root'
+    assert format_handle(0x50000) == '5:'
+    assert format_handle(0x10001) == '1:1'
+    assert format_handle(0xa0000 | 0x1f) == 'a:1f'
+
+def test_parse_qdisc_stats2():
+    stats = (rta(TCA_STATS_BASIC, GNET_BASIC.pack(123456, 789)) +
+             rta(TCA_STATS_QUEUE, GNET_QUEUE.pack(12, 18000, 3, 1, 40)))
+    body = tcmsg(7, 0x50000, 0x10001,
+                 rta(TCA_KIND, b'netem\0'), rta(TCA_STATS2, stats))
+    q = netlink._parse_qdisc(body)
+    assert q[:11] == (7, '5:', '1:1', 'netem', 123456, 789, 12, 18000,
+                      3, 1, 40)
+    assert q.ecn_marks == 0 and math.isnan(q.aqm_delay_ms)
+
+def test_parse_qdisc_legacy_tc_stats():
+    body = tcmsg(2, 0x10000, 0xffffffff, rta(TCA_KIND, b'htb\0'),
+                 rta(TCA_STATS, TC_STATS.pack(1000, 10, 2, 5, 0, 0, 4, 6000)))
+    q = netlink._parse_qdisc(body)
+    assert (q.handle, q.parent, q.kind) == ('1:', 'root', 'htb')
+    assert (q.bytes, q.packets, q.drops, q.overlimits) == (1000, 10, 2, 5)
+    assert (q.qlen, q.backlog, q.requeues) == (4, 6000, 0)
+
+def test_parse_qdisc_without_stats():
+    q = netlink._parse_qdisc(tcmsg(1, 0, 0xffffffff,
+                                   rta(TCA_KIND, b'noqueue\0')))
+    assert (q.kind, q.bytes, q.qlen, q.backlog) == ('noqueue', 0, 0, 0)
+
+
+def test_xstats_fq_codel():
+    data = netlink.FQ_CODEL_XSTATS.pack(0, 1514, 0, 42)
+    ecn, delay = netlink.parse_xstats('fq_codel', data)
+    assert ecn == 42 and math.isnan(delay)
+    # Type 1 is a per-class (flow) record, not the qdisc's
+    assert netlink.parse_xstats('fq_codel',
+                                netlink.FQ_CODEL_XSTATS.pack(1, 0, 0, 9))[0] == 0
+
+def test_xstats_codel():
+    data = netlink.CODEL_XSTATS.pack(1514, 3, 2, 4500, -10, 0, 7)
+    assert netlink.parse_xstats('codel', data) == (7, 4.5)
+
+def test_xstats_pie_both_layouts():
+    new = netlink.PIE_XSTATS.pack(1 << 40, 12000, 0, 1, 100, 2, 0, 10, 5)
+    old = netlink.PIE_XSTATS_OLD.pack(1000, 12000, 0, 100, 2, 0, 10, 5)
+    assert netlink.parse_xstats('pie', new) == (5, 12.0)
+    assert netlink.parse_xstats('pie', old) == (5, 12.0)
+
+def test_xstats_cake_sums_marks_and_takes_worst_tin_delay():
+    def tin(marks, delay_us):
+        return (rta(netlink.TCA_CAKE_TIN_STATS_ECN_MARKED_PACKETS,
+                    struct.pack('=L', marks)) +
+                rta(netlink.TCA_CAKE_TIN_STATS_AVG_DELAY_US,
+                    struct.pack('=L', delay_us)))
+    tins = rta(1, tin(3, 800)) + rta(2, tin(4, 2500)) + rta(3, tin(0, 100))
+    data = rta(netlink.TCA_CAKE_STATS_TIN_STATS, tins)
+    assert netlink.parse_xstats('cake', data) == (7, 2.5)
+
+def test_xstats_short_payload():
+    ecn, delay = netlink.parse_xstats('codel', b'\0' * 8)
+    assert ecn == 0 and math.isnan(delay)
+
+def test_parse_qdisc_reads_aqm_xstats():
+    stats = (rta(TCA_STATS_BASIC, GNET_BASIC.pack(1000, 10)) +
+             rta(TCA_STATS_QUEUE, GNET_QUEUE.pack(2, 3000, 1, 0, 0)) +
+             rta(netlink.TCA_STATS_APP,
+                 netlink.CODEL_XSTATS.pack(1514, 1, 0, 2000, 0, 0, 3)))
+    q = netlink._parse_qdisc(tcmsg(4, 0x20000, 0x10001, rta(TCA_KIND, b'codel\0'),
+                                   rta(TCA_STATS2, stats)))
+    assert (q.kind, q.qlen, q.drops, q.ecn_marks, q.aqm_delay_ms) == \
+        ('codel', 2, 1, 3, 2.0)
+
+
+def diag_msg(family, src, sport, dst, dport, state, *attrs):
+    alen = 4 if family == socket.AF_INET else 16
+    sockid = netlink.INET_DIAG_SOCKID.pack(
+        sport, dport, socket.inet_pton(family, src).ljust(16, b'\0'),
+        socket.inet_pton(family, dst).ljust(16, b'\0')) + bytes(8)
+    assert len(socket.inet_pton(family, src)) == alen
+    return (netlink.INET_DIAG_MSG.pack(family, state, 0, 0, sockid,
+                                       0, 0, 0, 0, 0) + b''.join(attrs))
+
+def tcp_info(**fields):
+    # Field indexes in netlink.TCP_INFO
+    index = dict(ca_state=1, mss=10, unacked=12, sacked=13, lost=14,
+                 retrans=15, rtt=23, rttvar=24, ssthresh=25, cwnd=26,
+                 total_retrans=31, pacing_rate=32, bytes_acked=34,
+                 min_rtt=39, delivery_rate=42)
+    f = [0] * 43
+    for k, v in fields.items():
+        f[index[k]] = v
+    return netlink.TCP_INFO.pack(*f)
+
+
+def test_parse_tcp_cubic():
+    info = tcp_info(ca_state=3, mss=1448, unacked=20, sacked=2, lost=1,
+                    retrans=1, rtt=21500, rttvar=1250, ssthresh=14, cwnd=18,
+                    total_retrans=5, pacing_rate=netlink.UINT64_MAX,
+                    bytes_acked=10 ** 9, min_rtt=20000,
+                    delivery_rate=1250000)
+    body = diag_msg(socket.AF_INET, '10.0.0.1', 40000, '10.0.0.2', 5001,
+                    netlink.TCP_ESTABLISHED,
+                    rta(netlink.INET_DIAG_INFO, info),
+                    rta(netlink.INET_DIAG_CONG, b'cubic\0'))
+    t = netlink._parse_tcp(body)
+    assert (t.src, t.sport, t.dst, t.dport) == ('10.0.0.1', 40000,
+                                               '10.0.0.2', 5001)
+    assert (t.state, t.cong, t.ca_state) == ('established', 'cubic',
+                                             'recovery')
+    assert (t.mss, t.cwnd, t.ssthresh, t.inflight) == (1448, 18, 14, 18)
+    assert (t.srtt_ms, t.rttvar_ms, t.min_rtt_ms) == (21.5, 1.25, 20.0)
+    assert (t.retrans, t.lost, t.total_retrans) == (1, 1, 5)
+    assert (t.delivery_rate, t.bytes_acked) == (1250000, 10 ** 9)
+    assert math.isnan(t.pacing_rate) and math.isnan(t.bbr_bw)
+
+def test_parse_tcp_bbr_ipv6_and_short_tcp_info():
+    info = tcp_info(cwnd=40, rtt=5000, pacing_rate=3000000)
+    bbr = netlink.TCP_BBR_INFO.pack(0x1000, 1, 4800, 256, 512)
+    body = diag_msg(socket.AF_INET6, '::1', 443, 'fe80::2', 50000, 2,
+                    rta(netlink.INET_DIAG_INFO, info[:72]),
+                    rta(netlink.INET_DIAG_BBRINFO, bbr))
+    t = netlink._parse_tcp(body)
+    assert (t.src, t.dst, t.state, t.cong) == ('::1', 'fe80::2',
+                                               'syn_sent', '-')
+    assert (t.bbr_bw, t.bbr_min_rtt_ms) == (1 << 32 | 0x1000, 4.8)
+    # Truncated after rtt: cwnd and pacing_rate read as 0
+    assert (t.srtt_ms, t.cwnd, t.pacing_rate) == (5.0, 0, 0)
+
+def test_parse_tcp_without_info():
+    body = diag_msg(socket.AF_INET, '10.0.0.1', 1, '10.0.0.2', 2, 1)
+    assert netlink._parse_tcp(body) is None
+
+def test_tcp_info_sampler_sees_a_loopback_connection():
+    try:
+        sampler = netlink.TcpInfoSampler()
+    except OSError:
+        pytest.skip('no sock_diag here')
+    srv = socket.create_server(('127.0.0.1', 0))
+    port = srv.getsockname()[1]
+    cli = socket.create_connection(('127.0.0.1', port))
+    conn, _ = srv.accept()
+    try:
+        cli.sendall(b'x' * 100000)
+        conn.recv(65536)
+        sampler.ports = {port}
+        infos = sampler.sample()
+        assert sorted((t.sport == port, t.state) for t in infos) == [
+            (False, 'established'), (True, 'established')]
+        assert all(t.mss > 0 and t.srtt_ms > 0 for t in infos)
+    finally:
+        for s in (cli, conn, srv):
+            s.close()
+        sampler.close()
@@ -0,0 +1,65 @@
+import os
+
+from pagetree import parse_page, build_site, synthetic_size
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE = '''<html><head>
+<link rel="stylesheet" href="css/site.css">
+<link rel="canonical" href="http://origin/elsewhere.html">
+<link rel="icon" href="http://cdn.example.com/favicon.ico">
+<script src="app.js"></script>
+<style>body { background: url('img/bg.png') }</style>
+</head><body>
+<img src="img/photo.jpg" width="400" height="300">
+<img src="data:image/gif;base64,R0lGOD">
+<img src="app.js">
+<a href="next.html">not fetched</a>
+<div style="background-image: url(img/tile.gif)"></div>
+</body></html>
+'''
+
+CSS = '@import "base.css";\n.logo { background: url(../img/logo.svg) }\n'
+
+
+def write_page(tmp_path):
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'page.html').write_text(PAGE)
+    (tmp_path / 'css' / 'site.css').write_text(CSS)
+    return str(tmp_path / 'page.html')
+
+
+def test_parse_page_collects_the_dependency_tree(tmp_path):
+    tree = parse_page(write_page(tmp_path))
+    assert tree.paths() == [
+        '/page.html', '/css/site.css', '/cdn.example.com/favicon.ico',
+        '/app.js', '/img/bg.png', '/img/photo.jpg', '/img/tile.gif',
+        '/css/base.css', '/img/logo.svg']
+    parents = tree.parents()
+    assert parents['/css/site.css'] == '/page.html'
+    assert parents['/img/logo.svg'] == '/css/site.css'
+    assert parents['/css/base.css'] == '/css/site.css'
+    assert tree.depth('/img/logo.svg') == 2
+
+def test_local_files_are_kept_and_missing_ones_sized(tmp_path):
+    tree = parse_page(write_page(tmp_path))
+    parent, size, src = tree.objects['/css/site.css']
+    assert size is None and src == str(tmp_path / 'css' / 'site.css')
+    # Declared dimensions scale the image size
+    assert tree.objects['/img/photo.jpg'][1] == \
+        synthetic_size('/img/photo.jpg', 400 * 300)
+    assert synthetic_size('/app.js') == synthetic_size('/app.js')
+
+def test_build_site_writes_every_object(tmp_path):
+    page = write_page(tmp_path)
+    site = tmp_path / 'site'
+    tree = build_site(page, str(site))
+    for path in tree.paths():
+        assert os.path.getsize(site / path.lstrip('/')) == \
+            tree.file_size(path)
+    assert (site / 'css' / 'site.css').read_text() == CSS
+
+def test_shipped_index_page():
+    tree = parse_page(os.path.join(REPO, 'index.html'))
+    assert len(tree.paths()) == 96
+    assert tree.paths()[0] == '/index.html'
@@ -0,0 +1,81 @@
+from multiprocessing import Process
+import math
+import select
+
+import pytest
+
+from prober import (ProbeTracker, SendOrder, UdpEcho, UdpProber,
+                    open_prober, probe)
+
+
+def test_tracker_matches_replies_and_drops_strays():
+    t = ProbeTracker(timeout=2.0)
+    assert t.sent(10.0) == 1
+    assert t.sent(10.1) == 2
+    assert t.reply(2, 0.005) == (10.1, 2, 5.0, 0)
+    assert t.reply(2, 0.005) is None
+    assert t.reply(99, 0.005) is None
+    assert list(t.pending) == [1]
+
+def test_tracker_keeps_full_seq_across_wire_wrap():
+    t = ProbeTracker()
+    t.seq = 0xffff - 1
+    assert t.sent(1.0) == 0xffff
+    assert t.sent(2.0) == 0
+    assert t.reply(0, 0.001)[1] == 0x10000
+    assert t.reply(0xffff, 0.001)[1] == 0xffff
+
+def test_tracker_expires_and_flushes_as_lost():
+    t = ProbeTracker(timeout=1.0)
+    for i in range(3):
+        t.sent(10.0 + i)
+    [(when, seq, rtt, lost)] = t.expire(11.5)
+    assert (when, seq, lost) == (10.0, 1, 1) and math.isnan(rtt)
+    assert sorted(row[1] for row in t.flush()) == [2, 3]
+    assert t.pending == {} and t.expire(100.0) == []
+
+def test_send_order_holds_rows_until_earlier_probes_settle():
+    order = SendOrder()
+    assert order.push([(10.2, 3, 1.0, 0)]) == []
+    assert order.push([(10.1, 2, 1.0, 0)]) == []
+    assert [r[1] for r in order.push([(10.0, 1, 1.0, 0)])] == [1, 2, 3]
+    assert [r[1] for r in order.push([(10.3, 4, 1.0, 0)])] == [4]
+    assert order.push([]) == []
+
+def test_udp_echo_round_trip_on_loopback():
+    echo = UdpEcho(port=0)
+    port = echo.sock.getsockname()[1]
+    prober = UdpProber('127.0.0.1', port)
+    try:
+        prober.send(0x10005)
+        select.select([echo], [], [], 1.0)
+        echo.serve()
+        select.select([prober], [], [], 1.0)
+        seq, rtt = prober.recv()
+        assert seq == 5 and 0 <= rtt < 1.0
+        assert prober.recv() is None
+    finally:
+        prober.close()
+        echo.close()
+
+def test_probe_writes_rows_in_send_order(tmp_path):
+    try:
+        p = open_prober('127.0.0.1')
+    except OSError:
+        pytest.skip('no ICMP socket here')
+    p.close()
+    if isinstance(p, UdpProber):
+        pytest.skip('no ICMP socket here')
+    fname = str(tmp_path / 'ping.txt')
+    proc = Process(target=probe, args=(fname, '127.0.0.1', 0.01),
+                   kwargs=dict(duration=0.3))
+    proc.start()
+    proc.join(10)
+    assert proc.exitcode == 0
+    lines = open(fname).read().splitlines()
+    assert lines[0] == 'time,seq,rtt_ms,lost'
+    rows = [line.split(',') for line in lines[1:]]
+    assert [int(r[1]) for r in rows] == list(range(1, len(rows) + 1))
+    assert len(rows) >= 10
+    assert sum(int(r[3]) for r in rows) <= 1
+    assert (tmp_path / 'ping.txt.sched').exists()
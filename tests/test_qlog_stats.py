@@ -0,0 +1,108 @@
+import io
+import json
+import re
+
+import pytest
+
+import qlog_stats
+from qlog_stats import EventStream, read_events, summarize
+
+REF = 1700000000000.0
+
+
+def event(t, name, **data):
+    return {'time': t, 'name': name, 'data': data}
+
+def sent(t, pn, length=1200, ptype='1RTT'):
+    return event(t, 'transport:packet_sent',
+                 header={'packet_type': ptype, 'packet_number': pn},
+                 raw={'length': length})
+
+def trace(odcid, events):
+    return {'common_fields': {'ODCID': odcid, 'reference_time': REF},
+            'vantage_point': {'type': 'server'}, 'events': events}
+
+EVENTS = [
+    sent(0.0, 0, 1250, 'initial'),
+    event(0.5, 'transport:packet_received',
+          header={'packet_type': 'handshake', 'packet_number': 0}),
+    sent(1.0, 0), sent(1.5, 1), sent(2.0, 7),
+    event(2.0, 'recovery:metrics_updated', cwnd=14000, bytes_in_flight=2400,
+          smoothed_rtt=20.5, latest_rtt=21.0, min_rtt=20.0,
+          rtt_variance=1.0),
+    event(4.0, 'recovery:metrics_updated', bytes_in_flight=1200),
+    event(30.0, 'recovery:metrics_updated', cwnd=7000, ssthresh=7000,
+          latest_rtt=40.0),
+    event(30.0, 'recovery:packet_lost',
+          header={'packet_type': '1RTT', 'packet_number': 1}),
+    event(35.0, 'recovery:metrics_updated', bytes_in_flight=0),
+]
+
+
+def write_json(path, *traces):
+    doc = {'qlog_format': 'JSON', 'qlog_version': '0.3',
+           'traces': list(traces)}
+    path.write_text(json.dumps(doc, indent=1))
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk', [1, 7, 64, 1 << 16])
+def test_event_stream_across_chunk_boundaries(chunk):
+    text = '  [{"a": [1, 2, {"b": "x]y"}]}, \n{"c": "%s"}]' % ('z' * 300)
+    s = EventStream(io.StringIO(text), chunk)
+    # At most one chunk of the skipped text comes back
+    assert s.find(re.compile(r'\[')) == '  '[-chunk:]
+    assert s.decode() == {'a': [1, 2, {'b': 'x]y'}]}
+    assert s.peek() == '{'
+    assert s.decode() == {'c': 'z' * 300}
+    assert s.peek() == ']'
+    s.pos += 1
+    assert s.peek() == ''
+
+def test_event_stream_window_stays_bounded():
+    text = '{"events": [%s]}' % ', '.join(['{"n": %d}' % i
+                                            for i in range(5000)])
+    s = EventStream(io.StringIO(text), 256)
+    s.find(qlog_stats.pat_events)
+    n = 0
+    while s.peek() != ']':
+        assert s.decode() == {'n': n}
+        n += 1
+        assert len(s.buf) < 4 * 256
+    assert n == 5000
+
+def test_read_events_json_with_two_traces(tmp_path):
+    fname = write_json(tmp_path / 'x.qlog', trace('aa', EVENTS[:2]),
+                       trace('bb', EVENTS[2:3]))
+    got = [(odcid, ref, e['time']) for odcid, ref, e in read_events(fname)]
+    assert got == [('aa', REF, 0.0), ('aa', REF, 0.5), ('bb', REF, 1.0)]
+
+def test_read_events_json_seq(tmp_path):
+    header = {'qlog_format': 'JSON-SEQ', 'qlog_version': '0.3',
+              'trace': {'common_fields': {'ODCID': 'cc',
+                                          'reference_time': REF}}}
+    fname = tmp_path / 'x.sqlog'
+    fname.write_text(''.join('\x1e' + json.dumps(r) + '\n'
+                             for r in [header] + EVENTS[:3]))
+    got = [(odcid, e['name']) for odcid, ref, e in read_events(str(fname))]
+    assert got == [('cc', 'transport:packet_sent'),
+                   ('cc', 'transport:packet_received'),
+                   ('cc', 'transport:packet_sent')]
+
+def test_summarize(tmp_path):
+    write_json(tmp_path / 'aa.qlog', trace('aa', EVENTS))
+    assert summarize([str(tmp_path)], str(tmp_path), interval=0.01) == 1
+    rows = [l.split(',') for l in
+            (tmp_path / 'quic_metrics.txt').read_text().splitlines()[1:]]
+    # 4.0 ms is within --interval of 2.0 ms; the last state is kept
+    assert [float(r[0]) for r in rows] == [(REF + t) / 1e3
+                                           for t in (2.0, 30.0, 35.0)]
+    assert rows[1][1:] == ['aa', '7000', '1200', '7000', '20.500',
+                           '40.000', '20.000', '1.000']
+    assert rows[2][3] == '0'
+    losses = (tmp_path / 'quic_losses.txt').read_text().splitlines()
+    assert losses[1].split(',')[1:] == ['aa', 'application', '1']
+    spaces = (tmp_path / 'quic_spaces.txt').read_text().splitlines()
+    assert spaces[1:] == ['aa,application,3,0,1,3600,7',
+                          'aa,handshake,0,1,0,0,-1',
+                          'aa,initial,1,0,0,1250,0']
@@ -0,0 +1,49 @@
+import samplewriter
+from samplewriter import SampleWriter
+
+
+def test_ring_flushes_when_full(tmp_path):
+    fname = tmp_path / 'q.txt'
+    w = SampleWriter(fname, '%d,%s\n', capacity=3, flush_interval=3600,
+                     header='n,name\n')
+    w.append(1, 'a')
+    w.append(2, 'b')
+    assert fname.read_text() == 'n,name\n'
+    w.append(3, 'c')
+    assert fname.read_text() == 'n,name\n1,a\n2,b\n3,c\n'
+    assert w.n == 0
+    w.append(4, 'd')
+    w.close()
+    assert fname.read_text().endswith('3,c\n4,d\n')
+    w.close()
+
+def test_flushes_after_interval(tmp_path, monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(samplewriter, 'monotonic', lambda: now[0])
+    fname = tmp_path / 'q.txt'
+    w = SampleWriter(fname, '%f\n', capacity=100, flush_interval=1.0)
+    w.append(0.5)
+    now[0] += 0.5
+    w.append(1.0)
+    assert fname.read_text() == ''
+    now[0] += 0.5
+    w.append(1.5)
+    assert fname.read_text().splitlines() == ['0.500000', '1.000000',
+                                              '1.500000']
+    w.close()
+
+def test_context_manager_writes_tail(tmp_path):
+    fname = tmp_path / 'q.txt'
+    with SampleWriter(fname, '%d\n', flush_interval=3600) as w:
+        for i in range(5):
+            w.append(i)
+    assert fname.read_text() == '0\n1\n2\n3\n4\n'
+    assert w.f.closed
+
+def test_append_mode_keeps_earlier_runs(tmp_path):
+    fname = tmp_path / 'q.txt'
+    with SampleWriter(fname, '%d\n') as w:
+        w.append(1)
+    with SampleWriter(fname, '%d\n', mode='a') as w:
+        w.append(2)
+    assert fname.read_text() == '1\n2\n'
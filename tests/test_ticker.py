@@ -0,0 +1,84 @@
+import asyncio
+
+from ticker import Ticker, periodic
+
+
+class FakeClock(object):
+
+    def __init__(self, now=10.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadlines_do_not_drift():
+    clock = FakeClock()
+    t = Ticker(0.1, clock=clock)
+    for k in range(1, 6):
+        # Work in the tick overruns a little; the next deadline stays put
+        clock.now += 0.13 if k == 1 else 0.07
+        assert abs(t.advance() - (10.0 + k * 0.1)) < 1e-9
+    assert t.missed == 0
+
+def test_overrun_periods_are_skipped_and_counted():
+    clock = FakeClock()
+    t = Ticker(0.1, clock=clock)
+    clock.now += 0.35
+    assert abs(t.advance() - 10.3) < 1e-9
+    assert t.missed == 2
+    assert abs(t.advance() - 10.4) < 1e-9
+    assert t.missed == 2
+
+def test_jitter_histogram():
+    t = Ticker(0.01, clock=FakeClock())
+    for jitter in [0.000003] * 98 + [0.0005, 0.002]:
+        t.record(jitter)
+    assert t.ticks == 100
+    assert t.jitter_max == 0.002
+    # 3 us falls in the (2, 4] us bucket, 2 ms in (1024, 2048] us
+    assert t.jitter_pct(0.50) == 4e-6
+    assert t.jitter_pct(0.99) == 512e-6
+    assert t.jitter_pct(1.0) == 2048e-6
+
+def test_wait_returns_at_or_after_each_deadline():
+    t = Ticker(0.005)
+    for k in range(1, 11):
+        now = t.wait()
+        assert now >= t.start + k * 0.005 - 1e-9
+    assert t.ticks + t.missed == 10
+    report = dict(t.report())
+    assert report['ticks'] == str(t.ticks)
+    assert report['target_interval_sec'] == '0.005000'
+
+
+class Meter(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def begin(self):
+        self.calls += 1
+
+    def end(self):
+        pass
+
+
+def test_periodic_samples_on_loop_deadlines():
+    async def run():
+        loop = asyncio.get_running_loop()
+        ticker = Ticker(0.01, clock=loop.time)
+        stamps = []
+        meter = Meter()
+        task = asyncio.ensure_future(
+            periodic(ticker, stamps.append, lambda: 1000 + loop.time(), meter))
+        await asyncio.sleep(0.105)
+        task.cancel()
+        return ticker, stamps, meter
+
+    ticker, stamps, meter = asyncio.run(run())
+    assert 8 <= len(stamps) <= 11
+    assert meter.calls == len(stamps) == ticker.ticks
+    # Not before the first deadline; stamps come from the given clock
+    assert stamps[0] - 1000 >= ticker.start + 0.01
+    assert all(b > a for a, b in zip(stamps, stamps[1:]))
@@ -0,0 +1,38 @@
+import socket
+
+import pytest
+
+from trafficgen import TrafficGen
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def summary(fname):
+    lines = open(fname + '.summary').read().splitlines()
+    assert lines[0] == 'flow,proto,cong,bytes,goodput_mbps'
+    return dict((l.split(',')[0], l.split(',')[1:]) for l in lines[1:])
+
+
+def test_tcp_flow_on_loopback(tmp_path):
+    fname = str(tmp_path / 'flows.csv')
+    gen = TrafficGen(fname, 0.1)
+    gen.add_tcp(None, None, '127.0.0.1', port=free_port())
+    gen.run(0.5)
+    rows = [l.split(',') for l in open(fname).read().splitlines()[1:]]
+    assert {r[1] for r in rows} == {'tcp0', 'all'}
+    assert 8 <= len(rows) <= 12
+    s = summary(fname)
+    assert s['tcp0'][:2] == ['tcp', '-'] and int(s['tcp0'][2]) > 0
+    assert s['all'][2] == s['tcp0'][2]
+
+def test_quic_flow_on_loopback(tmp_path):
+    pytest.importorskip('aioquic')
+    fname = str(tmp_path / 'flows.csv')
+    gen = TrafficGen(fname, 0.5)
+    gen.add_quic(None, None, '127.0.0.1', port=free_port(socket.SOCK_DGRAM))
+    gen.run(1.0)
+    s = summary(fname)
+    assert s['quic0'][0] == 'quic' and int(s['quic0'][2]) > 0
@@ -0,0 +1,109 @@
+import asyncio
+import os
+
+import pytest
+
+from fetchagent import Timing, http_get
+from webserve import CHUNK, Site, http_connection
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeLoop(object):
+    """loop.time() that moves step seconds on every call."""
+
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def time(self):
+        self.now += self.step
+        return self.now
+
+
+@pytest.mark.parametrize('n', [0, 1, CHUNK - 1, CHUNK, CHUNK + 1,
+                               5 * CHUNK + 123])
+def test_bytes_body_has_exact_length(n):
+    status, ctype, length, chunks = Site(None).route('/bytes/%d' % n, None)
+    assert (status, length) == (200, n)
+    assert sum(len(c) for c in chunks) == n
+
+def test_stream_body_ends_by_time():
+    loop = FakeLoop(0.1)
+    status, ctype, length, chunks = Site(None).route('/stream/2', loop)
+    assert (status, length) == (200, None)
+    n = sum(1 for _ in chunks)
+    assert 18 <= n <= 20
+    assert loop.now >= 2.0
+
+def test_files_and_missing_paths(tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'a' / 'index.html').write_bytes(b'<html></html>')
+    (tmp_path / 'style.css').write_bytes(b'body {}')
+    site = Site(str(tmp_path))
+    status, ctype, length, chunks = site.route('/a/', None)
+    assert (status, ctype, b''.join(chunks)) == (200, 'text/html',
+                                                 b'<html></html>')
+    status, ctype, length, chunks = site.route('/style.css?v=2', None)
+    assert (status, ctype, length) == (200, 'text/css', 7)
+    assert site.route('/missing.js', None)[0] == 404
+    assert site.route('/../' + os.path.basename(REPO) + '/x', None)[0] == 404
+    assert Site(None).route('/index.html', None)[0] == 404
+
+
+async def http_loopback(requests):
+    site = Site(None)
+    server = await asyncio.start_server(
+        lambda r, w: http_connection(site, r, w), '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    ret = []
+    try:
+        for path in requests:
+            t = Timing(loop)
+            keep = await http_get(reader, writer, '127.0.0.1', port, path, t)
+            ret.append((t, keep))
+    finally:
+        writer.close()
+        server.close()
+    return ret
+
+def test_http_bytes_and_stream_on_loopback():
+    [(b, keep), (s, _)] = asyncio.run(
+        http_loopback(['/bytes/300001', '/stream/0.5']))
+    assert (b.status, b.nbytes, keep) == (200, 300001, True)
+    assert s.status == 200 and s.nbytes >= CHUNK
+    assert 0.45 <= s.end - s.sent < 1.5
+
+
+async def h3_loopback(requests):
+    from aioquic.asyncio import serve
+    from aioquic.h3.connection import H3_ALPN
+    from aioquic.quic.configuration import QuicConfiguration
+    from fetchagent import open_quic, close_quic
+    from webserve import H3Server
+
+    config = QuicConfiguration(is_client=False, alpn_protocols=H3_ALPN)
+    config.load_cert_chain(os.path.join(REPO, 'cert.pem'),
+                           os.path.join(REPO, 'key.pem'))
+    H3Server.site = Site(None)
+    server = await serve('127.0.0.1', 0, configuration=config,
+                         create_protocol=H3Server)
+    port = server._transport.get_extra_info('sockname')[1]
+    loop = asyncio.get_running_loop()
+    client = (await open_quic('127.0.0.1', port))[0]
+    try:
+        return await asyncio.gather(*[
+            client.get('127.0.0.1:%d' % port, path, Timing(loop))
+            for path in requests])
+    finally:
+        await close_quic(client)
+        server.close()
+
+def test_h3_bytes_and_stream_on_loopback():
+    pytest.importorskip('aioquic')
+    b, s = asyncio.run(h3_loopback(['/bytes/2000001', '/stream/1']))
+    assert (b.status, b.nbytes) == (200, 2000001)
+    assert s.status == 200 and s.nbytes >= CHUNK
+    assert 0.95 <= s.end - s.sent < 2.5
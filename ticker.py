@@ -0,0 +1,120 @@
+'''
+Drift-free periodic scheduler for the telemetry monitors.
+
+Deadlines are absolute on the monotonic clock (start + k * interval), so
+the work done in a tick does not stretch the period. Late wake-ups are
+recorded as jitter, and whole periods that were overrun are counted as
+missed ticks and skipped instead of being run back to back.
+
+periodic() is the same loop as a coroutine, for the monitors that run
+on an asyncio event loop.
+'''
+
+from time import perf_counter, sleep
+import asyncio
+import math
+
+# Below this interval the ticker busy-waits the tail of every period,
+# since plain sleep() overshoots by tens of microseconds.
+SUBMS_INTERVAL = 0.001
+SPIN_SEC = 0.0002
+
+# Jitter histogram buckets are powers of two in microseconds.
+NBUCKETS = 32
+
+
+class Ticker(object):
+    """Calls to wait() return on start + k * interval_sec, k = 1, 2, ..."""
+
+    def __init__(self, interval_sec, spin_sec=None, clock=perf_counter):
+        self.interval = float(interval_sec)
+        if spin_sec is None:
+            spin_sec = SPIN_SEC if self.interval < SUBMS_INTERVAL else 0.0
+        self.spin = min(spin_sec, self.interval)
+        self.clock = clock
+        self.start = clock()
+        self.deadline = self.start
+        self.ticks = 0
+        self.missed = 0
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.hist = [0] * NBUCKETS
+
+    def advance(self):
+        """Moves to the next deadline, skipping (and counting) overrun
+        periods; returns the deadline. For callers that do their own
+        waiting, e.g. on an asyncio loop, followed by record()."""
+        self.deadline += self.interval
+        now = self.clock()
+        if now - self.deadline >= self.interval:
+            skipped = int((now - self.deadline) / self.interval)
+            self.missed += skipped
+            self.deadline += skipped * self.interval
+        return self.deadline
+
+    def wait(self):
+        """Sleeps until the next deadline; returns the monotonic tick time."""
+        deadline = self.advance()
+        remaining = deadline - self.clock() - self.spin
+        if remaining > 0:
+            sleep(remaining)
+        now = self.clock()
+        while now < deadline:
+            now = self.clock()
+        self.record(now - deadline)
+        return now
+
+    def record(self, jitter):
+        """Accounts one tick that fired jitter sec after its deadline."""
+        self.ticks += 1
+        self.jitter_sum += jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+        b = min(int(jitter * 1e6).bit_length(), NBUCKETS - 1)
+        self.hist[b] += 1
+
+    def jitter_pct(self, p):
+        """Upper bound (sec) of the p-th jitter percentile."""
+        want = math.ceil(p * self.ticks)
+        seen = 0
+        for b, n in enumerate(self.hist):
+            seen += n
+            if n and seen >= want:
+                return (1 << b) / 1e6
+        return 0.0
+
+    def report(self):
+        elapsed = self.clock() - self.start
+        ticks = max(self.ticks, 1)
+        return [
+            ('target_interval_sec', '%f' % self.interval),
+            ('elapsed_sec', '%f' % elapsed),
+            ('ticks', '%d' % self.ticks),
+            ('missed_ticks', '%d' % self.missed),
+            ('achieved_interval_sec', '%f' % (elapsed / ticks)),
+            ('achieved_rate_hz', '%f' % (self.ticks / elapsed if elapsed else 0)),
+            ('jitter_mean_us', '%.1f' % (self.jitter_sum / ticks * 1e6)),
+            ('jitter_p50_us_le', '%.0f' % (self.jitter_pct(0.50) * 1e6)),
+            ('jitter_p99_us_le', '%.0f' % (self.jitter_pct(0.99) * 1e6)),
+            ('jitter_max_us', '%.1f' % (self.jitter_max * 1e6)),
+        ]
+
+    def write_report(self, fname):
+        with open(fname, 'w') as f:
+            f.write(''.join('%s=%s\n' % kv for kv in self.report()))
+
+
+async def periodic(ticker, sample, clock, meter):
+    """Calls sample(clock()) on every deadline of ticker until cancelled.
+
+    ticker must count on the running loop's clock (Ticker(interval,
+    clock=loop.time)); clock gives the timestamp handed to sample, e.g.
+    wall-clock time. meter times every call.
+    """
+    while True:
+        deadline = ticker.advance()
+        await asyncio.sleep(deadline - ticker.clock())
+        ticker.record(max(ticker.clock() - deadline, 0.0))
+        meter.begin()
+        sample(clock())
+        meter.end()
@@ -0,0 +1,304 @@
+'''
+Bufferbloat topology shared by the experiment engine (bufferbloat.py).
+
+BBTopo is h1 -- s0 -- h2 with the bottleneck on s0's port towards h2.
+DumbbellTopo (N pairs across one bottleneck), ParkingLotTopo (a chain of
+bottlenecks with cross traffic per hop) and StarTopo (per-host links)
+generalise it; each keeps h1 -> h2 as the main pair and lists its
+bottleneck ports and sender -> receiver pairs in topo.names.
+Passing an instance number prefixes every name that lives in the root
+namespace or in a cgroup (hosts, switch, interfaces), and cores pins the
+instance's hosts to a cpuset, so several topologies can run side by side.
+reconfigure() changes the links of a running topology, so one network can
+serve a whole sweep, and set_aqm() puts an AQM (fq_codel, codel, pie,
+cake) on the bottleneck ports in place of TCLink's drop-tail netem.
+
+Either Mininet or nsnet.NsNet (namespaces and veths, no OVS) can build
+it; see bufferbloat.py --backend.
+'''
+
+from collections import namedtuple
+
+try:
+    from mininet.topo import Topo
+except ImportError:
+    # nsnet backend only
+    from nsnet import Topo
+
+
+class Names(object):
+    """Node and interface names of one topology instance.
+
+    h1 -> h2 is the main pair (the one the experiment phases use), s0 the
+    switch it starts at and bottleneck the port whose queue is measured.
+    The topologies below also fill in every bottleneck port, every switch
+    and every sender -> receiver pair.
+    """
+
+    def __init__(self, instance=None):
+        p = '' if instance is None else 'i%d' % instance
+        self.prefix = p
+        self.h1 = p + 'h1'
+        self.h2 = p + 'h2'
+        self.s0 = p + 's0'
+        self.bottleneck = self.s0 + '-eth2'
+        self.bottlenecks = [self.bottleneck]
+        self.switches = [self.s0]
+        self.pairs = [(self.h1, self.h2)]
+
+    def host(self, i):
+        return '%sh%d' % (self.prefix, i)
+
+    def switch(self, i):
+        return '%ss%d' % (self.prefix, i)
+
+
+class NetTopo(Topo):
+    """Base of the topologies: hosts h1, h2, ... and switches s0, s1, ...
+    of one instance, links with TCLink's bw/delay/max_queue_size. Ports
+    are numbered here (as Mininet would), so link() can return the two
+    interface names; subclasses record the bottlenecks in self.names."""
+
+    def setup(self, instance=None, cores=None):
+        self.names = Names(instance)
+        self.names.switches = []
+        self.names.bottlenecks = []
+        self.names.pairs = []
+        self.instance = instance
+        self.hopts = {} if cores is None else {'cores': cores}
+        self.nports = {}
+
+    def host(self, i):
+        return self.addHost(self.names.host(i), **self.hopts)
+
+    def switch(self, i):
+        # A prefixed name would otherwise leak the instance number into
+        # the default dpid
+        sopts = {}
+        if self.instance is not None:
+            sopts['dpid'] = '%016x' % ((i << 32) | (self.instance + 1))
+        name = self.addSwitch(self.names.switch(i), **sopts)
+        self.names.switches.append(name)
+        return name
+
+    def port(self, node):
+        base = 1 if self.isSwitch(node) else 0
+        port = self.nports.get(node, base)
+        self.nports[node] = port + 1
+        return port
+
+    def link(self, a, b, bw, delay, maxq):
+        """Adds a shaped link; returns the interface names on a and b."""
+        pa, pb = self.port(a), self.port(b)
+        self.addLink(a, b, port1=pa, port2=pb, bw=bw, delay=f"{delay}ms",
+                     max_queue_size=maxq)
+        return '%s-eth%d' % (a, pa), '%s-eth%d' % (b, pb)
+
+
+class BBTopo(NetTopo):
+    "Simple topology for bufferbloat experiment (2 hosts + 1 switch)."
+
+    def build(self, bw_host=1000, bw_net=1.5, delay=5, maxq=100,
+              instance=None, cores=None):
+        self.setup(instance, cores)
+        # Hosts
+        h1 = self.host(1)
+        h2 = self.host(2)
+        # Switch
+        switch = self.switch(0)
+        # Links
+        self.link(h1, switch, bw_host, delay, maxq)
+        _, port = self.link(h2, switch, bw_net, delay, maxq)
+        self.names.bottlenecks = [port]
+        self.names.pairs = [(h1, h2)]
+
+
+class DumbbellTopo(NetTopo):
+    """pairs senders on s0 and pairs receivers on s1, s0 -- s1 the
+    bottleneck; pair k is h(2k-1) -> h(2k). RTT 6 x delay."""
+
+    def build(self, pairs=2, bw_host=1000, bw_net=1.5, delay=5, maxq=100,
+              instance=None, cores=None):
+        self.setup(instance, cores)
+        left, right = self.switch(0), self.switch(1)
+        port, _ = self.link(left, right, bw_net, delay, maxq)
+        self.names.bottlenecks = [port]
+        for k in range(1, pairs + 1):
+            src, dst = self.host(2 * k - 1), self.host(2 * k)
+            self.link(src, left, bw_host, delay, maxq)
+            self.link(dst, right, bw_host, delay, maxq)
+            self.names.pairs.append((src, dst))
+        self.names.bottleneck = port
+
+
+class ParkingLotTopo(NetTopo):
+    """Switches s0 -- s1 -- ... -- s<hops>, every inter-switch link a
+    bottleneck. h1 -> h2 crosses all of them (s0 to s<hops>); each hop
+    also carries `cross` pairs of its own (s(i-1) to s(i))."""
+
+    def build(self, hops=2, cross=1, bw_host=1000, bw_net=1.5, delay=5,
+              maxq=100, instance=None, cores=None):
+        self.setup(instance, cores)
+        switches = [self.switch(i) for i in range(hops + 1)]
+        for a, b in zip(switches, switches[1:]):
+            port, _ = self.link(a, b, bw_net, delay, maxq)
+            self.names.bottlenecks.append(port)
+        h1, h2 = self.host(1), self.host(2)
+        self.link(h1, switches[0], bw_host, delay, maxq)
+        self.link(h2, switches[-1], bw_host, delay, maxq)
+        self.names.pairs.append((h1, h2))
+        n = 3
+        for i in range(1, hops + 1):
+            for _ in range(cross):
+                src, dst = self.host(n), self.host(n + 1)
+                n += 2
+                self.link(src, switches[i - 1], bw_host, delay, maxq)
+                self.link(dst, switches[i], bw_host, delay, maxq)
+                self.names.pairs.append((src, dst))
+        self.names.bottleneck = self.names.bottlenecks[0]
+
+
+class StarTopo(NetTopo):
+    """Hosts h1..hN on s0, host i's link given by links[i-1] as
+    (bw, delay, maxq). Every other host sends to h2, so s0's port towards
+    h2 is the bottleneck."""
+
+    def build(self, links=((1000, 5, 100), (1.5, 5, 100)), instance=None,
+              cores=None):
+        self.setup(instance, cores)
+        switch = self.switch(0)
+        ports = []
+        for i, (bw, delay, maxq) in enumerate(links, 1):
+            _, port = self.link(self.host(i), switch, bw, delay, maxq)
+            ports.append(port)
+        self.names.bottleneck = ports[1]
+        self.names.bottlenecks = [ports[1]]
+        h2 = self.names.h2
+        self.names.pairs = [(self.names.host(i), h2)
+                            for i in range(1, len(links) + 1) if i != 2]
+
+
+# -----------------------------------------------------------------------------
+# Live changes: AQM on the bottleneck, new bandwidth/delay/queue between runs
+# -----------------------------------------------------------------------------
+AQMS = ('fq_codel', 'codel', 'pie', 'cake')
+
+# target/interval in ms (None: the qdisc's default). cake derives its
+# target from rtt (= interval) and always marks ECN.
+Aqm = namedtuple('Aqm', 'kind target interval ecn')
+
+
+def aqm_args(aqm, maxq):
+    """tc arguments of aqm with a limit of maxq packets (cake: no packet
+    limit, one tin)."""
+    ms = lambda v: '%gms' % v
+    args = [aqm.kind]
+    if aqm.kind == 'cake':
+        args += ['besteffort']
+        if aqm.interval is not None:
+            args += ['rtt', ms(aqm.interval)]
+        return ' '.join(args)
+    args += ['limit', str(maxq)]
+    if aqm.target is not None:
+        args += ['target', ms(aqm.target)]
+    if aqm.interval is not None:
+        # PIE's control interval is called tupdate
+        args += ['tupdate' if aqm.kind == 'pie' else 'interval',
+                 ms(aqm.interval)]
+    args.append('ecn' if aqm.ecn else 'noecn')
+    return ' '.join(args)
+
+
+def link_params(intf):
+    """(bw, delay in ms, maxq) a link end was built or last reconfigured
+    with."""
+    p = intf.params
+    delay = str(p.get('delay') or '0ms')
+    return p.get('bw'), float(delay[:-2] if delay.endswith('ms') else delay), \
+        p.get('max_queue_size')
+
+
+def leaf_qdiscs(net, names, aqm=None, bottleneck=None):
+    """[(intf, (bw, delay, maxq), qdisc args)] for every link end: what
+    goes under htb 5:1 as 10:. Every link keeps its own bw/delay/maxq
+    (link_params); bottleneck, a (bw, delay, maxq), replaces them on the
+    links with a bottleneck port.
+
+    Without an AQM that is TCLink's netem. With one, a bottleneck port
+    gets the AQM instead, and its link's delay moves to the other end
+    (netem delay 2 x that delay there): the RTT is unchanged, and the
+    AQM's sojourn times are pure queueing.
+    """
+    netem = 'netem delay %gms limit %d'
+    ret = []
+    for link in net.links:
+        ends = (link.intf1, link.intf2)
+        on_bottleneck = any(i.name in names.bottlenecks for i in ends)
+        for intf in ends:
+            bw, delay, maxq = link_params(intf)
+            if on_bottleneck and bottleneck:
+                bw, delay, maxq = bottleneck
+            if aqm and intf.name in names.bottlenecks:
+                leaf = aqm_args(aqm, maxq)
+            elif aqm and on_bottleneck:
+                leaf = netem % (2 * delay, maxq)
+            else:
+                leaf = netem % (delay, maxq)
+            ret.append((intf, (bw, delay, maxq), leaf))
+    return ret
+
+
+def peer_intf(net, iface):
+    """The interface at the other end of iface's link."""
+    for link in net.links:
+        if link.intf1.name == iface:
+            return link.intf2
+        if link.intf2.name == iface:
+            return link.intf1
+    return None
+
+
+def tc(intf, cmd):
+    # tc may warn (htb quantum) on success: go by exit status
+    out = intf.cmd(cmd + ' && echo ok').strip()
+    if not out.endswith('ok'):
+        raise RuntimeError('%s: %s' % (cmd, out))
+
+
+def set_aqm(net, names, aqm):
+    """Swaps the netem of every bottleneck port for aqm (an Aqm) and moves
+    its link's delay (see leaf_qdiscs)."""
+    peers = set(peer_intf(net, port).name for port in names.bottlenecks)
+    for intf, _, leaf in leaf_qdiscs(net, names, aqm):
+        if intf.name in names.bottlenecks:
+            tc(intf, 'tc qdisc del dev %s parent 5:1 handle 10:' % intf)
+            tc(intf, 'tc qdisc add dev %s parent 5:1 handle 10: %s' %
+               (intf, leaf))
+        elif intf.name in peers:
+            tc(intf, 'tc qdisc change dev %s parent 5:1 handle 10: %s' %
+               (intf, leaf))
+
+
+def reconfigure(net, names, bw_net, delay, maxq, aqm=None):
+    """Changes bandwidth, delay and queue size of the bottleneck links of
+    a running topology in place; the other links keep theirs.
+
+    TCLink puts an htb class (5:1, the rate) above a netem qdisc (10:, the
+    delay and the packet limit) on both ends of every link; `tc change`
+    rewrites them without tearing the link down, so several runs can share
+    one network. With aqm (already installed by set_aqm) the bottleneck's
+    AQM gets the new limit instead. Packets already queued stay queued:
+    wait for them to drain (readiness.wait_drained) before the next run
+    measures anything.
+    """
+    ends = set(names.bottlenecks)
+    ends.update(peer_intf(net, port).name for port in names.bottlenecks)
+    for intf, (bw, d, q), leaf in leaf_qdiscs(net, names, aqm,
+                                              (bw_net, delay, maxq)):
+        if intf.name not in ends:
+            continue
+        tc(intf, 'tc class change dev %s parent 5:0 classid 5:1 '
+                 'htb rate %fMbit burst 15k' % (intf, bw))
+        tc(intf, 'tc qdisc change dev %s parent 5:1 handle 10: %s' %
+           (intf, leaf))
+        intf.params.update(bw=bw, delay='%gms' % d, max_queue_size=q)
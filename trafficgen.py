@@ -0,0 +1,283 @@
+'''
+Bulk traffic generator (in place of iperf).
+
+Long-lived TCP and QUIC flows between any Mininet hosts, all driven
+by one asyncio process: for every flow the receiving socket is opened in
+the receiver's namespace and the sending socket in the sender's (see
+netns.in_netns), so nothing has to be started on the hosts. Each TCP flow
+can use its own congestion control (TCP_CONGESTION); QUIC flows use
+aioquic's congestion controller.
+
+Flows send for `duration` seconds (the experiment's --time) or until
+SIGTERM. Every `interval` seconds the goodput of each flow, counted at
+the receiver, is written as
+
+    time,flow,proto,cong,bytes,goodput_mbps
+
+plus an "all" row with the aggregate; on exit the per-flow averages go
+to <fname>.summary.
+'''
+
+from functools import partial
+from time import time
+import asyncio
+import os
+import socket
+import ssl
+
+from netns import in_netns
+from samplewriter import SampleWriter, handle_sigterm
+from ticker import Ticker, periodic
+from overhead import OverheadMeter, overhead_path
+from quicpace import PacedProtocol
+
+try:
+    from aioquic.asyncio.protocol import QuicConnectionProtocol
+    from aioquic.asyncio.server import QuicServer
+    from aioquic.quic.configuration import QuicConfiguration
+    from aioquic.quic.connection import QuicConnection
+    from aioquic.quic.events import StreamDataReceived
+    HAVE_AIOQUIC = True
+except ImportError:
+    QuicConnectionProtocol = object
+    HAVE_AIOQUIC = False
+
+TCP_PORT = 5201
+QUIC_PORT = 5301
+# generate_pairs: its own range, the pairs may share a receiver with generate
+PAIRS_PORT = 5401
+QUIC_ALPN = 'bulk'
+CERT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cert.pem')
+KEY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'key.pem')
+
+# One buffer, sent over and over by every sender.
+BUF = memoryview(bytearray(256 * 1024))
+
+flow_header = 'time,flow,proto,cong,bytes,goodput_mbps\n'
+flow_fmt = '%f,%s,%s,%s,%d,%.3f\n'
+
+
+class Flow(object):
+    """Receiver-side byte count of one flow."""
+
+    def __init__(self, name, proto, cong):
+        self.name = name
+        self.proto = proto
+        self.cong = cong
+        self.bytes = 0
+        self.last = 0
+
+
+class QuicSink(QuicConnectionProtocol):
+    """Server side of a QUIC flow: counts the stream bytes it receives and
+    hands them back to the sender's window."""
+
+    def __init__(self, flow, sender, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flow = flow
+        self.sender = sender
+
+    def quic_event_received(self, event):
+        if isinstance(event, StreamDataReceived):
+            self.flow.bytes += len(event.data)
+            self.sender.drained(len(event.data))
+
+
+class QuicSource(PacedProtocol):
+    """Client side of a QUIC flow, paced by what its sink received."""
+
+    wire = False
+
+
+class TrafficGen(object):
+    """Add flows with add_tcp()/add_quic(), then run(duration)."""
+
+    def __init__(self, fname, interval=1.0, tcp_port=TCP_PORT,
+                 quic_port=QUIC_PORT):
+        self.fname = fname
+        self.interval = interval
+        # Default ports: base + flow index
+        self.tcp_port = tcp_port
+        self.quic_port = quic_port
+        self.out = SampleWriter(fname, flow_fmt, header=flow_header)
+        self.flows = []
+        self.starters = []
+        self.closers = []
+        # QUIC endpoints: closed while the event loop still runs
+        self.loop_closers = []
+        self.ticker = None
+        self.elapsed = 0.0
+        self.meter = OverheadMeter('trafficgen', overhead_path(fname))
+
+    def add_tcp(self, src, dst, dst_ip, cong=None, port=None):
+        """TCP flow src -> dst_ip (dst's address); src and dst are
+        namespaces as accepted by in_netns (pid, Mininet node, path)."""
+        port = port or self.tcp_port + len(self.flows)
+        flow = Flow('tcp%d' % len(self.flows), 'tcp', cong or '-')
+        with in_netns(dst):
+            lsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        lsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        lsock.bind(('0.0.0.0', port))
+        lsock.listen(1)
+        lsock.setblocking(False)
+        with in_netns(src):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if cong:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CONGESTION,
+                            cong.encode())
+        sock.setblocking(False)
+        self.closers += [lsock.close, sock.close]
+        self.flows.append(flow)
+        self.starters.append(partial(self.tcp_flow, flow, lsock, sock,
+                                     (dst_ip, port)))
+        return flow
+
+    def add_quic(self, src, dst, dst_ip, port=None):
+        """QUIC flow src -> dst_ip, one stream on one connection."""
+        if not HAVE_AIOQUIC:
+            raise RuntimeError('aioquic is not installed')
+        port = port or self.quic_port + len(self.flows)
+        flow = Flow('quic%d' % len(self.flows), 'quic', 'quic')
+        with in_netns(dst):
+            ssock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        ssock.bind(('0.0.0.0', port))
+        with in_netns(src):
+            csock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.flows.append(flow)
+        self.starters.append(partial(self.quic_flow, flow, ssock, csock,
+                                     (dst_ip, port)))
+        return flow
+
+    async def tcp_flow(self, flow, lsock, sock, addr):
+        loop = self.loop
+        accept = asyncio.ensure_future(loop.sock_accept(lsock))
+        await loop.sock_connect(sock, addr)
+        conn, _ = await accept
+        conn.setblocking(False)
+        self.closers.append(conn.close)
+
+        async def send():
+            while True:
+                await loop.sock_sendall(sock, BUF)
+
+        async def sink():
+            buf = bytearray(len(BUF))
+            while True:
+                n = await loop.sock_recv_into(conn, buf)
+                if not n:
+                    return
+                flow.bytes += n
+
+        await asyncio.gather(send(), sink())
+
+    async def quic_flow(self, flow, ssock, csock, addr):
+        loop = self.loop
+        sconf = QuicConfiguration(is_client=False, alpn_protocols=[QUIC_ALPN])
+        sconf.load_cert_chain(CERT, KEY)
+        cconf = QuicConfiguration(is_client=True, alpn_protocols=[QUIC_ALPN],
+                                  verify_mode=ssl.CERT_NONE)
+        transport, client = await loop.create_datagram_endpoint(
+            lambda: QuicSource(QuicConnection(configuration=cconf)),
+            sock=csock)
+        self.loop_closers += [client.close, transport.close]
+        server_transport, server = await loop.create_datagram_endpoint(
+            lambda: QuicServer(configuration=sconf,
+                               create_protocol=partial(QuicSink, flow,
+                                                       client)),
+            sock=ssock)
+        self.loop_closers.append(server.close)
+        client.connect(addr)
+        await client.wait_connected()
+        sid = client.new_stream()
+        while True:
+            await client.send(sid, BUF)
+
+    def report(self, t):
+        total = 0
+        for f in self.flows:
+            n = f.bytes - f.last
+            f.last = f.bytes
+            total += n
+            self.out.append(t, f.name, f.proto, f.cong, f.bytes,
+                            n * 8 / self.interval / 1e6)
+        self.out.append(t, 'all', '-', '-', sum(f.bytes for f in self.flows),
+                        total * 8 / self.interval / 1e6)
+
+    async def _periodic(self):
+        loop = self.loop
+        self.ticker = Ticker(self.interval, clock=loop.time)
+        await periodic(self.ticker, self.report,
+                       lambda: self.wall0 + (loop.time() - self.mono0),
+                       self.meter)
+
+    async def _run(self, duration):
+        self.loop = asyncio.get_running_loop()
+        self.mono0, self.wall0 = self.loop.time(), time()
+        tasks = [asyncio.ensure_future(start()) for start in self.starters]
+        tasks.append(asyncio.ensure_future(self._periodic()))
+        try:
+            if duration is None:
+                await asyncio.gather(*tasks)
+            else:
+                done, _ = await asyncio.wait(tasks, timeout=duration,
+                                             return_when=asyncio.FIRST_EXCEPTION)
+                for t in done:
+                    t.result()
+        finally:
+            self.elapsed = self.loop.time() - self.mono0
+            for task in tasks:
+                task.cancel()
+            for close in self.loop_closers:
+                close()
+
+    def run(self, duration=None):
+        try:
+            asyncio.run(self._run(duration))
+        finally:
+            self.close()
+
+    def close(self):
+        self.out.close()
+        for close in self.closers:
+            close()
+        self.closers = []
+        self.meter.close()
+        with open(self.fname + '.summary', 'w') as f:
+            f.write('flow,proto,cong,bytes,goodput_mbps\n')
+            secs = self.elapsed or 1.0
+            for fl in self.flows:
+                f.write('%s,%s,%s,%d,%.3f\n' % (fl.name, fl.proto, fl.cong,
+                                              fl.bytes,
+                                              fl.bytes * 8 / secs / 1e6))
+            total = sum(fl.bytes for fl in self.flows)
+            f.write('all,-,-,%d,%.3f\n' % (total, total * 8 / secs / 1e6))
+        if self.ticker:
+            self.ticker.write_report(self.fname + '.sched')
+
+
+def generate(fname, src, dst, dst_ip, duration=None, tcp_flows=1, congs=None,
+             quic_flows=0, interval=1.0):
+    """Process target: tcp_flows TCP flows (congestion control from congs,
+    cycled; None keeps the namespace default) and quic_flows QUIC flows
+    from src to dst."""
+    handle_sigterm()
+    gen = TrafficGen(fname, interval)
+    congs = congs or [None]
+    for k in range(tcp_flows):
+        gen.add_tcp(src, dst, dst_ip, cong=congs[k % len(congs)])
+    for k in range(quic_flows):
+        gen.add_quic(src, dst, dst_ip)
+    gen.run(duration)
+
+def generate_pairs(fname, pairs, duration=None, congs=None, interval=1.0,
+                   tcp_port=PAIRS_PORT):
+    """Process target: one TCP flow per (src, dst, dst_ip) of pairs
+    (congestion control from congs, cycled), e.g. the competing pairs of
+    a dumbbell or parking lot. Ports start at tcp_port, away from the
+    ones of generate(): in a star every pair ends at h2 too."""
+    handle_sigterm()
+    gen = TrafficGen(fname, interval, tcp_port=tcp_port)
+    congs = congs or [None]
+    for k, (src, dst, dst_ip) in enumerate(pairs):
+        gen.add_tcp(src, dst, dst_ip, cong=congs[k % len(congs)])
+    gen.run(duration)
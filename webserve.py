@@ -0,0 +1,265 @@
+'''
+HTTP/1.1 and HTTP/3 server for the experiments.
+
+Serves a directory (the page site built by pagetree.py) and two
+synthetic endpoints:
+
+    /bytes/<N>        a body of exactly N bytes
+    /stream/<secs>    a body sent as fast as the connection takes it, for
+                      secs seconds (a long-lived bulk flow)
+
+Synthetic bodies are sent as one chunk built at start-up, over and over
+(only a final partial chunk is sliced), so they cost no disk I/O and no
+allocation per chunk; static files are read once and then served from
+memory.
+
+    python3 webserve.py --port 8080 --directory site
+    python3 webserve.py --quic --port 4433 --certificate cert.pem \\
+        --private-key key.pem --directory site --quic-log quic_server.log
+
+With --quic, --quic-log is a directory that gets one qlog file per
+connection (see qlog_stats.py); on SIGTERM the connections still open
+get theirs too.
+'''
+
+from argparse import ArgumentParser
+from urllib.parse import urlsplit, unquote
+import asyncio
+import os
+import re
+import signal
+
+from quicpace import PacedProtocol
+
+try:
+    from aioquic.asyncio import serve
+    from aioquic.h3.connection import H3_ALPN, H3Connection
+    from aioquic.h3.events import HeadersReceived
+    from aioquic.quic.configuration import QuicConfiguration
+    from aioquic.quic.events import ConnectionTerminated
+    from aioquic.quic.logger import QuicFileLogger
+    HAVE_AIOQUIC = True
+except ImportError:
+    QuicFileLogger = object
+    HAVE_AIOQUIC = False
+
+CHUNK = 64 * 1024
+# Every synthetic body is made of this chunk (every byte value, repeated);
+# bytes, not a memoryview, because aioquic only takes bytes.
+BUF = bytes(range(256)) * (CHUNK // 256)
+
+pat_bytes = re.compile(r'^/bytes/(\d+)$')
+pat_stream = re.compile(r'^/stream/(\d+(?:\.\d+)?)$')
+
+CONTENT_TYPES = {'.html': 'text/html', '.htm': 'text/html',
+                 '.css': 'text/css', '.js': 'application/javascript',
+                 '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg',
+                 '.png': 'image/png', '.gif': 'image/gif',
+                 '.svg': 'image/svg+xml', '.mp4': 'video/mp4'}
+
+
+def synthetic(n):
+    """BUF repeated (and the last one cut) to add up to n bytes."""
+    while n >= CHUNK:
+        yield BUF
+        n -= CHUNK
+    if n:
+        yield BUF[:n]
+
+
+class Site(object):
+    """Routes a request path to a body: (status, content type, length,
+    chunks); length is None for /stream, which ends by time."""
+
+    def __init__(self, root):
+        self.root = root and os.path.abspath(root)
+        self.cache = {}
+
+    def route(self, target, loop):
+        path = unquote(urlsplit(target).path)
+        m = pat_bytes.match(path)
+        if m:
+            n = int(m.group(1))
+            return 200, 'application/octet-stream', n, synthetic(n)
+        m = pat_stream.match(path)
+        if m:
+            end = loop.time() + float(m.group(1))
+            def timed():
+                while loop.time() < end:
+                    yield BUF
+            return 200, 'application/octet-stream', None, timed()
+        f = self.file(path)
+        if f is None:
+            return 404, 'text/plain', 9, iter([b'not found'])
+        ctype, data = f
+        return 200, ctype, len(data), iter([data])
+
+    def file(self, path):
+        """(content type, data) of the file served for path, or None;
+        directories serve their index.html."""
+        if path in self.cache:
+            return self.cache[path]
+        if not self.root:
+            return None
+        fname = os.path.normpath(os.path.join(self.root, path.lstrip('/')))
+        if os.path.isdir(fname):
+            fname = os.path.join(fname, 'index.html')
+        if (not fname.startswith(self.root + os.sep) or
+                not os.path.isfile(fname)):
+            return None
+        with open(fname, 'rb') as f:
+            data = f.read()
+        ctype = CONTENT_TYPES.get(os.path.splitext(fname)[1].lower(),
+                                  'application/octet-stream')
+        self.cache[path] = ctype, data
+        return self.cache[path]
+
+
+# -----------------------------------------------------------------------------
+# HTTP/1.1
+# -----------------------------------------------------------------------------
+async def http_connection(site, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            lines = head.decode('latin-1').split('\r\n')
+            method, target, version = lines[0].split()
+            headers = {}
+            for line in lines[1:]:
+                k, _, v = line.partition(':')
+                headers[k.strip().lower()] = v.strip().lower()
+            status, ctype, length, chunks = site.route(target, loop)
+            keep = (version == 'HTTP/1.1' and length is not None and
+                    headers.get('connection') != 'close')
+            out = ['HTTP/1.1 %d %s' % (status, 'OK' if status == 200
+                                      else 'Not Found'),
+                   'Content-Type: ' + ctype,
+                   'Connection: ' + ('keep-alive' if keep else 'close')]
+            if length is not None:
+                out.append('Content-Length: %d' % length)
+            writer.write(('\r\n'.join(out) + '\r\n\r\n').encode())
+            if method != 'HEAD':
+                for chunk in chunks:
+                    writer.write(chunk)
+                    await writer.drain()
+            await writer.drain()
+            if not keep:
+                return
+    except ConnectionError:
+        return
+    finally:
+        writer.close()
+
+
+# -----------------------------------------------------------------------------
+# HTTP/3
+# -----------------------------------------------------------------------------
+class H3Server(PacedProtocol):
+    """Answers every request stream with Site.route(); bodies are paced
+    by the bytes put on the wire (see quicpace.py)."""
+
+    site = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.h3 = H3Connection(self._quic)
+        self.tasks = set()
+
+    def write(self, sid, data, end_stream=False):
+        self.h3.send_data(sid, data, end_stream=end_stream)
+
+    def quic_event_received(self, event):
+        if isinstance(event, ConnectionTerminated):
+            for t in self.tasks:
+                t.cancel()
+            return
+        for ev in self.h3.handle_event(event):
+            if isinstance(ev, HeadersReceived):
+                t = asyncio.ensure_future(self.respond(ev.stream_id,
+                                                       dict(ev.headers)))
+                self.tasks.add(t)
+                t.add_done_callback(self.tasks.discard)
+
+    async def respond(self, sid, headers):
+        target = headers.get(b':path', b'/').decode()
+        status, ctype, length, chunks = self.site.route(target, self._loop)
+        out = [(b':status', str(status).encode()),
+               (b'content-type', ctype.encode())]
+        if length is not None:
+            out.append((b'content-length', str(length).encode()))
+        self.h3.send_headers(sid, out)
+        if headers.get(b':method') != b'HEAD':
+            for chunk in chunks:
+                await self.send(sid, chunk)
+        self.h3.send_data(sid, b'', end_stream=True)
+        self.transmit()
+
+
+class TraceLogger(QuicFileLogger):
+    """QuicFileLogger that keeps its own list of the traces still open."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.open_traces = []
+
+    def start_trace(self, is_client, odcid):
+        trace = super().start_trace(is_client, odcid)
+        self.open_traces.append(trace)
+        return trace
+
+    def end_trace(self, trace):
+        if trace in self.open_traces:
+            self.open_traces.remove(trace)
+        super().end_trace(trace)
+
+
+def end_traces(logger):
+    """Writes the qlog of every connection still open, then exits.
+
+    aioquic writes a trace when its connection ends, so a long flow cut
+    short by the experiment would otherwise leave no log at all.
+    """
+    for trace in list(logger.open_traces):
+        logger.end_trace(trace)
+    raise SystemExit(0)
+
+
+async def main(args):
+    site = Site(args.directory)
+    if not args.quic:
+        await asyncio.start_server(
+            lambda r, w: http_connection(site, r, w), args.host, args.port)
+    else:
+        if not HAVE_AIOQUIC:
+            raise SystemExit('aioquic is not installed')
+        config = QuicConfiguration(is_client=False, alpn_protocols=H3_ALPN)
+        config.load_cert_chain(args.certificate, args.private_key)
+        if args.quic_log:
+            os.makedirs(args.quic_log, exist_ok=True)
+            config.quic_logger = TraceLogger(args.quic_log)
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGTERM, end_traces, config.quic_logger)
+        H3Server.site = site
+        await serve(args.host, args.port, configuration=config,
+                    create_protocol=H3Server)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description="HTTP/1.1 or HTTP/3 server with "
+                                        "synthetic /bytes and /stream")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--directory', '-d', default=None,
+                        help="Directory to serve (default: synthetic only)")
+    parser.add_argument('--quic', action='store_true', default=False,
+                        help="Serve HTTP/3 over QUIC instead of HTTP/1.1")
+    parser.add_argument('--certificate', default='cert.pem')
+    parser.add_argument('--private-key', default='key.pem')
+    parser.add_argument('--quic-log', default=None,
+                        help="Directory for per-connection qlog files")
+    asyncio.run(main(parser.parse_args()))